@@ -1,14 +1,33 @@
+import hashlib
 import os
-import shutil
+from dataclasses import asdict
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+import requests
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, BackgroundTasks
+from starlette.requests import ClientDisconnect
 
 from app.schemas.jobs import JobResponse, JobStatusResponse, JobStatus, JobsListResponse, JobSummary
-from app.services.job_store import enqueue_job, get_job, update_job, append_event, Job, list_jobs
-from app.services.job_notifier import notify_orchestrator
-from app.core.config import UPLOAD_DIR
+from app.services import transcript_cache
+from app.services.job_store import (
+    Job,
+    append_event,
+    enqueue_job,
+    get_job,
+    list_jobs,
+    queue_position,
+    store_done_job,
+    tenant_of,
+)
+from app.services.job_worker import pipeline_params
+from app.services.keyword_extractor import extract_keywords_simple
+from app.services.stt_factory import get_stt_provider
+from app.services.stt_provider import TranscriptionOptions
+from app.services.job_notifier import notify_orchestrator_async
+from app.services.upload_stream import FileSink, UploadError, read_multipart_stream
+from app.services.audio_service import probe_duration
+from app.core.config import JOB_DEFAULT_PRIORITY, JOB_PRIORITIES, UPLOAD_DIR, UPLOAD_STREAMING
 
 router = APIRouter()
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -16,22 +35,91 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
-@router.post("/jobs", response_model=JobResponse)
 async def create_job(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     callback_url: str | None = Form(None),
     stt_provider: str = Form("whisper"),
     channel: str = Form("api"),
     user_id: str | None = Form(None),
+    batched: bool | None = Form(None),
+    batch_size: int | None = Form(None),
+    priority: str | None = Form(None),
 ):
     job_id = str(uuid4())
-    filename = file.filename or "video.mp4"
-    safe_filename = "".join(c for c in filename if c.isalnum() or c in "._-").strip()
-    file_path = os.path.join(UPLOAD_DIR, f"{job_id}_{safe_filename}")
+    file_path = _upload_path(job_id, file.filename)
 
+    # копируем с подсчётом sha256 (ключ кэша транскриптов)
+    hasher = hashlib.sha256()
     with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+        while True:
+            chunk = file.file.read(1024 * 1024)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            f.write(chunk)
+
+    return await _enqueue_uploaded(
+        job_id, file_path, callback_url, stt_provider, channel, user_id,
+        content_sha256=hasher.hexdigest(),
+        options=TranscriptionOptions(batched=batched, batch_size=batch_size),
+        background_tasks=background_tasks,
+        priority=priority,
+    )
+
 
+async def create_job_streaming(request: Request, background_tasks: BackgroundTasks):
+    """
+    Потоковый вариант /jobs (UPLOAD_STREAMING=1): файл пишется в UPLOAD_DIR
+    по мере загрузки, без промежуточного SpooledTemporaryFile и копирования.
+    """
+    job_id = str(uuid4())
+    sink = FileSink(lambda upload: _upload_path(job_id, upload.filename))
+    try:
+        upload = await read_multipart_stream(request, sink)
+    except UploadError as e:
+        raise HTTPException(400, str(e))
+    except ClientDisconnect:
+        raise HTTPException(499, "Клиент отключился")
+
+    return await _enqueue_uploaded(
+        job_id,
+        sink.path,
+        callback_url=upload.fields.get("callback_url"),
+        stt_provider=upload.fields.get("stt_provider") or "whisper",
+        channel=upload.fields.get("channel") or "api",
+        user_id=upload.fields.get("user_id"),
+        content_sha256=sink.sha256,
+        options=TranscriptionOptions.from_fields(upload.fields),
+        background_tasks=background_tasks,
+        priority=upload.fields.get("priority"),
+    )
+
+
+def _upload_path(job_id: str, filename: str | None) -> str:
+    filename = filename or "video.mp4"
+    safe_filename = "".join(c for c in filename if c.isalnum() or c in "._-").strip()
+    return os.path.join(UPLOAD_DIR, f"{job_id}_{safe_filename}")
+
+
+async def _enqueue_uploaded(
+    job_id: str,
+    file_path: str,
+    callback_url: str | None,
+    stt_provider: str,
+    channel: str,
+    user_id: str | None,
+    content_sha256: str | None = None,
+    options: TranscriptionOptions | None = None,
+    background_tasks: BackgroundTasks | None = None,
+    priority: str | None = None,
+) -> JobResponse:
+    options = options or TranscriptionOptions()
+    priority = priority or JOB_DEFAULT_PRIORITY
+    if priority not in JOB_PRIORITIES:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(400, f"Неизвестный priority: {priority} (доступны: {', '.join(JOB_PRIORITIES)})")
     job = Job(
         job_id=job_id,
         file_path=file_path,
@@ -45,11 +133,48 @@ async def create_job(
         result=None,
         error=None,
         events=[],
+        content_sha256=content_sha256,
+        options=asdict(options),
+        priority=priority,
+        tenant=tenant_of(channel, user_id),
     )
-    enqueue_job(job)
 
-    append_event(job_id, "queued", "START", message=f"channel={channel}, user_id={user_id or 'unknown'}")
-    notify_orchestrator(job_id, "QUEUED", "STARTED")
+    cached = await _lookup_cached(content_sha256, stt_provider, options)
+    if cached is not None:
+        # этот файл уже распознавали с той же конфигурацией — отдаём результат сразу, без очереди
+        job_result = {
+            "transcript": cached["transcript"],
+            "language": cached["language"],
+            "duration_sec": cached.get("duration_sec"),
+            "tier": cached.get("tier"),
+            "silence_removed_ratio": cached.get("silence_removed_ratio"),
+            "keywords": extract_keywords_simple(cached["transcript"], 10),
+            "cached": True,
+        }
+        await store_done_job(job, job_result, message=f"cache hit, channel={channel}, user_id={user_id or 'unknown'}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+        await notify_orchestrator_async(job_id, "DONE", "DONE", data=job_result)
+        if callback_url and background_tasks is not None:
+            background_tasks.add_task(_send_callback, callback_url, {
+                "job_id": job_id,
+                "status": "done",
+                "result": job_result,
+            })
+
+        return JobResponse(
+            job_id=UUID(job_id),
+            status=JobStatus.DONE,
+            created_at=job.created_at
+        )
+
+    # длительность — цена job в справедливой очереди и ключ для JOB_QUEUE_POLICY=sjf
+    job.duration_sec = await probe_duration(file_path)
+    await enqueue_job(job)
+
+    await append_event(job_id, "queued", "START", message=f"channel={channel}, user_id={user_id or 'unknown'}")
+    await notify_orchestrator_async(job_id, "QUEUED", "STARTED")
 
     return JobResponse(
         job_id=UUID(job_id),
@@ -57,9 +182,64 @@ async def create_job(
         created_at=utc_now_iso()
     )
 
+
+async def _lookup_cached(content_sha256: str | None, stt_provider: str, options: TranscriptionOptions) -> dict | None:
+    if not content_sha256:
+        return None
+    try:
+        provider = get_stt_provider(stt_provider)
+    except ValueError:
+        # неизвестный провайдер — ошибку отдаст воркер, как и раньше
+        return None
+    key = transcript_cache.make_key(content_sha256, provider, pipeline_params(), options)
+    return await transcript_cache.get_cached(key)
+
+
+def _send_callback(url: str, payload: dict) -> None:
+    try:
+        requests.post(url, json=payload, timeout=10)
+    except Exception:
+        pass
+
+
+_CREATE_JOB_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "callback_url": {"type": "string"},
+                        "stt_provider": {"type": "string", "default": "whisper"},
+                        "channel": {"type": "string", "default": "api"},
+                        "user_id": {"type": "string"},
+                        "batched": {"type": "boolean"},
+                        "batch_size": {"type": "integer"},
+                        "priority": {"type": "string", "default": JOB_DEFAULT_PRIORITY},
+                    },
+                }
+            }
+        },
+    }
+}
+
+if UPLOAD_STREAMING:
+    router.add_api_route(
+        "/jobs",
+        create_job_streaming,
+        methods=["POST"],
+        response_model=JobResponse,
+        openapi_extra=_CREATE_JOB_OPENAPI,
+    )
+else:
+    router.add_api_route("/jobs", create_job, methods=["POST"], response_model=JobResponse)
+
 @router.get("/jobs/{job_id}", response_model=JobStatusResponse)
 async def get_job_status(job_id: UUID):
-    j = get_job(str(job_id))
+    j = await get_job(str(job_id))
     if not j:
         raise HTTPException(404, "Job not found")
 
@@ -78,12 +258,17 @@ async def get_job_status(job_id: UUID):
         result=j.result,
         error=j.error,
         events=j.events or [],
+        priority=j.priority,
+        tenant=j.tenant,
+        expected_duration_sec=j.duration_sec,
+        attempts=j.attempts,
+        queue=await queue_position(j),
     )
 
 @router.get("/jobs", response_model=JobsListResponse)
 async def list_recent_jobs(limit: int = 20):
     limit = max(1, min(100, int(limit)))
-    jobs = list_jobs(limit=limit)
+    jobs = await list_jobs(limit=limit)
     items = [
         JobSummary(
             job_id=j.job_id,
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.core import config
+from app.services.live_transcription import FFmpegStreamDecoder, LiveSession, live_sessions
+from app.services.model_manager import model_manager
+from app.services.stt_factory import get_stt_provider
+from app.services.stt_provider import to_model_rate
+
+router = APIRouter()
+
+# raw PCM без контейнера и сжатый поток, который декодирует ffmpeg
+PCM_FORMATS = {"pcm_s16le": np.int16, "pcm_f32le": np.float32}
+FFMPEG_FORMATS = {"opus", "webm", "ogg"}
+
+
+@router.websocket("/transcribe/live")
+async def transcribe_live(
+    websocket: WebSocket,
+    stt_provider: str | None = None,
+    format: str = "pcm_s16le",
+    sample_rate: int = 16000,
+):
+    """
+    Живое распознавание.
+
+    Клиент шлёт бинарные сообщения с аудио: raw PCM mono (format=pcm_s16le | pcm_f32le,
+    частота — sample_rate) или Opus в ogg/webm (format=opus). Текстовое сообщение
+    {"type": "stop"} — конец потока.
+
+    Сервер отвечает JSON-сообщениями:
+    - {"type": "ready", "session_id", "provider"} — можно слать аудио;
+    - {"type": "partial", "start", "end", "text"} — гипотеза по незакрытой фразе;
+    - {"type": "final", "start", "end", "text"} — окончательный текст фразы;
+    - {"type": "done"} — поток дораспознан, соединение закрывается;
+    - {"type": "error", "detail"}.
+
+    Если на модели уже LIVE_MAX_SESSIONS_PER_MODEL сессий, соединение закрывается
+    с кодом 1013 (try again later).
+    """
+    await websocket.accept()
+
+    if format not in PCM_FORMATS and format not in FFMPEG_FORMATS:
+        await websocket.send_json({"type": "error", "detail": f"Неизвестный формат: {format}"})
+        await websocket.close(code=1003)
+        return
+
+    try:
+        provider = get_stt_provider(stt_provider)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    model = provider.get_name()
+    if not live_sessions.try_acquire(model):
+        await websocket.send_json({"type": "error", "detail": "Слишком много живых сессий, попробуйте позже."})
+        await websocket.close(code=1013)
+        return
+
+    session = LiveSession(provider, websocket.send_json)
+    decoder = FFmpegStreamDecoder(session.feed) if format in FFMPEG_FORMATS else None
+    # модель живой сессии не выгружается, пока сессия открыта
+    with model_manager.use(provider.manager_key):
+        try:
+            if decoder is not None:
+                await decoder.start()
+            await websocket.send_json({"type": "ready", "session_id": session.session_id, "provider": model})
+
+            dtype = PCM_FORMATS.get(format)
+            tail = b""
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                if message.get("bytes") is not None:
+                    if decoder is not None:
+                        await decoder.write(message["bytes"])
+                        continue
+                    # сообщение может оборваться посреди отсчёта — хвост ждёт следующего
+                    data = tail + message["bytes"]
+                    usable = len(data) - len(data) % np.dtype(dtype).itemsize
+                    tail = data[usable:]
+                    if usable:
+                        samples = np.frombuffer(data[:usable], dtype=dtype)
+                        await session.feed(to_model_rate(samples, sample_rate))
+                elif message.get("text") is not None:
+                    try:
+                        command = json.loads(message["text"])
+                    except ValueError:
+                        command = {"type": message["text"]}
+                    if command.get("type") == "stop":
+                        break
+
+            if decoder is not None:
+                await decoder.close()
+            await session.finish()
+            await websocket.send_json({"type": "done"})
+            await websocket.close()
+
+        except WebSocketDisconnect:
+            await session.cancel()
+        except asyncio.CancelledError:
+            await session.cancel()
+            raise
+        except Exception as e:
+            await session.cancel()
+            try:
+                await websocket.send_json({"type": "error", "detail": f"Произошла ошибка: {e}"})
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+        finally:
+            if decoder is not None:
+                await decoder.abort()
+            live_sessions.release(model)
+
+
+@router.get("/transcribe/live/stats")
+async def live_stats():
+    """Сколько живых сессий открыто на каждой модели."""
+    return live_sessions.stats()
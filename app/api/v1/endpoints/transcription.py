@@ -1,9 +1,19 @@
 import asyncio
+import json
 from fastapi import Request, APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
 from app.api.v1.schemas import TranscriptionResponse
-from app.services import audio_service
+from app.core import config
+from app.services import audio_service, transcript_cache
+from app.services.model_manager import model_manager
 from app.services.stt_factory import get_stt_provider, get_stt_provider_ab
+from app.services.stt_provider import TranscriptionOptions, TranscriptionResult
+from app.services.stt_router import stt_router
 from app.services.telemetry import send_transcribe_event
+from app.services.longform import longform_params, stream_audio, transcribe_audio
+from app.services.vad import speech_stage, vad_params
+from app.services.upload_stream import PCMStreamSink, UploadError, read_multipart_stream
 import uuid
 import time
 import os
@@ -48,7 +58,36 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-@router.post("/transcribe", response_model=TranscriptionResponse)
+class _SpooledUpload:
+    """
+    Загрузка из UploadFile (классический путь /transcribe): при digest() копируется
+    во временный файл с подсчётом sha256, при result() декодируется ffmpeg.
+    """
+
+    def __init__(self, file: UploadFile):
+        self._file = file
+        self._path: str | None = None
+        self._sha256: str | None = None
+
+    async def digest(self) -> str:
+        if self._sha256 is None:
+            self._path, self._sha256 = await audio_service.save_upload(self._file)
+        return self._sha256
+
+    async def result(self) -> tuple:
+        await self.digest()
+        path, self._path = self._path, None
+        # в in-memory режиме ffmpeg отдаёт PCM прямо в память, временного WAV нет
+        if config.AUDIO_IN_MEMORY:
+            return await audio_service.extract_pcm_from_path(path, delete_original=True)
+        return await audio_service.extract_audio_from_path(path, delete_original=True)
+
+    async def abort(self) -> None:
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+        self._path = None
+
+
 async def transcribe_video(
     request: Request,
     background_tasks: BackgroundTasks,
@@ -56,6 +95,8 @@ async def transcribe_video(
     channel: str = Form("api"),
     user_id: str | None = Form(None),
     stt_provider: str | None = Form(None, description="STT провайдер: 'whisper', 'gigaam' или None (авто)"),
+    batched: bool | None = Form(None, description="Батчевый инференс (Whisper). None — как настроено в деплое"),
+    batch_size: int | None = Form(None, description="Размер батча для батчевого режима"),
 ):
     start = time.time()
 
@@ -76,32 +117,155 @@ async def transcribe_video(
     if file_size > MAX_FILE_SIZE_BYTES:
         raise HTTPException(400, "Максимальный размер файла — 1000 МБ.")
 
+    source = _SpooledUpload(file)
+    try:
+        return await _process_upload(
+            request,
+            background_tasks,
+            start=start,
+            filename=file.filename,
+            content_type=file.content_type,
+            file_size=file_size,
+            channel=channel,
+            user_id=user_id,
+            stt_provider=stt_provider,
+            options=TranscriptionOptions(batched=batched, batch_size=batch_size),
+            source=source,
+        )
+    finally:
+        await source.abort()
+
+
+async def transcribe_video_streaming(request: Request, background_tasks: BackgroundTasks):
+    """
+    Потоковый вариант /transcribe (UPLOAD_STREAMING=1): файл из multipart-тела
+    уходит в ffmpeg по мере загрузки, декодирование идёт параллельно с приёмом.
+    """
+    start = time.time()
+
+    sink = PCMStreamSink()
+    try:
+        upload = await read_multipart_stream(
+            request,
+            sink,
+            max_bytes=MAX_FILE_SIZE_BYTES,
+            content_type_prefix="video/",
+        )
+    except UploadError as e:
+        raise HTTPException(400, str(e))
+    except ClientDisconnect:
+        raise HTTPException(499, "Клиент отключился")
+
+    try:
+        return await _process_upload(
+            request,
+            background_tasks,
+            start=start,
+            filename=upload.filename,
+            content_type=upload.content_type,
+            file_size=upload.size,
+            channel=upload.fields.get("channel") or "api",
+            user_id=upload.fields.get("user_id"),
+            stt_provider=upload.fields.get("stt_provider"),
+            options=TranscriptionOptions.from_fields(upload.fields),
+            source=sink,
+        )
+    finally:
+        # если до extract дело не дошло — гасим ffmpeg и удаляем временный файл
+        await sink.abort()
+
+
+async def _process_upload(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    *,
+    start: float,
+    filename: str | None,
+    content_type: str | None,
+    file_size: int,
+    channel: str,
+    user_id: str | None,
+    stt_provider: str | None,
+    options: TranscriptionOptions,
+    source: "_SpooledUpload | PCMStreamSink",
+) -> TranscriptionResponse:
+    """
+    Общая часть обоих вариантов /transcribe: кэш по sha256, извлечение аудио,
+    STT, телеметрия и ответ.
+
+    source — загруженный файл: digest() отдаёт sha256 содержимого,
+    result() — (путь к WAV или PCM-массив, duration_sec, ffmpeg_ms),
+    abort() освобождает ресурсы, если декодирование не понадобилось.
+    """
     video_id = str(uuid.uuid4())
     request_id = str(uuid.uuid4())
     client_ip = get_client_ip(request)
     
     if user_id is None:
         user_id = client_ip      # фоллбек: если не пришёл, берём IP
+    reservation = None
     try:
         # ---------- CLIENT CHECK ----------
         await ensure_connected(request)
 
-        # ---------- 1) Extract audio ----------
-        audio_path, duration_sec, ffmpeg_ms = await audio_service.extract_audio(file)
-
-        await ensure_connected(request)
-
-        # ---------- 2) STT (Whisper или GigaAM) ----------
-        t_transcribe_start = time.time()
-        
         # Если провайдер указан в запросе - используем его, иначе A/B режим
         if stt_provider:
             provider = get_stt_provider(stt_provider)
         else:
-            provider = get_stt_provider_ab()
-        
-        transcription_result = await provider.transcribe(audio_path)
-        transcribe_ms = int((time.time() - t_transcribe_start) * 1000)
+            provider, reservation = get_stt_provider_ab()
+
+        # ---------- 0) Кэш по содержимому файла ----------
+        cache_key = transcript_cache.make_key(
+            await source.digest(), provider, {**vad_params(), **longform_params()}, options
+        )
+        cached = await transcript_cache.get_cached(cache_key)
+
+        if cached is not None:
+            # тот же файл уже распознавали этой же конфигурацией — ffmpeg и модель не нужны
+            await source.abort()
+            transcription_result = TranscriptionResult(
+                language=cached["language"],
+                transcript=cached["transcript"],
+                provider=cached["provider"],
+                tier=cached.get("tier"),
+            )
+            duration_sec = cached.get("duration_sec")
+            silence_removed = cached.get("silence_removed_ratio")
+            ffmpeg_ms = 0
+            transcribe_ms = 0
+        else:
+            # ---------- 1) Extract audio ----------
+            audio, duration_sec, ffmpeg_ms = await source.result()
+
+            await ensure_connected(request)
+
+            # ---------- 2) VAD: в провайдер идёт только речь ----------
+            audio, speech_map = await speech_stage(audio)
+            silence_removed = speech_map.removed_ratio if speech_map is not None else None
+
+            # ---------- 3) STT (Whisper или GigaAM) ----------
+            t_transcribe_start = time.time()
+
+            if speech_map is not None and speech_map.is_empty:
+                # речи нет — модель не нужна
+                transcription_result = TranscriptionResult(language="ru", transcript="", provider=provider.get_name())
+            else:
+                # длинная запись распознаётся кусками параллельно
+                loaded = provider.is_loaded()  # холодный запрос не идёт в RTF
+                with model_manager.use(provider.manager_key), stt_router.track(
+                    provider.manager_key, duration_sec, loaded, reservation=reservation
+                ):
+                    transcription_result = await transcribe_audio(provider, audio, speech_map, options)
+            transcribe_ms = int((time.time() - t_transcribe_start) * 1000)
+
+            await transcript_cache.put_cached(cache_key, {
+                "language": transcription_result.language,
+                "transcript": transcription_result.transcript,
+                "provider": transcription_result.provider,
+                "tier": transcription_result.tier,
+                "duration_sec": duration_sec,
+                "silence_removed_ratio": silence_removed,
+            })
 
         await ensure_connected(request)
 
@@ -111,17 +275,20 @@ async def transcribe_video(
         telemetry_payload = {
             "request_id": request_id,
             "video_id": video_id,
-            "filename": file.filename,
+            "filename": filename,
             "filesize_bytes": file_size,
             "duration_sec": duration_sec,
-            "content_type": file.content_type,
+            "content_type": content_type,
             "model_name": provider.get_model_name(),
             "model_device": provider.get_device(),
             "stt_provider": provider.get_name(),
+            "tier": transcription_result.tier,
+            "silence_removed_ratio": silence_removed,
             "language_detected": transcription_result.language,
             "latency_ms": total_ms,
             "transcribe_ms": transcribe_ms,
             "ffmpeg_ms": ffmpeg_ms,
+            "cache_hit": cached is not None,
             "success": True,
             "error_code": None,
             "error_message": None,
@@ -140,6 +307,9 @@ async def transcribe_video(
             processing_time=time.time() - start,
             file_size=file_size,
             duration_sec=duration_sec,
+            cached=cached is not None,
+            tier=transcription_result.tier,
+            silence_removed_ratio=silence_removed,
         )
 
     except HTTPException:
@@ -151,10 +321,10 @@ async def transcribe_video(
         error_payload = {
             "request_id": request_id,
             "video_id": video_id,
-            "filename": getattr(file, "filename", None),
+            "filename": filename,
             "filesize_bytes": file_size,
             "duration_sec": None,
-            "content_type": getattr(file, "content_type", None),
+            "content_type": content_type,
             "model_name": provider.get_model_name() if 'provider' in locals() else "unknown",
             "model_device": provider.get_device() if 'provider' in locals() else "unknown",
             "stt_provider": provider.get_name() if 'provider' in locals() else "unknown",
@@ -185,10 +355,10 @@ async def transcribe_video(
         error_payload = {
             "request_id": request_id,
             "video_id": video_id,
-            "filename": getattr(file, "filename", None),
+            "filename": filename,
             "filesize_bytes": file_size,
             "duration_sec": None,
-            "content_type": getattr(file, "content_type", None),
+            "content_type": content_type,
             "model_name": provider.get_model_name() if 'provider' in locals() else "unknown",
             "model_device": provider.get_device() if 'provider' in locals() else "unknown",
             "stt_provider": provider.get_name() if 'provider' in locals() else "unknown",
@@ -204,3 +374,199 @@ async def transcribe_video(
 
         background_tasks.add_task(send_transcribe_event, error_payload)
         raise HTTPException(500, f"Произошла ошибка: {str(e)}")
+
+    finally:
+        # слот router'а, не дошедший до модели (кэш, тишина, ошибка), освобождаем
+        if reservation is not None:
+            reservation.release()
+
+
+def _sse(event: str, data: dict) -> str:
+    """Одно событие Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/transcribe/stream")
+async def transcribe_video_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(..., description="Видеофайл для транскрибации."),
+    channel: str = Form("api"),
+    user_id: str | None = Form(None),
+    stt_provider: str | None = Form(None, description="STT провайдер: 'whisper', 'gigaam' или None (авто)"),
+    batched: bool | None = Form(None, description="Батчевый инференс (Whisper). None — как настроено в деплое"),
+    batch_size: int | None = Form(None, description="Размер батча для батчевого режима"),
+):
+    """
+    То же, что /transcribe, но ответ — text/event-stream: сегменты с таймкодами
+    приходят по мере декодирования.
+
+    События:
+    - segment: {"start", "end", "text"} — очередной распознанный фрагмент;
+    - done: итог в формате TranscriptionResponse;
+    - error: {"detail"} — распознавание прервалось.
+    """
+    start = time.time()
+
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(400, f"Неверный тип файла: {file.content_type}. Загрузите видео.")
+
+    file.file.seek(0, 2)
+    file_size = file.file.tell()
+    file.file.seek(0)
+
+    if file_size == 0:
+        raise HTTPException(400, "Файл пуст.")
+    if file_size > MAX_FILE_SIZE_BYTES:
+        raise HTTPException(400, "Максимальный размер файла — 1000 МБ.")
+
+    provider = get_stt_provider(stt_provider) if stt_provider else None
+    options = TranscriptionOptions(batched=batched, batch_size=batch_size)
+
+    # файл сохраняем до ответа: UploadFile закрывается, когда эндпоинт вернул StreamingResponse
+    video_id = str(uuid.uuid4())
+    client_ip = get_client_ip(request)
+    path, sha256 = await audio_service.save_upload(file)
+
+    async def events():
+        nonlocal provider
+        reservation = None
+        if provider is None:
+            # маршрут выбирается уже в потоке: занятый слот router'а освободит finally ниже
+            provider, reservation = get_stt_provider_ab()
+        duration_sec = None
+        ffmpeg_ms = None
+        transcribe_ms = None
+        error = None
+        silence_removed = None
+        cached = None
+        try:
+            cache_key = transcript_cache.make_key(sha256, provider, {**vad_params(), **longform_params()}, options)
+            cached = await transcript_cache.get_cached(cache_key)
+            if cached is not None:
+                os.remove(path)
+                language, transcript = cached["language"], cached["transcript"]
+                duration_sec = cached.get("duration_sec")
+                silence_removed = cached.get("silence_removed_ratio")
+                if transcript:
+                    yield _sse("segment", {"start": 0.0, "end": duration_sec, "text": transcript})
+            else:
+                samples, duration_sec, ffmpeg_ms = await audio_service.extract_pcm_from_path(
+                    path, delete_original=True
+                )
+
+                samples, speech_map = await speech_stage(samples)
+                silence_removed = speech_map.removed_ratio if speech_map is not None else None
+
+                t_transcribe_start = time.time()
+                parts = []
+                if speech_map is None or not speech_map.is_empty:
+                    loaded = provider.is_loaded()  # холодный запрос не идёт в RTF
+                    # measure=False: блок ждёт и клиента, читающего SSE, — RTF модели он не отражает
+                    with model_manager.use(provider.manager_key), stt_router.track(
+                        provider.manager_key, duration_sec, loaded, reservation=reservation, measure=False
+                    ):
+                        # таймкоды сегментов — по исходному аудио, а не по склеенной речи
+                        async for segment in stream_audio(provider, samples, speech_map, options):
+                            parts.append(segment.text)
+                            yield _sse("segment", {"start": segment.start, "end": segment.end, "text": segment.text})
+                transcribe_ms = int((time.time() - t_transcribe_start) * 1000)
+
+                # в кэш не пишем: сегменты не несут ни определённого языка, ни яруса
+                # каскада, а запись прочитал бы и синхронный /transcribe
+                language, transcript = "ru", " ".join(parts)
+
+            yield _sse("done", TranscriptionResponse(
+                video_id=video_id,
+                language=language,
+                transcript=transcript,
+                processing_time=time.time() - start,
+                file_size=file_size,
+                duration_sec=duration_sec,
+                cached=cached is not None,
+                silence_removed_ratio=silence_removed,
+            ).model_dump())
+        except Exception as e:
+            error = e
+            yield _sse("error", {"detail": f"Произошла ошибка: {e}"})
+        finally:
+            if reservation is not None:
+                reservation.release()
+            if os.path.exists(path):
+                os.remove(path)
+            background_tasks.add_task(send_transcribe_event, {
+                "request_id": str(uuid.uuid4()),
+                "video_id": video_id,
+                "filename": file.filename,
+                "filesize_bytes": file_size,
+                "duration_sec": duration_sec,
+                "content_type": file.content_type,
+                "model_name": provider.get_model_name(),
+                "model_device": provider.get_device(),
+                "stt_provider": provider.get_name(),
+                "latency_ms": int((time.time() - start) * 1000),
+                "transcribe_ms": transcribe_ms,
+                "ffmpeg_ms": ffmpeg_ms,
+                "cache_hit": cached is not None,
+                "streamed": True,
+                "success": error is None,
+                "error_code": None if error is None else "internal_error",
+                "error_message": None if error is None else str(error),
+                "client_ip": client_ip,
+                "channel": channel,
+                "user_id": user_id or client_ip,
+            })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # nginx не должен буферизовать поток событий
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/cache/stats")
+async def transcript_cache_stats():
+    """Счётчики кэша транскриптов (hits/misses, число записей)."""
+    return await transcript_cache.get_stats()
+
+
+# Описание multipart-тела для OpenAPI: потоковый эндпоинт читает request.stream() сам,
+# поэтому FastAPI не видит параметров File/Form
+_TRANSCRIBE_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary", "description": "Видеофайл для транскрибации."},
+                        "channel": {"type": "string", "default": "api"},
+                        "user_id": {"type": "string"},
+                        "stt_provider": {"type": "string", "description": "STT провайдер: 'whisper', 'gigaam' или None (авто)"},
+                        "batched": {"type": "boolean", "description": "Батчевый инференс (Whisper)"},
+                        "batch_size": {"type": "integer"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+if config.UPLOAD_STREAMING:
+    router.add_api_route(
+        "/transcribe",
+        transcribe_video_streaming,
+        methods=["POST"],
+        response_model=TranscriptionResponse,
+        openapi_extra=_TRANSCRIBE_OPENAPI,
+    )
+else:
+    router.add_api_route(
+        "/transcribe",
+        transcribe_video,
+        methods=["POST"],
+        response_model=TranscriptionResponse,
+    )
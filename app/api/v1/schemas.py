@@ -9,3 +9,6 @@ class TranscriptionResponse(BaseModel):
     processing_time: float = Field(..., description="Время обработки запроса в секундах.")
     file_size: int = Field(..., description="Размер загруженного видеофайла в байтах.")
     duration_sec: float = Field(..., description="Длительность видео в секундах.")
+    cached: bool = Field(False, description="Результат взят из кэша (этот файл уже распознавали).")
+    silence_removed_ratio: float | None = Field(None, description="Доля аудио, вырезанная VAD-этапом как тишина (None — VAD выключен).")
+    tier: str | None = Field(None, description="Модели каскада Whisper, понадобившиеся для ответа (например, 'base' или 'base+small').")
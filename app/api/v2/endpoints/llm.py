@@ -6,6 +6,7 @@ from starlette.concurrency import run_in_threadpool
 
 from app.api.v2.llm_schemas import LLMRequest, LLMResponse
 import app.services.llm_provider as llm_provider
+from app.services.model_manager import model_manager
 
 router = APIRouter(prefix="/llm", tags=["llm"])
 
@@ -47,10 +48,12 @@ def _generate_sync(req: LLMRequest) -> LLMResponse:
 @router.post("/generate", response_model=LLMResponse)
 async def generate(req: LLMRequest):
     try:
-        llm_provider.load_model()
+        with model_manager.use(llm_provider.MANAGER_KEY):
+            # загрузка тоже в threadpool, чтобы не блокировать event loop
+            await run_in_threadpool(llm_provider.load_model)
 
-        # 👇 КЛЮЧЕВОЕ МЕСТО
-        return await run_in_threadpool(_generate_sync, req)
+            # 👇 КЛЮЧЕВОЕ МЕСТО
+            return await run_in_threadpool(_generate_sync, req)
 
     except RuntimeError as e:
         if "out of memory" in str(e).lower():
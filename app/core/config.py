@@ -2,22 +2,158 @@ import os
 
 
 WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+# Какие размеры Whisper можно запросить через stt_provider="whisper:<size>"
+WHISPER_MODELS = [m.strip() for m in os.getenv("WHISPER_MODELS", WHISPER_MODEL).split(",") if m.strip()]
+# 1 = "whisper" без модели работает каскадом: черновая модель, неуверенные сегменты —
+# основной (см. whisper_cascade.py); явно — stt_provider="whisper:cascade"
+WHISPER_CASCADE = os.getenv("WHISPER_CASCADE", "0") == "1"
+
+# ===== Аудио пайплайн =====
+# Частота дискретизации, с которой работают все STT провайдеры
+AUDIO_SAMPLE_RATE = 16000
+# 1 = ffmpeg отдаёт PCM float32 прямо в память (без временного WAV
+# и без повторного декодирования файла внутри провайдера)
+AUDIO_IN_MEMORY = os.getenv("AUDIO_IN_MEMORY", "1") == "1"
+# Нормализация громкости (EBU R128) для async jobs — делается в том же проходе ffmpeg, что и извлечение
+AUDIO_NORMALIZE_LOUDNESS = os.getenv("AUDIO_NORMALIZE_LOUDNESS", "1") == "1"
+AUDIO_TARGET_LUFS = float(os.getenv("AUDIO_TARGET_LUFS", "-16.0"))
+# "native" — измерение/усиление по EBU R128 в NumPy прямо по PCM (нужен AUDIO_IN_MEMORY),
+# "ffmpeg" — фильтр loudnorm в графе извлечения
+AUDIO_LOUDNORM_BACKEND = os.getenv("AUDIO_LOUDNORM_BACKEND", "native")
+# Если громкость уже в пределах допуска от цели — нормализацию пропускаем
+AUDIO_LOUDNESS_TOLERANCE_LU = float(os.getenv("AUDIO_LOUDNESS_TOLERANCE_LU", "1.0"))
+# Сколько ffmpeg-процессов одновременно (размер FFMPEG_POOL)
+FFMPEG_POOL_WORKERS = int(os.getenv("FFMPEG_POOL_WORKERS", "4"))
+# Длинные файлы (от AUDIO_PARALLEL_EXTRACT_MIN_SEC) декодируются параллельно
+# AUDIO_PARALLEL_EXTRACT_SLICES кусками по времени; 1 = выключено
+AUDIO_PARALLEL_EXTRACT_SLICES = int(os.getenv("AUDIO_PARALLEL_EXTRACT_SLICES", "4"))
+AUDIO_PARALLEL_EXTRACT_MIN_SEC = float(os.getenv("AUDIO_PARALLEL_EXTRACT_MIN_SEC", "600"))
+# 1 = /transcribe и /jobs разбирают multipart по мере загрузки: байты сразу идут
+# в ffmpeg (или в итоговый файл), без ожидания всего тела и без промежуточной копии
+UPLOAD_STREAMING = os.getenv("UPLOAD_STREAMING", "0") == "1"
+# Общий VAD-этап перед любым провайдером: карта речи считается один раз, тишина
+# вырезается, а файл без речи сразу получает пустой транскрипт (модель не вызывается).
+# AUDIO_VAD_BACKEND: silero (Silero VAD из faster-whisper) или energy (по энергии кадров)
+AUDIO_VAD = os.getenv("AUDIO_VAD", "1") == "1"
+AUDIO_VAD_BACKEND = os.getenv("AUDIO_VAD_BACKEND", "silero")
+# Поля вокруг речи (мс); паузы короче MIN_SILENCE не вырезаются;
+# между склеенными участками речи — GAP тишины
+AUDIO_VAD_PAD_MS = int(os.getenv("AUDIO_VAD_PAD_MS", "200"))
+AUDIO_VAD_MIN_SILENCE_MS = int(os.getenv("AUDIO_VAD_MIN_SILENCE_MS", "1000"))
+AUDIO_VAD_GAP_MS = int(os.getenv("AUDIO_VAD_GAP_MS", "300"))
+# Параллельное распознавание длинных записей (от LONGFORM_MIN_SEC речи): запись режется
+# по паузам на куски до LONGFORM_CHUNK_SEC, до LONGFORM_MAX_PARALLEL кусков распознаются
+# одновременно (по репликам / в общем батче) и склеиваются по порядку
+LONGFORM_PARALLEL = os.getenv("LONGFORM_PARALLEL", "1") == "1"
+LONGFORM_MIN_SEC = float(os.getenv("LONGFORM_MIN_SEC", "180"))
+LONGFORM_CHUNK_SEC = float(os.getenv("LONGFORM_CHUNK_SEC", "60"))
+LONGFORM_MAX_PARALLEL = int(os.getenv("LONGFORM_MAX_PARALLEL", "4"))
 
 # ===== STT Провайдер =====
 # Выбор провайдера: "whisper" или "gigaam"
 STT_PROVIDER = os.getenv("STT_PROVIDER", "whisper")
 
+# Какие провайдеры загрузить и прогреть при старте (через запятую, пусто — ленивая загрузка).
+# Пока они не готовы, /readyz отвечает 503
+STT_PRELOAD = [
+    name.strip().lower()
+    for name in os.getenv("STT_PRELOAD", "").split(",")
+    if name.strip()
+]
+# Прогрев синтетическим аудио после загрузки
+STT_WARMUP = os.getenv("STT_WARMUP", "1") == "1"
+
 # ===== GigaAM настройки =====
 # Вариант модели GigaAM-v3: e2e_rnnt, e2e_ctc, rnnt, ctc
 # e2e_rnnt - рекомендуется (текст с пунктуацией и нормализацией)
 GIGAAM_MODEL_VARIANT = os.getenv("GIGAAM_MODEL_VARIANT", "e2e_rnnt")
+# Какие варианты можно запросить через stt_provider="gigaam:<variant>"
+GIGAAM_VARIANTS = [v.strip() for v in os.getenv("GIGAAM_VARIANTS", GIGAAM_MODEL_VARIANT).split(",") if v.strip()]
 
 # ===== A/B тестирование =====
 # Процент запросов на GigaAM (0-100)
 # 0 = только Whisper, 100 = только GigaAM
 STT_AB_GIGAAM_PERCENT = int(os.getenv("STT_AB_GIGAAM_PERCENT", "0"))
 
+# ===== Маршрутизация по задержке =====
+# Между какими провайдерами распределять запросы без явного stt_provider
+# (через запятую, например "whisper,gigaam:e2e_ctc"). Пусто — A/B по STT_AB_GIGAAM_PERCENT.
+# Запрос уходит туда, где ожидаемое время ответа (очередь * RTF) меньше
+STT_ROUTING_PROVIDERS = [
+    name.strip().lower()
+    for name in os.getenv("STT_ROUTING_PROVIDERS", "").split(",")
+    if name.strip()
+]
+# Минимальная доля запросов на каждый провайдер (%, для экспериментов)
+STT_ROUTING_MIN_SHARE_PERCENT = float(os.getenv("STT_ROUTING_MIN_SHARE_PERCENT", "0"))
+# RTF провайдера, пока нет замеров, и штраф за загрузку выгруженной модели (сек)
+STT_ROUTING_DEFAULT_RTF = float(os.getenv("STT_ROUTING_DEFAULT_RTF", "0.3"))
+STT_ROUTING_COLD_START_SEC = float(os.getenv("STT_ROUTING_COLD_START_SEC", "20"))
+
+# ===== Менеджер моделей =====
+# Бюджет памяти под модели (МБ, 0 = без ограничения): при нехватке выгружаются
+# давно не использованные модели (LRU)
+MODEL_RAM_BUDGET_MB = float(os.getenv("MODEL_RAM_BUDGET_MB", "0"))
+MODEL_VRAM_BUDGET_MB = float(os.getenv("MODEL_VRAM_BUDGET_MB", "0"))
+# Выгружать модели, простаивающие дольше (сек, 0 = никогда)
+MODEL_IDLE_TTL_SEC = float(os.getenv("MODEL_IDLE_TTL_SEC", "0"))
+
+# ===== Живое распознавание (WebSocket /api/v1/transcribe/live) =====
+# Максимум одновременных живых сессий на одну модель
+LIVE_MAX_SESSIONS_PER_MODEL = int(os.getenv("LIVE_MAX_SESSIONS_PER_MODEL", "4"))
+# Как часто отправлять partial по незакрытой фразе (0 = только final)
+LIVE_PARTIAL_INTERVAL_MS = int(os.getenv("LIVE_PARTIAL_INTERVAL_MS", "1000"))
+# Сколько тишины закрывает фразу и максимальная длина фразы
+LIVE_MIN_SILENCE_MS = int(os.getenv("LIVE_MIN_SILENCE_MS", "500"))
+LIVE_MAX_UTTERANCE_SEC = float(os.getenv("LIVE_MAX_UTTERANCE_SEC", "15"))
+
 # ===== Async Jobs Config =====
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Размер общего пула асинхронных соединений с Redis (API + воркер одного процесса)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
 ORCHESTRATOR_JOB_URL = os.getenv("ORCHESTRATOR_JOB_URL", "")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/tmp/uploads")
+# Чекпоинты длинных jobs: готовые куски хранятся в Redis (TTL), прерванная job
+# продолжает с последнего готового куска
+JOB_CHECKPOINT_TTL_SEC = int(os.getenv("JOB_CHECKPOINT_TTL_SEC", str(2 * 24 * 3600)))
+# Job без аренды (взятая старым воркером), не обновлявшаяся дольше JOB_STALE_SEC
+# в статусе processing, при старте воркера возвращается в очередь
+JOB_STALE_SEC = float(os.getenv("JOB_STALE_SEC", "600"))
+# Аренда взятой job: воркер продлевает её, пока жив; истёкшую reaper раз в
+# JOB_REAPER_INTERVAL_SEC возвращает в очередь, после JOB_MAX_ATTEMPTS выдач — ошибка
+JOB_VISIBILITY_TIMEOUT_SEC = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SEC", "120"))
+JOB_REAPER_INTERVAL_SEC = float(os.getenv("JOB_REAPER_INTERVAL_SEC", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Конвейер воркера: стадии extract, normalize, vad, transcribe, keywords, finalize
+# обрабатывают разные jobs одновременно. JOB_STAGE_CONCURRENCY — параллельность
+# стадий ("extract=2,keywords=2", остальные — 1), JOB_PIPELINE_QUEUE_SIZE — сколько
+# jobs может ждать перед каждой стадией
+JOB_STAGE_CONCURRENCY = {
+    name.strip(): int(value)
+    for name, _, value in (
+        item.partition("=") for item in os.getenv("JOB_STAGE_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
+JOB_PIPELINE_QUEUE_SIZE = int(os.getenv("JOB_PIPELINE_QUEUE_SIZE", "1"))
+# Расписание очереди jobs. Классы приоритета по убыванию (низший ждёт, пока высшие
+# пусты); внутри класса — справедливая очередь между арендаторами (user_id, без
+# него — channel) по секундам аудио, с весами JOB_FAIR_WEIGHTS ("user:42=3,channel:bot=0.5").
+# JOB_QUEUE_POLICY — порядок jobs одного арендатора: fifo или sjf (сначала короткие
+# по ffprobe). Job с неизвестной длительностью стоит JOB_DEFAULT_COST_SEC
+JOB_PRIORITIES = [p.strip() for p in os.getenv("JOB_PRIORITIES", "high,normal,low").split(",") if p.strip()]
+JOB_DEFAULT_PRIORITY = os.getenv("JOB_DEFAULT_PRIORITY", "normal")
+JOB_QUEUE_POLICY = os.getenv("JOB_QUEUE_POLICY", "fifo").lower()
+JOB_FAIR_WEIGHTS = {
+    name.strip(): float(value)
+    for name, _, value in (
+        item.rpartition("=") for item in os.getenv("JOB_FAIR_WEIGHTS", "").split(",") if "=" in item
+    )
+}
+JOB_DEFAULT_COST_SEC = float(os.getenv("JOB_DEFAULT_COST_SEC", "60"))
+# Сколько последних событий job хранить (список jobs:events:<job_id>)
+JOB_EVENTS_MAX = int(os.getenv("JOB_EVENTS_MAX", "200"))
+
+# ===== Кэш транскриптов (по sha256 загрузки) =====
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") == "1"
+TRANSCRIPT_CACHE_TTL_SEC = int(os.getenv("TRANSCRIPT_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "10000"))
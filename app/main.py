@@ -1,9 +1,13 @@
 import asyncio
 from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from app.api.v1.endpoints import transcription, jobs
-from app.services.job_worker import worker_loop
+from app.api.v1.endpoints import transcription, jobs, live
+from app.core import config
+from app.services.job_worker import get_pipeline_stats, job_reaper, worker_loop
+from app.services.model_manager import model_manager
+from app.services.stt_factory import get_readiness, preload_providers
+from app.services.stt_router import stt_router
 from app.api.v2.endpoints import llm
 from app.services.triggers.trigger_benchmark import run_benchmark_and_push
 import os
@@ -18,6 +22,7 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 app.include_router(transcription.router, prefix="/api/v1", tags=["Транскрибация"])
 app.include_router(jobs.router, prefix="/api/v1", tags=["Jobs"])
+app.include_router(live.router, prefix="/api/v1", tags=["Живое распознавание"])
 app.include_router(
     llm.router,
     prefix="/api/v2",
@@ -27,6 +32,13 @@ app.include_router(
 @app.on_event("startup")
 async def startup_event():
     asyncio.create_task(worker_loop(), name="job-worker")
+    asyncio.create_task(job_reaper(), name="job-reaper")
+    asyncio.create_task(model_manager.idle_reaper(), name="model-idle-reaper")
+    if config.STT_PRELOAD:
+        asyncio.create_task(
+            preload_providers(config.STT_PRELOAD, warmup=config.STT_WARMUP),
+            name="stt-preload",
+        )
 
 
 
@@ -35,6 +47,38 @@ async def healthcheck():
     """Эндпоинт для проверки состояния сервиса, пока для докера, в целом можно и в оркестратор влить проверку."""
     return {"status": "ok"}
 
+
+@app.get("/readyz", tags=["Служебное"])
+async def readiness():
+    """
+    Готовность к трафику: все провайдеры из STT_PRELOAD загружены и прогреты.
+    Пока нет — 503, чтобы оркестратор не слал запросы на холодный инстанс.
+    """
+    ready, models = get_readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "models": models},
+    )
+
+
+@app.get("/models", tags=["Служебное"])
+async def models_stats():
+    """Загруженные модели: память, простой, бюджет менеджера моделей."""
+    return model_manager.stats()
+
+
+@app.get("/routing", tags=["Служебное"])
+async def routing_stats():
+    """Маршрутизация по задержке: RTF, запросы в работе и доля трафика по моделям."""
+    return stt_router.stats()
+
+
+@app.get("/pipeline", tags=["Служебное"])
+async def pipeline_stats():
+    """Конвейер воркера jobs: параллельность, занятость и очередь каждой стадии."""
+    return get_pipeline_stats()
+
+
 @app.get("/", tags=["Web UI"])
 def read_root_ui():
     """
@@ -33,6 +33,11 @@ class JobStatusResponse(BaseModel):
     result: dict[str, Any] | None = None
     error: str | None = None
     events: list[JobEvent] = Field(default_factory=list)
+    priority: str | None = None
+    tenant: str | None = None
+    expected_duration_sec: float | None = None
+    attempts: int | None = None
+    queue: dict[str, Any] | None = None  # место в расписании, пока job ждёт
 
 class JobSummary(BaseModel):
     job_id: str
@@ -1,12 +1,37 @@
 """
 Модуль препроцессинга аудиосигнала.
 Содержит функции для нормализации громкости аудио.
+
+Два варианта:
+- ffmpeg loudnorm (по файлу или в графе извлечения, см. audio_service);
+- нативный NumPy (measure_integrated_loudness / normalize_pcm_loudness) — прямо по PCM
+  в памяти, без процесса ffmpeg и разбора stderr.
 """
+import math
 import subprocess
 import tempfile
 import os
 from typing import Optional
 
+import numpy as np
+
+# ===== EBU R128 / ITU-R BS.1770 =====
+_BLOCK_SEC = 0.4            # гейтинговый блок 400 мс
+_SUBBLOCKS_PER_BLOCK = 4    # перекрытие 75% => шаг 100 мс
+_ABSOLUTE_GATE_LUFS = -70.0
+_RELATIVE_GATE_LU = -10.0
+# число 100-мс подблоков в одном батче FFT (ограничивает пиковую память на длинных файлах)
+_FFT_BATCH = 4096
+
+
+def loudnorm_filter(target_lufs: float = -16.0) -> str:
+    """
+    Строка фильтра ffmpeg loudnorm для EBU R128 нормализации.
+    Используется и отдельным проходом (normalize_audio_loudness),
+    и в общем графе извлечения аудио (audio_service, target_lufs=...).
+    """
+    return f"loudnorm=I={target_lufs}:TP=-1.5:LRA=11"
+
 
 def normalize_audio_loudness(
     input_path: str,
@@ -41,7 +66,7 @@ def normalize_audio_loudness(
         "ffmpeg",
         "-y",  # Перезаписывать выходной файл
         "-i", input_path,
-        "-af", f"loudnorm=I={target_lufs}:TP=-1.5:LRA=11",
+        "-af", loudnorm_filter(target_lufs),
         "-ar", "16000",  # Частота дискретизации 16kHz
         "-ac", "1",      # Моно
         output_path
@@ -103,3 +128,179 @@ def get_audio_loudness(input_path: str) -> dict:
         return loudness_info
     except Exception as e:
         return {"error": str(e)}
+
+
+def _biquad_power_response(b: tuple, a: tuple, freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    """|H(f)|^2 биквадратного фильтра на заданных частотах."""
+    z1 = np.exp(-2j * np.pi * freqs / sample_rate)
+    z2 = z1 * z1
+    h = (b[0] + b[1] * z1 + b[2] * z2) / (a[0] + a[1] * z1 + a[2] * z2)
+    return np.abs(h) ** 2
+
+
+def _k_weighting_power(freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    |H(f)|^2 K-фильтра BS.1770 (high-shelf +4 дБ @1.5 кГц и RLB high-pass @38 Гц),
+    коэффициенты пересчитаны под sample_rate.
+    """
+    # high shelf
+    gain_db, q, fc = 4.0, 1 / math.sqrt(2), 1500.0
+    big_a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    shelf_b = (
+        big_a * ((big_a + 1) + (big_a - 1) * cos_w0 + 2 * math.sqrt(big_a) * alpha),
+        -2 * big_a * ((big_a - 1) + (big_a + 1) * cos_w0),
+        big_a * ((big_a + 1) + (big_a - 1) * cos_w0 - 2 * math.sqrt(big_a) * alpha),
+    )
+    shelf_a = (
+        (big_a + 1) - (big_a - 1) * cos_w0 + 2 * math.sqrt(big_a) * alpha,
+        2 * ((big_a - 1) - (big_a + 1) * cos_w0),
+        (big_a + 1) - (big_a - 1) * cos_w0 - 2 * math.sqrt(big_a) * alpha,
+    )
+
+    # high pass
+    q, fc = 0.5, 38.0
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    hp_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    hp_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    return (
+        _biquad_power_response(shelf_b, shelf_a, freqs, sample_rate)
+        * _biquad_power_response(hp_b, hp_a, freqs, sample_rate)
+    )
+
+
+def _block_mean_squares(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Средний квадрат K-взвешенного сигнала для 400-мс блоков с шагом 100 мс.
+
+    Вместо рекурсивной фильтрации (в чистом NumPy не векторизуется) считаем энергию
+    каждого 100-мс подблока в частотной области: по Парсевалю это сумма спектра мощности,
+    умноженного на |H_K(f)|^2. Энергия 400-мс блока — сумма четырёх соседних подблоков.
+    """
+    hop = int(round(sample_rate * _BLOCK_SEC / _SUBBLOCKS_PER_BLOCK))
+    n_sub = samples.size // hop
+    if n_sub < _SUBBLOCKS_PER_BLOCK:
+        return np.empty(0, dtype=np.float64)
+
+    freqs = np.fft.rfftfreq(hop, d=1.0 / sample_rate)
+    weights = _k_weighting_power(freqs, sample_rate)
+    # односторонний спектр: все бины, кроме DC (и Найквиста при чётном hop), входят дважды
+    weights[1:] *= 2
+    if hop % 2 == 0:
+        weights[-1] /= 2
+
+    sub = samples[:n_sub * hop].reshape(n_sub, hop)
+    energies = np.empty(n_sub, dtype=np.float64)
+    for i in range(0, n_sub, _FFT_BATCH):
+        spec = np.fft.rfft(sub[i:i + _FFT_BATCH], axis=1)
+        power = spec.real ** 2 + spec.imag ** 2
+        energies[i:i + _FFT_BATCH] = power @ weights / hop
+
+    # скользящая сумма по 4 подблокам -> блоки 400 мс с перекрытием 75%
+    csum = np.concatenate(([0.0], np.cumsum(energies)))
+    block_energy = csum[_SUBBLOCKS_PER_BLOCK:] - csum[:-_SUBBLOCKS_PER_BLOCK]
+    return block_energy / (hop * _SUBBLOCKS_PER_BLOCK)
+
+
+def measure_integrated_loudness(samples: np.ndarray, sample_rate: int) -> float:
+    """
+    Интегральная громкость (LUFS) по EBU R128 с абсолютным (-70 LUFS)
+    и относительным (-10 LU) гейтингом. Для тишины возвращает -inf.
+    
+    Args:
+        samples: PCM float32, mono
+        sample_rate: Частота дискретизации
+        
+    Returns:
+        Громкость в LUFS
+    """
+    z = _block_mean_squares(np.asarray(samples, dtype=np.float32), sample_rate)
+    if z.size == 0:
+        return float("-inf")
+
+    with np.errstate(divide="ignore"):
+        block_lufs = -0.691 + 10 * np.log10(z)
+
+    z_abs = z[block_lufs > _ABSOLUTE_GATE_LUFS]
+    if z_abs.size == 0:
+        return float("-inf")
+
+    relative_gate = -0.691 + 10 * math.log10(z_abs.mean()) + _RELATIVE_GATE_LU
+    z_gated = z[(block_lufs > _ABSOLUTE_GATE_LUFS) & (block_lufs > relative_gate)]
+    if z_gated.size == 0:
+        return float("-inf")
+
+    return -0.691 + 10 * math.log10(z_gated.mean())
+
+
+def limit_peaks(samples: np.ndarray, ceiling: float, sample_rate: int, block_ms: int = 10) -> tuple[np.ndarray, float]:
+    """
+    Look-ahead лимитер (в месте, samples меняется): для каждого блока block_ms
+    нужное ослабление — ceiling / пик блока; усиление блока — минимум по нему и
+    соседям (заранее опускается перед пиком и плавно возвращается после), между
+    центрами блоков интерполируется линейно. Так пики не выходят за ceiling, а
+    форма волны не срезается, как у np.clip.
+
+    Returns:
+        (samples, максимальное ослабление в dB, 0 — если лимитер не понадобился)
+    """
+    block = max(1, sample_rate * block_ms // 1000)
+    n_blocks = -(-samples.size // block)
+    padded = np.zeros(n_blocks * block, dtype=np.float32)
+    padded[:samples.size] = np.abs(samples)
+    peaks = padded.reshape(n_blocks, block).max(axis=1)
+    if n_blocks == 0 or peaks.max() <= ceiling:
+        return samples, 0.0
+
+    required = np.minimum(1.0, ceiling / np.maximum(peaks, 1e-12))
+    edged = np.concatenate(([required[0]], required, [required[-1]]))
+    # усиление блока не больше нужного ни ему, ни соседям: интерполяция между
+    # центрами соседних блоков не поднимает пик блока выше ceiling
+    gains = np.minimum(np.minimum(edged[:-2], edged[1:-1]), edged[2:])
+    centers = np.arange(n_blocks) * block + block / 2
+    samples *= np.interp(np.arange(samples.size), centers, gains).astype(np.float32)
+    np.clip(samples, -ceiling, ceiling, out=samples)  # только погрешность округления
+    return samples, 20 * math.log10(float(gains.min()))
+
+
+def normalize_pcm_loudness(
+    samples: np.ndarray,
+    sample_rate: int,
+    target_lufs: float = -16.0,
+    tolerance_lu: float = 1.0,
+    peak_db: float = -1.5,
+) -> tuple[np.ndarray, dict]:
+    """
+    Нормализует громкость PCM в памяти до target_lufs (EBU R128).
+    
+    Если громкость уже в пределах tolerance_lu от цели (или сигнал — тишина),
+    возвращает исходный массив без копирования. Пики после усиления
+    ограничиваются уровнем peak_db dBFS лимитером (limit_peaks), как true-peak
+    лимит в loudnorm ffmpeg, а не жёстким срезом.
+    
+    Args:
+        samples: PCM float32, mono
+        sample_rate: Частота дискретизации
+        target_lufs: Целевой уровень громкости в LUFS
+        tolerance_lu: Допуск, в пределах которого нормализация пропускается
+        peak_db: Потолок пиков после усиления, dBFS
+        
+    Returns:
+        (нормализованный PCM, словарь с input_i, gain_db, limiter_db, skipped)
+    """
+    input_i = measure_integrated_loudness(samples, sample_rate)
+
+    if not math.isfinite(input_i) or abs(target_lufs - input_i) <= tolerance_lu:
+        return samples, {"input_i": input_i, "gain_db": 0.0, "limiter_db": 0.0, "skipped": True}
+
+    gain_db = target_lufs - input_i
+    ceiling = 10 ** (peak_db / 20)
+    out = samples * np.float32(10 ** (gain_db / 20))
+    out, limiter_db = limit_peaks(out, ceiling, sample_rate)
+
+    return out, {"input_i": input_i, "gain_db": gain_db, "limiter_db": limiter_db, "skipped": False}
@@ -1,18 +1,48 @@
 import ffmpeg
+import hashlib
 import tempfile
 import os
 import time
 from typing import Tuple, Optional
 
+import numpy as np
 from fastapi import UploadFile
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+from app.core import config
+from app.services.audio_preprocessing import loudnorm_filter
+
 # общий пул под ffmpeg — тут и будет "распараллеливание"
-FFMPEG_POOL = ThreadPoolExecutor(max_workers=4)  # можешь подстроить под CPU
+FFMPEG_POOL = ThreadPoolExecutor(max_workers=config.FFMPEG_POOL_WORKERS)  # можешь подстроить под CPU
+
+
+def _probe_duration(video_path: str) -> Optional[float]:
+    """Длительность исходного файла по ffprobe (None, если узнать не удалось)."""
+    try:
+        probe = ffmpeg.probe(video_path)
+        return float(probe["format"]["duration"])
+    except Exception:
+        return None
 
 
-def _blocking_extract_audio(temp_video_path: str, delete_original: bool = True) -> tuple[str, Optional[float], int]:
+def _audio_output_kwargs(target_lufs: Optional[float]) -> dict:
+    """
+    Общие параметры выхода: mono, 16kHz. Если задан target_lufs —
+    loudnorm встраивается в тот же граф фильтров, и нормализация идёт
+    в одном проходе с декодированием (без второго ffmpeg и второго файла).
+    """
+    kwargs = {"ac": 1, "ar": config.AUDIO_SAMPLE_RATE}
+    if target_lufs is not None:
+        kwargs["af"] = loudnorm_filter(target_lufs)
+    return kwargs
+
+
+def _blocking_extract_audio(
+    temp_video_path: str,
+    delete_original: bool = True,
+    target_lufs: Optional[float] = None,
+) -> tuple[str, Optional[float], int]:
     """
     Блокирующая часть: ffmpeg.probe + ffmpeg.run.
     Выполняется в отдельном потоке, чтобы не блокировать event loop.
@@ -24,11 +54,7 @@ def _blocking_extract_audio(temp_video_path: str, delete_original: bool = True)
         raise RuntimeError("Видео-файл пуст после копирования.")
 
     # пробуем узнать длительность видео
-    try:
-        probe = ffmpeg.probe(temp_video_path)
-        duration_sec: Optional[float] = float(probe["format"]["duration"])
-    except Exception:
-        duration_sec = None
+    duration_sec = _probe_duration(temp_video_path)
 
     # создаём временный wav
     with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as audio_file:
@@ -43,8 +69,7 @@ def _blocking_extract_audio(temp_video_path: str, delete_original: bool = True)
                 audio_output_path,
                 format="wav",
                 acodec="pcm_s16le",
-                ac=1,
-                ar=16000,
+                **_audio_output_kwargs(target_lufs),
             )
             .overwrite_output()
             .run(capture_stdout=True, capture_stderr=True)
@@ -60,27 +85,129 @@ def _blocking_extract_audio(temp_video_path: str, delete_original: bool = True)
 
     return audio_output_path, duration_sec, ffmpeg_ms
 
-async def extract_audio_from_path(video_path: str, delete_original: bool = False) -> tuple[str, Optional[float], int]:
+
+def _blocking_extract_pcm(
+    temp_video_path: str,
+    delete_original: bool = True,
+    target_lufs: Optional[float] = None,
+    duration_sec: Optional[float] = None,
+) -> tuple[np.ndarray, Optional[float], int]:
     """
-    Асинхронная обертка для извлечения аудио из локального файла.
+    То же, что _blocking_extract_audio, но без временного WAV:
+    ffmpeg пишет f32le (16kHz mono) в stdout, а мы сразу собираем из него numpy-массив.
+    Провайдерам не нужно второй раз декодировать файл.
+    duration_sec — если уже известна (пробовали раньше), повторно ffprobe не запускаем.
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        FFMPEG_POOL,
-        _blocking_extract_audio,
-        video_path,
-        delete_original
+    video_size = os.path.getsize(temp_video_path)
+    if video_size == 0:
+        if delete_original:
+            os.remove(temp_video_path)
+        raise RuntimeError("Видео-файл пуст после копирования.")
+
+    if duration_sec is None:
+        duration_sec = _probe_duration(temp_video_path)
+
+    t0 = time.time()
+    try:
+        out, _ = (
+            ffmpeg
+            .input(temp_video_path)
+            .output(
+                "pipe:",
+                format="f32le",
+                acodec="pcm_f32le",
+                **_audio_output_kwargs(target_lufs),
+            )
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    finally:
+        ffmpeg_ms = int((time.time() - t0) * 1000)
+        if delete_original and os.path.exists(temp_video_path):
+            os.remove(temp_video_path)
+
+    if not out:
+        raise RuntimeError("FFmpeg вернул пустой PCM-поток.")
+
+    samples = np.frombuffer(out, dtype=np.float32)
+    return samples, duration_sec, ffmpeg_ms
+
+
+def _blocking_extract_pcm_range(video_path: str, start_sec: float, length_sec: Optional[float]) -> np.ndarray:
+    """
+    Декодирует в PCM только отрезок [start_sec, start_sec + length_sec) через input seeking
+    (-ss/-t перед -i: ffmpeg не разбирает файл с начала). length_sec=None — до конца файла.
+    """
+    input_kwargs = {"ss": start_sec}
+    if length_sec is not None:
+        input_kwargs["t"] = length_sec
+
+    out, _ = (
+        ffmpeg
+        .input(video_path, **input_kwargs)
+        .output(
+            "pipe:",
+            format="f32le",
+            acodec="pcm_f32le",
+            **_audio_output_kwargs(None),
+        )
+        .run(capture_stdout=True, capture_stderr=True)
     )
+    if not out:
+        raise RuntimeError(f"FFmpeg вернул пустой PCM-поток для отрезка с {start_sec:.2f} с.")
+    return np.frombuffer(out, dtype=np.float32)
 
 
-async def extract_audio(video_file: UploadFile) -> tuple[str, Optional[float], int]:
+async def _extract_pcm_sliced(
+    video_path: str,
+    duration_sec: float,
+    delete_original: bool,
+) -> tuple[np.ndarray, Optional[float], int]:
     """
-    Извлекает аудио из видеофайла и сохраняет его как временный WAV-файл (16kHz mono).
+    Параллельное извлечение для длинных файлов: делим длительность на
+    AUDIO_PARALLEL_EXTRACT_SLICES отрезков, каждый декодирует свой ffmpeg в FFMPEG_POOL,
+    затем склеиваем PCM по порядку.
+    """
+    loop = asyncio.get_running_loop()
+    n_slices = config.AUDIO_PARALLEL_EXTRACT_SLICES
+    sr = config.AUDIO_SAMPLE_RATE
+    bounds = [duration_sec * i / n_slices for i in range(n_slices + 1)]
 
-    Возвращает:
-        audio_output_path: путь к временномy .wav
-        duration_sec: длительность исходного видео (если удалось узнать), иначе None
-        ffmpeg_ms: время работы ffmpeg в миллисекундах
+    t0 = time.time()
+    try:
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(
+                FFMPEG_POOL,
+                _blocking_extract_pcm_range,
+                video_path,
+                bounds[i],
+                # последний отрезок — до конца файла, чтобы не потерять хвост из-за неточной длительности
+                bounds[i + 1] - bounds[i] if i < n_slices - 1 else None,
+            )
+            for i in range(n_slices)
+        ))
+    finally:
+        ffmpeg_ms = int((time.time() - t0) * 1000)
+        if delete_original and os.path.exists(video_path):
+            os.remove(video_path)
+
+    # приводим отрезки к точному числу сэмплов: лишнее подрезаем, чтобы на стыках не было
+    # наложений, недостающее (ffmpeg отдал отрезок короче) добиваем тишиной, чтобы
+    # следующие отрезки не съезжали по времени
+    trimmed = []
+    for i, part in enumerate(parts[:-1]):
+        expected = round(bounds[i + 1] * sr) - round(bounds[i] * sr)
+        if part.size < expected:
+            part = np.pad(part, (0, expected - part.size))
+        trimmed.append(part[:expected])
+    trimmed.append(parts[-1])
+
+    return np.concatenate(trimmed), duration_sec, ffmpeg_ms
+
+
+async def _save_upload_to_temp(video_file: UploadFile, hasher=None) -> str:
+    """
+    Копирует UploadFile во временный файл и возвращает путь к нему.
+    hasher (hashlib-объект) — если передан, по пути считается хэш содержимого.
     """
     # гарантируем начало
     await video_file.seek(0)
@@ -94,8 +221,94 @@ async def extract_audio(video_file: UploadFile) -> tuple[str, Optional[float], i
             chunk = await video_file.read(chunk_size)
             if not chunk:
                 break
+            if hasher is not None:
+                hasher.update(chunk)
             temp_video_file.write(chunk)
 
+    return temp_video_path
+
+
+async def save_upload(video_file: UploadFile) -> tuple[str, str]:
+    """
+    Сохраняет UploadFile во временный файл, за тот же проход считая sha256.
+
+    Возвращает:
+        temp_video_path: путь к временному файлу (удаляет вызывающий или extract_*_from_path)
+        sha256: hex-хэш содержимого (ключ кэша транскриптов)
+    """
+    hasher = hashlib.sha256()
+    temp_video_path = await _save_upload_to_temp(video_file, hasher)
+    return temp_video_path, hasher.hexdigest()
+
+
+async def extract_audio_from_path(
+    video_path: str,
+    delete_original: bool = False,
+    target_lufs: Optional[float] = None,
+) -> tuple[str, Optional[float], int]:
+    """
+    Асинхронная обертка для извлечения аудио из локального файла.
+    target_lufs — если задан, громкость нормализуется в том же проходе ffmpeg.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        FFMPEG_POOL,
+        _blocking_extract_audio,
+        video_path,
+        delete_original,
+        target_lufs
+    )
+
+
+async def probe_duration(video_path: str) -> Optional[float]:
+    """Длительность файла по ffprobe в пуле ffmpeg (None, если узнать не удалось)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(FFMPEG_POOL, _probe_duration, video_path)
+
+
+async def extract_pcm_from_path(
+    video_path: str,
+    delete_original: bool = False,
+    target_lufs: Optional[float] = None,
+    duration_sec: Optional[float] = None,
+) -> tuple[np.ndarray, Optional[float], int]:
+    """
+    Асинхронная обертка для извлечения PCM (float32, 16kHz mono) из локального файла в память.
+    target_lufs — если задан, громкость нормализуется в том же проходе ffmpeg.
+    duration_sec — если уже известна (probe_duration при постановке job), ffprobe не запускается.
+
+    Длинные файлы (от AUDIO_PARALLEL_EXTRACT_MIN_SEC) декодируются параллельно по отрезкам.
+    С loudnorm режем нельзя: фильтр считал бы громкость каждого отрезка отдельно.
+    """
+    loop = asyncio.get_running_loop()
+
+    if target_lufs is None and config.AUDIO_PARALLEL_EXTRACT_SLICES > 1:
+        if duration_sec is None:
+            duration_sec = await probe_duration(video_path)
+        if duration_sec and duration_sec >= config.AUDIO_PARALLEL_EXTRACT_MIN_SEC:
+            return await _extract_pcm_sliced(video_path, duration_sec, delete_original)
+
+    return await loop.run_in_executor(
+        FFMPEG_POOL,
+        _blocking_extract_pcm,
+        video_path,
+        delete_original,
+        target_lufs,
+        duration_sec
+    )
+
+
+async def extract_audio(video_file: UploadFile) -> tuple[str, Optional[float], int]:
+    """
+    Извлекает аудио из видеофайла и сохраняет его как временный WAV-файл (16kHz mono).
+
+    Возвращает:
+        audio_output_path: путь к временномy .wav
+        duration_sec: длительность исходного видео (если удалось узнать), иначе None
+        ffmpeg_ms: время работы ffmpeg в миллисекундах
+    """
+    temp_video_path = await _save_upload_to_temp(video_file)
+
     # здесь ffmpeg/probe загоняем в отдельный поток
     loop = asyncio.get_running_loop()
     audio_output_path, duration_sec, ffmpeg_ms = await loop.run_in_executor(
@@ -105,3 +318,16 @@ async def extract_audio(video_file: UploadFile) -> tuple[str, Optional[float], i
     )
 
     return audio_output_path, duration_sec, ffmpeg_ms
+
+
+async def extract_pcm(video_file: UploadFile) -> tuple[np.ndarray, Optional[float], int]:
+    """
+    Извлекает аудио из видеофайла сразу в память (float32, 16kHz mono), без временного WAV.
+
+    Возвращает:
+        samples: numpy-массив float32
+        duration_sec: длительность исходного видео (если удалось узнать), иначе None
+        ffmpeg_ms: время работы ffmpeg в миллисекундах
+    """
+    temp_video_path = await _save_upload_to_temp(video_file)
+    return await extract_pcm_from_path(temp_video_path, delete_original=True)
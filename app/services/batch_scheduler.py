@@ -0,0 +1,154 @@
+"""
+Микро-батчинг между запросами.
+
+Провайдер сам по себе обрабатывает запросы по одному (один поток на модель),
+и под нагрузкой модель работает с batch_size=1. MicroBatcher собирает элементы
+(например, 30-секундные чанки аудио) от всех одновременных запросов: ждёт
+max_wait_ms после первого элемента или пока не наберётся max_batch_size,
+прогоняет пачку через batch_fn одним вызовом и раздаёт результаты обратно
+каждому вызывающему.
+"""
+import asyncio
+import concurrent.futures
+from typing import Any, Callable, Optional
+
+
+class MicroBatcher:
+    """
+    Args:
+        batch_fn: Блокирующая функция list[item] -> list[result] (тот же порядок)
+        executor: Где выполнять batch_fn (обычно executor провайдера, чтобы модель
+                  не вызывалась из двух потоков сразу)
+        max_batch_size: Максимум элементов в одном вызове batch_fn
+        max_wait_ms: Сколько ждать добора батча после первого элемента
+        name: Имя для логов
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], list],
+        executor: concurrent.futures.Executor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 30.0,
+        name: str = "batcher",
+    ):
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # элементы, которые фоновая задача уже забрала из очереди (набор / прогон батча)
+        self._current: list[tuple[Any, asyncio.Future]] = []
+
+        self._batches = 0
+        self._items = 0
+
+    def _ensure_started(self) -> None:
+        # очередь и фоновая задача создаются в работающем event loop при первом вызове
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._task = self._loop.create_task(self._run(), name=self._name)
+
+    async def submit(self, item: Any) -> Any:
+        """Ставит элемент в очередь и ждёт его результат."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def submit_many(self, items: list) -> list:
+        """Ставит все элементы запроса сразу (они могут попасть в один батч) и ждёт все результаты."""
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    async def _collect(self) -> list[tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = self._current = [await self._queue.get()]
+        deadline = loop.time() + self._max_wait
+
+        while len(batch) < self._max_batch_size:
+            # всё, что уже лежит в очереди, забираем без ожидания
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # запросы, которые уже отменили (клиент ушёл), не гоняем через модель
+        return [(item, fut) for item, fut in batch if not fut.cancelled()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._batch_fn, items)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._items += len(items)
+
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+            self._current = []
+
+    def close(self) -> None:
+        """
+        Останавливает фоновую задачу (например, при выгрузке модели); ждущие
+        вызовы submit() получают RuntimeError. Можно вызывать из любого потока:
+        остановка выполняется в event loop батчера.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._close()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._close)
+
+    def _close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+        error = RuntimeError(f"{self._name} closed")
+        pending, self._current = self._current, []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, fut in pending:
+            if not fut.done():
+                fut.set_exception(error)
+
+    def stats(self) -> dict:
+        """Счётчики для мониторинга: сколько батчей и средний размер батча."""
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
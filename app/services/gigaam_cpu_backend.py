@@ -0,0 +1,149 @@
+"""
+CPU-бэкенды для encoder'а GigaAM.
+
+На CPU eager PyTorch в fp32 слишком медленный для боевого трафика. Encoder
+(conformer, основная часть вычислений) можно заменить на:
+- "int8" — динамическая int8-квантизация nn.Linear средствами PyTorch;
+- "onnx" — экспорт в ONNX и инференс через onnxruntime (он уже стоит ради Silero VAD);
+- "onnx_int8" — то же, плюс динамическая int8-квантизация весов ONNX-модели.
+
+Препроцессор (mel) и декодер (CTC/RNNT head) остаются в PyTorch. Каждый бэкенд
+перед включением сверяется с fp32 (encoder_divergence) на контрольном батче
+(probe_batch): другой длины, чем вход экспорта, из нескольких сегментов разной
+длины с паддингом — как их присылает MicroBatcher. Так ловится трассировка,
+запомнившая batch, длину или маску паддинга. Если расхождение больше допуска —
+провайдер остаётся на fp32.
+"""
+import copy
+import os
+from typing import Callable
+
+import numpy as np
+import torch
+
+from app.core import config
+
+BACKENDS = ("fp32", "int8", "onnx", "onnx_int8")
+
+# (features, feature_lengths) -> (encoded, encoded_lengths), как у GigaAM encoder
+EncoderFn = Callable[[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]
+
+
+def quantize_encoder_int8(encoder: torch.nn.Module) -> torch.nn.Module:
+    """Копия encoder'а с int8-весами во всех nn.Linear (активации квантуются на лету)."""
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(encoder).eval(), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def export_encoder_onnx(
+    encoder: torch.nn.Module,
+    features: torch.Tensor,
+    lengths: torch.Tensor,
+    path: str,
+    quantize: bool = False,
+) -> str:
+    """
+    Экспортирует encoder в ONNX с динамическими batch/time осями.
+    Уже экспортированный файл переиспользуется. Возвращает путь к модели.
+    """
+    target = path.replace(".onnx", ".int8.onnx") if quantize else path
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not os.path.exists(path):
+        with torch.inference_mode():
+            torch.onnx.export(
+                encoder.eval(),
+                (features, lengths),
+                path,
+                input_names=["features", "feature_lengths"],
+                output_names=["encoded", "encoded_lengths"],
+                dynamic_axes={
+                    "features": {0: "batch", 2: "time"},
+                    "feature_lengths": {0: "batch"},
+                    "encoded": {0: "batch", 2: "time_out"},
+                    "encoded_lengths": {0: "batch"},
+                },
+                opset_version=17,
+            )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(path, target, weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxEncoder:
+    """Encoder через onnxruntime с интерфейсом GigaAM encoder'а (torch in / torch out)."""
+
+    def __init__(self, path: str, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, features: torch.Tensor, lengths: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        encoded, encoded_lengths = self._session.run(
+            None,
+            {
+                "features": features.detach().cpu().numpy().astype(np.float32),
+                "feature_lengths": lengths.detach().cpu().numpy().astype(np.int64),
+            },
+        )
+        return torch.from_numpy(encoded), torch.from_numpy(encoded_lengths)
+
+
+def probe_signal(seconds: float = 8.0, seed: int = 0) -> np.ndarray:
+    """
+    Детерминированный контрольный сигнал для сверки бэкендов: гармоники с
+    плавающим тоном и амплитудной модуляцией "по слогам" плюс немного шума.
+    """
+    sr = config.AUDIO_SAMPLE_RATE
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 140 + 40 * np.sin(2 * np.pi * (0.7 + 0.1 * seed) * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * (4 + seed) * t)) ** 2
+    noise = np.random.default_rng(seed).normal(0, 0.02, t.size)
+    return (0.1 * voiced * envelope + noise).astype(np.float32)
+
+
+def probe_batch(seconds: tuple[float, ...] = (11.0, 3.5, 6.0)) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Контрольный батч для encoder_divergence: сигналы разной длины (не 8 с, как
+    при экспорте), дополненные нулями до самого длинного, и их реальные длины.
+    """
+    signals = [probe_signal(s, seed=i + 1) for i, s in enumerate(seconds)]
+    lengths = [signal.size for signal in signals]
+    batch = np.zeros((len(signals), max(lengths)), dtype=np.float32)
+    for i, signal in enumerate(signals):
+        batch[i, :signal.size] = signal
+    return torch.from_numpy(batch), torch.tensor(lengths)
+
+
+def encoder_divergence(
+    reference: EncoderFn,
+    candidate: EncoderFn,
+    features: torch.Tensor,
+    lengths: torch.Tensor,
+) -> float:
+    """
+    Относительная L2-ошибка выхода candidate против fp32 reference. Сравниваются
+    только кадры в пределах encoded_lengths: паддинг декодер не читает.
+    """
+    with torch.inference_mode():
+        ref, ref_len = reference(features, lengths)
+        out, out_len = candidate(features, lengths)
+    ref_len, out_len = ref_len.cpu(), out_len.cpu()
+    if ref.shape != out.shape or not torch.equal(ref_len, out_len):
+        return float("inf")
+    mask = (torch.arange(ref.shape[-1]) < ref_len.unsqueeze(1)).unsqueeze(1)
+    ref = ref.float().cpu() * mask
+    out = out.float().cpu() * mask
+    return float(torch.linalg.vector_norm(out - ref) / torch.linalg.vector_norm(ref).clamp_min(1e-8))
@@ -1,10 +1,33 @@
 import os
 import asyncio
+from typing import AsyncIterator
 import concurrent.futures
+import threading
+import numpy as np
 import torch
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 
 from app.core import config
-from app.services.stt_provider import STTProvider, TranscriptionResult
+from app.services.batch_scheduler import MicroBatcher
+from app.services.model_manager import model_manager
+from app.services.gigaam_cpu_backend import (
+    BACKENDS,
+    OnnxEncoder,
+    encoder_divergence,
+    export_encoder_onnx,
+    probe_batch,
+    probe_signal,
+    quantize_encoder_int8,
+)
+from app.services.stt_provider import (
+    STTProvider,
+    TranscriptionOptions,
+    TranscriptionResult,
+    TranscriptionSegment,
+    read_wav,
+    to_model_rate,
+    warmup_signal,
+)
 
 
 class GigaAMProvider(STTProvider):
@@ -13,6 +36,12 @@ class GigaAMProvider(STTProvider):
     """
     
     MODEL_ID = "ai-sage/GigaAM-v3"
+
+    # GigaAM.transcribe принимает не больше 25 секунд аудио,
+    # поэтому массив режем на окна с запасом
+    MAX_WINDOW_SEC = 22.0
+    # в последних секундах окна ищем самый тихий кадр, чтобы не резать слово
+    SPLIT_SEARCH_SEC = 3.0
     
     def __init__(self, model_variant: str | None = None):
         """Args:
@@ -22,9 +51,64 @@ class GigaAMProvider(STTProvider):
         self._model = None
         self._model_variant = model_variant or getattr(config, 'GIGAAM_MODEL_VARIANT', 'e2e_rnnt')
         self._device = "cuda" if torch.cuda.is_available() else "cpu"
-    
+        self._load_lock = threading.Lock()
+
+        # Один поток на модель на всё время жизни провайдера: в нём и загрузка,
+        # и инференс, event loop не блокируется
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="gigaam")
+
+        # Сегменты (по VAD) от всех одновременных запросов идут через encoder
+        # одним паддированным батчем до GIGAAM_BATCH_SIZE штук
+        self._vad_enabled = os.getenv("GIGAAM_VAD", "1") == "1"
+        self._batcher = MicroBatcher(
+            self._blocking_transcribe_segments,
+            self._pool,
+            max_batch_size=int(os.getenv("GIGAAM_BATCH_SIZE", "8")),
+            max_wait_ms=float(os.getenv("GIGAAM_BATCH_WAIT_MS", "10")),
+            name="gigaam-batcher",
+        )
+
+        # Бэкенд encoder'а на CPU (см. gigaam_cpu_backend): fp32 | int8 | onnx | onnx_int8.
+        # Включается только если на контрольном сигнале расхождение с fp32
+        # не больше GIGAAM_ACCURACY_TOLERANCE (относительная L2-ошибка выхода encoder'а).
+        self._cpu_backend = os.getenv("GIGAAM_CPU_BACKEND", "fp32").lower()
+        if self._cpu_backend not in BACKENDS:
+            raise ValueError(f"GIGAAM_CPU_BACKEND={self._cpu_backend}, поддерживаются: {', '.join(BACKENDS)}")
+        self._accuracy_tolerance = float(os.getenv("GIGAAM_ACCURACY_TOLERANCE", "0.1"))
+        self._onnx_dir = os.getenv("GIGAAM_ONNX_DIR", "/tmp/gigaam_onnx")
+        self._cpu_threads = int(os.getenv("GIGAAM_CPU_THREADS", "0"))
+        self._encoder = None  # None — штатный asr.forward
+
     def _load_model(self) -> None:
         """Ленивая :) загрузка модели GigaAM-v3."""
+        self._loaded()
+
+    def _loaded(self) -> tuple:
+        """
+        (модель, ONNX-encoder или None) для вызова в потоке модели. Если менеджер
+        выгрузил модель, пока запрос ждал в батчере или executor'е, она грузится снова.
+        """
+        with self._load_lock:
+            if self._model is None:
+                with model_manager.loading(self.manager_key):
+                    self._load_model_locked()
+            return self._model, self._encoder
+
+    def unload(self) -> None:
+        """
+        Выгружает модель (вызывается менеджером моделей). Батчер не останавливается:
+        батчи, поставленные до выгрузки, загрузят модель заново (см. _loaded).
+        """
+        with self._load_lock:
+            self._model = None
+            self._encoder = None
+
+    async def _ensure_loaded(self) -> None:
+        """Загрузка (со скачиванием весов) в потоке модели, а не в event loop."""
+        if self._model is None:
+            await asyncio.get_running_loop().run_in_executor(self._pool, self._load_model)
+
+    def _load_model_locked(self) -> None:
         if self._model is None:
             from transformers import AutoModel
             
@@ -41,11 +125,65 @@ class GigaAMProvider(STTProvider):
             
             if self._device == "cuda":
                 self._model = self._model.cuda()
+            elif self._cpu_backend != "fp32":
+                self._setup_cpu_backend()
             
             print("[GigaAMProvider] Модель успешно загружена.")
+
+    def _setup_cpu_backend(self) -> None:
+        """
+        Собирает int8/ONNX encoder и включает его, если он сходится с fp32.
+        ONNX трассируется на одном сигнале, а сверяется на другом входе —
+        паддированном батче сегментов разной длины (probe_batch).
+        """
+        asr = self._asr()
+        wav = torch.from_numpy(probe_signal()).unsqueeze(0)
+        length = torch.full([1], wav.shape[-1])
+        with torch.inference_mode():
+            features, feature_lengths = asr.preprocessor(wav, length)
+            check_features, check_lengths = asr.preprocessor(*probe_batch())
+
+        try:
+            if self._cpu_backend == "int8":
+                encoder = quantize_encoder_int8(asr.encoder)
+            else:
+                path = export_encoder_onnx(
+                    asr.encoder,
+                    features,
+                    feature_lengths,
+                    os.path.join(self._onnx_dir, f"{self._model_variant}.encoder.onnx"),
+                    quantize=self._cpu_backend == "onnx_int8",
+                )
+                encoder = OnnxEncoder(path, threads=self._cpu_threads)
+        except Exception as e:
+            print(f"[GigaAMProvider] WARNING: бэкенд {self._cpu_backend} не собрался ({e}), остаёмся на fp32")
+            return
+
+        divergence = encoder_divergence(asr.encoder, encoder, check_features, check_lengths)
+        print(f"[GigaAMProvider] {self._cpu_backend} vs fp32: relative error {divergence:.4f}")
+        if divergence > self._accuracy_tolerance:
+            print(
+                f"[GigaAMProvider] WARNING: ошибка {self._cpu_backend} выше допуска "
+                f"{self._accuracy_tolerance}, остаёмся на fp32"
+            )
+            return
+
+        if self._cpu_backend == "int8":
+            # квантованный encoder подменяем в самой модели — им пользуется и transcribe_longform
+            asr.encoder = encoder
+        else:
+            self._encoder = encoder
+
+    @staticmethod
+    def _encode(asr, encoder, wav: torch.Tensor, length: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        if encoder is None:
+            return asr.forward(wav, length)
+        features, feature_lengths = asr.preprocessor(wav, length)
+        return encoder(features, feature_lengths)
     
     def _blocking_transcribe(self, audio_path: str) -> dict:
-        transcription = self._model.transcribe_longform(audio_path)
+        model, _ = self._loaded()
+        transcription = model.transcribe_longform(audio_path)
         
         if isinstance(transcription, list):
             texts = []
@@ -64,30 +202,175 @@ class GigaAMProvider(STTProvider):
             "transcript": text,
         }
     
-    async def transcribe(self, audio_path: str) -> TranscriptionResult:
+    def _asr(self, model=None):
+        """Внутренняя GigaAMASR-модель (HF-обёртка хранит её в атрибуте model)."""
+        model = self._model if model is None else model
+        return getattr(model, "model", model)
 
-        self._load_model()
-        
-        loop = asyncio.get_event_loop()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
-            try:
-                result = await loop.run_in_executor(
-                    pool, 
-                    self._blocking_transcribe, 
-                    audio_path
-                )
-            finally:
-                # Удаляем временный файл после обработки
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
+    def _split_windows(self, samples: np.ndarray, start: int = 0, end: int | None = None) -> list[tuple[int, int]]:
+        """
+        Режет samples[start:end] на окна не длиннее MAX_WINDOW_SEC по минимуму энергии.
+        Возвращает границы окон (в отсчётах от начала samples).
+        """
+        sr = config.AUDIO_SAMPLE_RATE
+        max_len = int(self.MAX_WINDOW_SEC * sr)
+        search = int(self.SPLIT_SEARCH_SEC * sr)
+        frame = sr // 50  # 20 мс
+        end = samples.size if end is None else end
+
+        windows: list[tuple[int, int]] = []
+        while end - start > max_len:
+            lo = start + max_len - search
+            region = samples[lo:start + max_len]
+            n_frames = region.size // frame
+            energy = np.square(region[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+            cut = lo + int(np.argmin(energy)) * frame + frame // 2
+            windows.append((start, cut))
+            start = cut
+
+        if end > start:
+            windows.append((start, end))
+        return windows
+
+    def _segments(self, samples: np.ndarray) -> list[tuple[int, int]]:
+        """
+        Границы сегментов речи для батча: по Silero VAD (тишина выкидывается, соседние
+        участки склеиваются, пока влезают в MAX_WINDOW_SEC), без VAD — окна по энергии.
+        """
+        if not self._vad_enabled:
+            return self._split_windows(samples)
+
+        max_len = int(self.MAX_WINDOW_SEC * config.AUDIO_SAMPLE_RATE)
+        timestamps = get_speech_timestamps(samples, VadOptions(max_speech_duration_s=self.MAX_WINDOW_SEC))
+
+        spans: list[tuple[int, int]] = []
+        for ts in timestamps:
+            if spans and ts["end"] - spans[-1][0] <= max_len:
+                spans[-1] = (spans[-1][0], ts["end"])
+            else:
+                spans.append((ts["start"], ts["end"]))
+
+        segments = []
+        for start, end in spans:
+            # на случай, если VAD всё же отдал сегмент длиннее окна
+            segments.extend(self._split_windows(samples, start, end))
+        return segments
+
+    def _blocking_transcribe_segments(self, segments: list[np.ndarray]) -> list[str]:
+        """
+        Один проход encoder+decoder по пачке сегментов (возможно, от разных запросов):
+        сегменты дополняются нулями до самого длинного, реальные длины идут в length.
+        """
+        model, encoder = self._loaded()
+        asr = self._asr(model)
+        device = torch.device(self._device)
+
+        lengths = [seg.size for seg in segments]
+        batch = np.zeros((len(segments), max(lengths)), dtype=np.float32)
+        for i, seg in enumerate(segments):
+            batch[i, :seg.size] = seg
+
+        with torch.inference_mode():
+            wav = torch.from_numpy(batch).to(device)
+            length = torch.tensor(lengths, device=device)
+            encoded, encoded_len = self._encode(asr, encoder, wav, length)
+            texts = asr.decoding.decode(asr.head, encoded, encoded_len)
+
+        return [(text or "").strip() for text in texts]
+
+    async def transcribe(
+        self,
+        audio_path: str,
+        options: TranscriptionOptions | None = None,
+    ) -> TranscriptionResult:
+
+        try:
+            await self._ensure_loaded()
+
+            if self._encoder is not None:
+                # transcribe_longform ходит в штатный encoder модели и обошёл бы
+                # ONNX-бэкенд — путь к файлу идёт тем же путём, что и массив
+                samples, sample_rate = await asyncio.to_thread(read_wav, audio_path)
+                return await self.transcribe_array(samples, sample_rate, options)
+
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                self._pool,
+                self._blocking_transcribe,
+                audio_path
+            )
+        finally:
+            # Удаляем временный файл после обработки
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
         
         return TranscriptionResult(
             language=result["language"],
             transcript=result["transcript"],
             provider=self.get_name()
         )
+
+    async def transcribe_array(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: TranscriptionOptions | None = None,
+    ) -> TranscriptionResult:
+        audio = to_model_rate(samples, sample_rate)
+        if audio.size == 0:
+            return TranscriptionResult(language="ru", transcript="", provider=self.get_name())
+
+        await self._ensure_loaded()
+
+        # VAD — вне потока модели, чтобы не задерживать батчи
+        spans = await asyncio.to_thread(self._segments, audio)
+        texts = await self._batcher.submit_many([audio[start:end] for start, end in spans])
+
+        return TranscriptionResult(
+            language="ru",
+            transcript=" ".join(t for t in texts if t),
+            provider=self.get_name()
+        )
     
+    async def transcribe_stream(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: TranscriptionOptions | None = None,
+    ) -> AsyncIterator[TranscriptionSegment]:
+        """
+        Все сегменты сразу уходят в батчер, результаты отдаются по порядку,
+        как только готов очередной батч.
+        """
+        audio = to_model_rate(samples, sample_rate)
+        if audio.size == 0:
+            return
+
+        await self._ensure_loaded()
+
+        sr = config.AUDIO_SAMPLE_RATE
+        spans = await asyncio.to_thread(self._segments, audio)
+        tasks = [
+            asyncio.ensure_future(self._batcher.submit(audio[start:end]))
+            for start, end in spans
+        ]
+        try:
+            for (start, end), task in zip(spans, tasks):
+                text = await task
+                if text:
+                    yield TranscriptionSegment(start=start / sr, end=end / sr, text=text)
+        finally:
+            # клиент ушёл — ещё не обработанные сегменты батчер пропустит
+            for task in tasks:
+                task.cancel()
+
+    async def warmup(self) -> None:
+        """Прогон синтетики через encoder/decoder напрямую (в обход VAD)."""
+        await self._ensure_loaded()
+        await asyncio.get_running_loop().run_in_executor(
+            self._pool, self._blocking_transcribe_segments, [warmup_signal()]
+        )
+
     def get_name(self) -> str:
         """Возвращает имя провайдера."""
         return "gigaam"
@@ -104,17 +387,26 @@ class GigaAMProvider(STTProvider):
         """Проверяет, загружена ли модель."""
         return self._model is not None
 
-
-# Глобальный экземпляр для переиспользования (синглтон называтся)
-_gigaam_provider: GigaAMProvider | None = None
+    def get_decoding_params(self, options: TranscriptionOptions | None = None) -> dict:
+        """
+        Сегментация и бэкенд encoder'а влияют на текст — учитываем в ключе кэша.
+        Бэкенд — настроенный, а не включившийся после сверки с fp32: иначе ключ
+        (и отпечаток чекпоинтов) менялся бы после каждой выгрузки и загрузки модели.
+        """
+        params = {
+            "vad": self._vad_enabled,
+            "max_window_sec": self.MAX_WINDOW_SEC,
+            "cpu_backend": self._cpu_backend,
+        }
+        if self._cpu_backend != "fp32":
+            params["accuracy_tolerance"] = self._accuracy_tolerance
+        return params
 
 
-def get_gigaam_provider() -> GigaAMProvider:
+def get_gigaam_provider(model_variant: str | None = None) -> GigaAMProvider:
     """
-    Возвращает глобальный экземпляр GigaAMProvider.
-    
+    Возвращает экземпляр GigaAMProvider для варианта модели
+    (по умолчанию GIGAAM_MODEL_VARIANT), один на вариант.
     """
-    global _gigaam_provider
-    if _gigaam_provider is None:
-        _gigaam_provider = GigaAMProvider()
-    return _gigaam_provider
+    model_variant = model_variant or getattr(config, 'GIGAAM_MODEL_VARIANT', 'e2e_rnnt')
+    return model_manager.get(f"gigaam:{model_variant}", lambda: GigaAMProvider(model_variant))
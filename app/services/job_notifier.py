@@ -1,3 +1,4 @@
+import asyncio
 import os
 import socket
 import requests
@@ -20,3 +21,10 @@ def notify_orchestrator(job_id: str, step: str, status: str, error: str = None,
         }, timeout=2)
     except Exception:
         pass
+
+
+async def notify_orchestrator_async(job_id: str, step: str, status: str, error: str = None, data: dict = None):
+    """notify_orchestrator для корутин: HTTP-запрос уходит в поток и не блокирует event loop."""
+    if not ORCHESTRATOR_JOB_URL:
+        return
+    await asyncio.to_thread(notify_orchestrator, job_id, step, status, error, data)
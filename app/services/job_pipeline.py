@@ -0,0 +1,120 @@
+"""
+Конвейер стадий воркера jobs.
+
+Job проходит стадии по очереди (извлечение -> нормализация -> VAD -> распознавание
+-> ключевые слова -> финализация), но разные jobs находятся на разных стадиях
+одновременно: пока одна распознаётся на GPU, следующая уже извлекается ffmpeg'ом
+на CPU. У каждой стадии свой лимит параллельности, между стадиями — очереди
+ограниченного размера: если медленная стадия не успевает, предыдущие ждут,
+а не копят в памяти декодированное аудио. Пропускная способность стремится к
+скорости самой медленной стадии, а не к сумме всех.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+
+@dataclass
+class Stage:
+    """
+    Стадия конвейера.
+
+    Attributes:
+        name: имя стадии (для статистики и ошибок)
+        fn: async fn(item) — обрабатывает элемент (меняет его на месте)
+        concurrency: сколько элементов стадия обрабатывает одновременно
+    """
+    name: str
+    fn: Callable[[Any], Awaitable[None]]
+    concurrency: int = 1
+
+
+class StagePipeline:
+    """
+    Стадии, соединённые очередями размера queue_size.
+
+    on_error(item, stage_name, exc) вызывается, если стадия упала (следующие
+    стадии для элемента не выполняются); on_done(item) — по выходе элемента из
+    конвейера в любом случае (успех или ошибка).
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        queue_size: int = 1,
+        on_done: Optional[Callable[[Any], Awaitable[None]]] = None,
+        on_error: Optional[Callable[[Any, str, Exception], Awaitable[None]]] = None,
+    ):
+        self.stages = stages
+        self._queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self._on_done = on_done
+        self._on_error = on_error
+        self._tasks: list[asyncio.Task] = []
+        self._busy = {stage.name: 0 for stage in stages}
+        self._processed = {stage.name: 0 for stage in stages}
+        self._failed = {stage.name: 0 for stage in stages}
+
+    def start(self) -> None:
+        for index, stage in enumerate(self.stages):
+            for n in range(max(1, stage.concurrency)):
+                self._tasks.append(asyncio.create_task(self._run(index), name=f"stage-{stage.name}-{n}"))
+
+    async def submit(self, item: Any) -> None:
+        """Кладёт элемент в первую стадию; ждёт, пока в её очереди есть место."""
+        await self._queues[0].put(item)
+
+    async def join(self) -> None:
+        """Ждёт, пока все отправленные элементы пройдут конвейер."""
+        for queue in self._queues:
+            await queue.join()
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _callback(self, fn, *args) -> None:
+        if fn is None:
+            return
+        try:
+            await fn(*args)
+        except Exception as e:
+            print(f"[Pipeline] callback error: {e}")
+
+    async def _run(self, index: int) -> None:
+        stage = self.stages[index]
+        queue = self._queues[index]
+        while True:
+            item = await queue.get()
+            try:
+                self._busy[stage.name] += 1
+                try:
+                    await stage.fn(item)
+                except Exception as e:
+                    self._failed[stage.name] += 1
+                    await self._callback(self._on_error, item, stage.name, e)
+                    await self._callback(self._on_done, item)
+                    continue
+                finally:
+                    self._busy[stage.name] -= 1
+                self._processed[stage.name] += 1
+                if index + 1 < len(self.stages):
+                    await self._queues[index + 1].put(item)
+                else:
+                    await self._callback(self._on_done, item)
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Загрузка стадий: сколько обрабатывается, ждёт в очереди, пройдено, упало."""
+        return {
+            stage.name: {
+                "concurrency": max(1, stage.concurrency),
+                "busy": self._busy[stage.name],
+                "queued": self._queues[index].qsize(),
+                "processed": self._processed[stage.name],
+                "failed": self._failed[stage.name],
+            }
+            for index, stage in enumerate(self.stages)
+        }
@@ -1,17 +1,59 @@
 import json
-from dataclasses import dataclass, asdict, field
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timezone
 from typing import Optional
 
-from app.services.redis_client import redis_client
+try:
+    import orjson
+except ImportError:  # orjson — необязательное ускорение, без него обычный json
+    orjson = None
 
+from app.core import config
+from app.services.redis_client import async_redis_client, redis_client
+
+# Очередь вне расписания: прерванные jobs (reaper) и jobs старого формата — выдаются первыми
 QUEUE_KEY = "jobs:queue"
-DATA_KEY = "jobs:data"
+# Расписание: на класс приоритета — zset арендаторов (user:<id> / channel:<name>)
+# jobs:tenants:<priority> -> виртуальное время, у каждого арендатора своя очередь
+# jobs:queue:<priority>:<tenant> (zset job_id -> время постановки или ожидаемая длительность).
+# Воркеры ждут новых jobs на списке-сигнале jobs:wakeup
+TENANTS_PREFIX = "jobs:tenants"
+VTIME_PREFIX = "jobs:vtime"
+WAKEUP_KEY = "jobs:wakeup"
+JOB_PREFIX = "jobs:job"  # hash с полями job: jobs:job:<job_id>
+EVENTS_PREFIX = "jobs:events"  # список событий job (последние JOB_EVENTS_MAX): jobs:events:<job_id>
 INDEX_KEY = "jobs:index"  # список последних job_id
+CHECKPOINT_PREFIX = "jobs:checkpoint"  # hash готовых кусков длинной job
+REQUEUE_LOCK_KEY = "jobs:requeue-lock"
+REAPER_LOCK_KEY = "jobs:reaper-lock"
+# Взятые воркером jobs: список jobs:processing:<worker_id> (переносятся туда атомарно) и
+# zset аренд jobs:inflight (job_id -> unix-время, до которого воркер её держит)
+PROCESSING_PREFIX = "jobs:processing"
+INFLIGHT_KEY = "jobs:inflight"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Старый формат: вся job одним JSON в общем hash; читается и переносится в новый при первом обращении
+LEGACY_DATA_KEY = "jobs:data"
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+
+def _dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _loads(data: str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 @dataclass
 class Job:
     job_id: str
@@ -26,62 +68,646 @@ class Job:
     result: Optional[dict] = None
     error: Optional[str] = None
     events: list[dict] = field(default_factory=list)
+    content_sha256: Optional[str] = None
+    options: dict = field(default_factory=dict)  # TranscriptionOptions запроса
+    attempts: int = 0  # сколько раз job выдавалась воркеру
+    worker: Optional[str] = None  # воркер, который держит job сейчас
+    priority: str = config.JOB_DEFAULT_PRIORITY  # класс приоритета (JOB_PRIORITIES)
+    tenant: Optional[str] = None  # user:<user_id> или channel:<channel> — для справедливой очереди
+    duration_sec: Optional[float] = None  # длительность по ffprobe при постановке
+    fair_cost: Optional[float] = None  # цена job для арендатора: ожидаемые секунды / вес
+
+
+# Поля hash, которые хранятся сериализованными (остальные — строки как есть)
+_ENCODED_FIELDS = {"result", "options"}
+_INT_FIELDS = {"progress", "attempts"}
+_FLOAT_FIELDS = {"duration_sec", "fair_cost"}
+_HASH_FIELDS = [f.name for f in fields(Job) if f.name != "events"]
+
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_PREFIX}:{job_id}"
+
+
+def _events_key(job_id: str) -> str:
+    return f"{EVENTS_PREFIX}:{job_id}"
+
+
+def _tenants_key(priority: str) -> str:
+    return f"{TENANTS_PREFIX}:{priority}"
+
+
+def _tenant_queue_key(priority: str, tenant: str) -> str:
+    return f"{QUEUE_KEY}:{priority}:{tenant}"
+
+
+def tenant_of(channel: str, user_id: Optional[str]) -> str:
+    """Арендатор для справедливой очереди: пользователь, а без него — канал."""
+    return f"user:{user_id}" if user_id else f"channel:{channel}"
+
+
+def _processing_key(worker_id: str = WORKER_ID) -> str:
+    return f"{PROCESSING_PREFIX}:{worker_id}"
+
+
+def _event(step: str, status: str, message: str | None = None, ts_utc: str | None = None) -> dict:
+    return {"step": step, "status": status, "ts_utc": ts_utc or utc_now_iso(), "message": message}
+
+
+def _write(pipe, job_id: str, updates: dict, events: list[dict] = ()) -> None:
+    """
+    Кладёт в pipeline изменение полей job и новые события (без чтения job целиком).
+    None удаляет поле.
+    """
+    mapping, removed = {}, []
+    for name, value in updates.items():
+        if value is None:
+            removed.append(name)
+        elif name in _ENCODED_FIELDS:
+            mapping[name] = _dumps(value)
+        else:
+            mapping[name] = str(value)
+    if mapping:
+        pipe.hset(_job_key(job_id), mapping=mapping)
+    if removed:
+        pipe.hdel(_job_key(job_id), *removed)
+    if events:
+        pipe.rpush(_events_key(job_id), *(_dumps(e) for e in events))
+        pipe.ltrim(_events_key(job_id), -config.JOB_EVENTS_MAX, -1)
+
 
-def enqueue_job(job: Job) -> None:
+def _store(pipe, job: Job) -> None:
+    """Полная запись новой job: поля + её события."""
+    _write(pipe, job.job_id, {name: getattr(job, name) for name in _HASH_FIELDS}, job.events)
+
+
+def _decode(data: dict, events: list[str]) -> Job:
+    values = {}
+    for name, value in data.items():
+        if name not in _HASH_FIELDS:
+            continue
+        if name in _ENCODED_FIELDS:
+            value = _loads(value)
+        elif name in _INT_FIELDS:
+            value = int(value)
+        elif name in _FLOAT_FIELDS:
+            value = float(value)
+        values[name] = value
+    values.setdefault("callback_url", None)
+    return Job(events=[_loads(e) for e in events], **values)
+
+
+async def _migrate_legacy(job_id: str) -> Optional[Job]:
+    """Переносит job из старого формата (JSON в jobs:data) в hash + список событий."""
+    data = await async_redis_client.hget(LEGACY_DATA_KEY, job_id)
+    if not data:
+        return None
+    job = Job(**_loads(data))
+    pipe = async_redis_client.pipeline()
+    _store(pipe, job)
+    pipe.hdel(LEGACY_DATA_KEY, job_id)
+    await pipe.execute()
+    return job
+
+
+def _wakeup(pipe) -> None:
+    """Будит один ждущий воркер (сигналов копится не больше сотни)."""
+    pipe.lpush(WAKEUP_KEY, "1")
+    pipe.ltrim(WAKEUP_KEY, 0, 99)
+
+
+async def enqueue_job(job: Job) -> None:
+    """
+    Ставит job в очередь своего арендатора в классе приоритета job.priority.
+    Внутри арендатора порядок — по JOB_QUEUE_POLICY: fifo (время постановки) или
+    sjf (сначала короткие по duration_sec); между арендаторами — справедливое
+    разделение по секундам аудио (см. _DISPATCH).
+    """
     now = utc_now_iso()
     job.created_at = now
     job.updated_at = now
     job.status = "queued"
     job.step = "queued"
     job.progress = 1
-    job.events.append({"step": "job", "status": "CREATED", "ts_utc": now})
-
-    redis_client.hset(DATA_KEY, job.job_id, json.dumps(asdict(job)))
-    redis_client.lpush(QUEUE_KEY, job.job_id)
+    job.tenant = job.tenant or "channel:api"
+    cost = job.duration_sec or config.JOB_DEFAULT_COST_SEC
+    job.fair_cost = cost / max(config.JOB_FAIR_WEIGHTS.get(job.tenant, 1.0), 1e-3)
+    job.events.append(_event(
+        "job", "CREATED", f"priority={job.priority}, tenant={job.tenant}", ts_utc=now,
+    ))
+    score = cost if config.JOB_QUEUE_POLICY == "sjf" else time.time()
 
+    # арендатор без очереди встаёт в расписание с текущим виртуальным временем
+    # класса: простой не копит ему "кредит" против остальных
+    vtime = await async_redis_client.get(f"{VTIME_PREFIX}:{job.priority}")
+    pipe = async_redis_client.pipeline()
+    _store(pipe, job)
+    pipe.zadd(_tenant_queue_key(job.priority, job.tenant), {job.job_id: score})
+    pipe.zadd(_tenants_key(job.priority), {job.tenant: float(vtime or 0)}, nx=True)
+    _wakeup(pipe)
     # индекс последних jobs
-    redis_client.lpush(INDEX_KEY, job.job_id)
-    redis_client.ltrim(INDEX_KEY, 0, 99)  # храним последние 100
+    pipe.lpush(INDEX_KEY, job.job_id)
+    pipe.ltrim(INDEX_KEY, 0, 99)  # храним последние 100
+    await pipe.execute()
+
+
+async def store_done_job(job: Job, result: dict, message: str | None = None) -> None:
+    """
+    Сохраняет сразу завершённую job (например, результат из кэша транскриптов) —
+    без постановки в очередь воркеру.
+    """
+    now = utc_now_iso()
+    job.created_at = now
+    job.updated_at = now
+    job.status = "done"
+    job.step = "done"
+    job.progress = 100
+    job.result = result
+    job.events.append(_event("job", "CREATED", ts_utc=now))
+    job.events.append(_event("job", "DONE", message, ts_utc=now))
+
+    pipe = async_redis_client.pipeline()
+    _store(pipe, job)
+    pipe.lpush(INDEX_KEY, job.job_id)
+    pipe.ltrim(INDEX_KEY, 0, 99)
+    await pipe.execute()
+
+# Выбор следующей job:
+# 1. jobs:queue — прерванные и старые jobs, сразу;
+# 2. классы приоритета по порядку JOB_PRIORITIES (строго: низший класс ждёт,
+#    пока в высших пусто);
+# 3. внутри класса — арендатор с наименьшим виртуальным временем (start-time fair
+#    queuing): после выдачи его время растёт на fair_cost job, так что арендаторы
+#    получают воркеры поровну по секундам аудио (с учётом весов), а 200 длинных
+#    видео одного пользователя не задерживают остальных.
+# Кандидата выбирает _pick по снимку очередей, а _DISPATCH атомарно проверяет, что
+# он всё ещё первый (иначе 'retry'), переносит job в список jobs:processing воркера
+# и в том же скрипте выдаёт ей аренду (jobs:inflight, поля worker / attempts): между
+# переносом и арендой не бывает момента, когда упавший воркер потеряет job. Все ключи,
+# которых касается скрипт, переданы в KEYS.
+# Job без данных (нет поля job_id — старый формат, ещё не перенесённый в hash) не
+# выдаётся и не трогается ('missing'): _dispatch переносит её и пробует снова, а если
+# переносить нечего — повторяет с ARGV[6] = 1, и скрипт убирает её из очереди ('dropped').
+#
+# KEYS: 1 jobs:queue, 2 jobs:processing:<worker>, 3 jobs:inflight, 4 jobs:job:<job_id>,
+#       5 очередь арендатора, 6 jobs:vtime:<класс>, 7.. jobs:tenants:<класс> по порядку JOB_PRIORITIES
+# ARGV: 1 job_id, 2 срок аренды, 3 worker, 4 номер класса (0 — job из jobs:queue),
+#       5 арендатор, 6 убрать job без данных
+_DISPATCH = async_redis_client.register_script("""
+local job_id, class, tenant = ARGV[1], tonumber(ARGV[4]), ARGV[5]
+local tenants
+if class == 0 then
+    if redis.call('LINDEX', KEYS[1], -1) ~= job_id then return {'retry'} end
+else
+    if redis.call('LLEN', KEYS[1]) > 0 then return {'retry'} end
+    for i = 1, class - 1 do
+        if redis.call('ZCARD', KEYS[6 + i]) > 0 then return {'retry'} end
+    end
+    tenants = KEYS[6 + class]
+    local head = redis.call('ZRANGE', tenants, 0, 0, 'WITHSCORES')
+    if #head == 0 or head[1] ~= tenant then return {'retry'} end
+    local first = redis.call('ZRANGE', KEYS[5], 0, 0)
+    if #first == 0 then
+        -- арендатор с пустой очередью: убираем из расписания
+        redis.call('ZREM', tenants, tenant)
+        return {'retry'}
+    end
+    if first[1] ~= job_id then return {'retry'} end
+end
+
+local exists = redis.call('HEXISTS', KEYS[4], 'job_id') == 1
+if not exists and ARGV[6] ~= '1' then
+    return {'missing', job_id}
+end
+
+local cost = 0
+if class == 0 then
+    redis.call('RPOP', KEYS[1])
+else
+    redis.call('ZREM', KEYS[5], job_id)
+    if exists then
+        cost = tonumber(redis.call('HGET', KEYS[4], 'fair_cost') or '1')
+    end
+    local vtime = tonumber(redis.call('ZSCORE', tenants, tenant))
+    redis.call('SET', KEYS[6], tostring(vtime))
+    if redis.call('ZCARD', KEYS[5]) > 0 then
+        redis.call('ZADD', tenants, tostring(vtime + cost), tenant)
+    else
+        redis.call('ZREM', tenants, tenant)
+    end
+end
+
+if not exists then
+    -- остатки без job_id (например, только worker/attempts) не читаются как job
+    redis.call('DEL', KEYS[4])
+    return {'dropped', job_id}
+end
+redis.call('LPUSH', KEYS[2], job_id)
+redis.call('ZADD', KEYS[3], ARGV[2], job_id)
+redis.call('HSET', KEYS[4], 'worker', ARGV[3])
+redis.call('HINCRBY', KEYS[4], 'attempts', 1)
+return {'leased', job_id}
+""")
+
+# Сколько раз _dispatch выбирает кандидата заново, пока другие воркеры забирают jobs из-под носа
+_DISPATCH_ATTEMPTS = 10
+
+
+async def _pick() -> Optional[tuple[int, str, str]]:
+    """
+    Кандидат для _DISPATCH по снимку очередей: (номер класса, арендатор, job_id),
+    номер класса 0 — jobs:queue. None — очереди пусты.
+    """
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.lindex(QUEUE_KEY, -1)
+    for priority in config.JOB_PRIORITIES:
+        pipe.zrange(_tenants_key(priority), 0, 0)
+    requeued, *heads = await pipe.execute()
+    if requeued:
+        return 0, "", requeued
+    for index, (priority, head) in enumerate(zip(config.JOB_PRIORITIES, heads), 1):
+        if head:
+            first = await async_redis_client.zrange(_tenant_queue_key(priority, head[0]), 0, 0)
+            return index, head[0], first[0] if first else ""
+    return None
+
+
+async def _dispatch() -> Optional[str]:
+    unknown: set[str] = set()  # jobs без данных, которые не удалось перенести из старого формата
+    for _ in range(_DISPATCH_ATTEMPTS):
+        candidate = await _pick()
+        if candidate is None:
+            return None
+        index, tenant, job_id = candidate
+        priority = config.JOB_PRIORITIES[index - 1] if index else config.JOB_DEFAULT_PRIORITY
+        status, *rest = await _DISPATCH(
+            keys=[
+                QUEUE_KEY, _processing_key(), INFLIGHT_KEY, _job_key(job_id),
+                _tenant_queue_key(priority, tenant), f"{VTIME_PREFIX}:{priority}",
+                *(_tenants_key(p) for p in config.JOB_PRIORITIES),
+            ],
+            args=[
+                job_id, time.time() + config.JOB_VISIBILITY_TIMEOUT_SEC, WORKER_ID,
+                index, tenant, int(job_id in unknown),
+            ],
+            client=async_redis_client,
+        )
+        if status == "leased":
+            return job_id
+        if status == "missing" and await _migrate_legacy(job_id) is None:
+            unknown.add(job_id)
+        elif status == "dropped":
+            print(f"Job {job_id} dropped from the queue: no job data")
+    return None
 
-def dequeue_job(timeout: int = 5) -> Optional[Job]:
-    result = redis_client.brpop(QUEUE_KEY, timeout=timeout)
-    if not result:
+
+async def dequeue_job(timeout: int = 5) -> Optional[Job]:
+    """
+    Берёт следующую по расписанию job (см. _DISPATCH) атомарно в список
+    jobs:processing этого воркера и выдаёт аренду на JOB_VISIBILITY_TIMEOUT_SEC.
+    Пока воркер жив, аренду продлевает renew_leases; после обработки job
+    снимается через ack_job. Если воркер пропал, reap_expired_jobs вернёт job
+    в очередь. Пустая очередь — ждём сигнала jobs:wakeup до timeout секунд.
+    """
+    job_id = await _dispatch()
+    if not job_id:
+        if not await async_redis_client.blpop(WAKEUP_KEY, timeout=timeout):
+            return None
+        job_id = await _dispatch()
+        if not job_id:
+            return None
+    job = await get_job(job_id)
+    if job is None:
+        # данные job истекли/удалены — в обработке держать нечего
+        await ack_job(job_id)
+    return job
+
+
+async def queue_position(job: Job) -> Optional[dict]:
+    """
+    Место ждущей job в расписании: сколько jobs арендатора впереди неё,
+    сколько арендаторов делят её класс и сколько jobs ждут в высших классах.
+    """
+    if job.status != "queued" or not job.tenant:
         return None
-    # result = (QUEUE_KEY, job_id)
-    return get_job(result[1])
-
-def get_job(job_id: str) -> Optional[Job]:
-    data = redis_client.hget(DATA_KEY, job_id)
-    return Job(**json.loads(data)) if data else None
-
-def update_job(job_id: str, **updates) -> None:
-    job = get_job(job_id)
-    if not job:
-        return
-
-    for k, v in updates.items():
-        setattr(job, k, v)
-    job.updated_at = utc_now_iso()
-    redis_client.hset(DATA_KEY, job_id, json.dumps(asdict(job)))
-
-def append_event(job_id: str, step: str, status: str, message: str | None = None) -> None:
-    job = get_job(job_id)
-    if not job:
-        return
-    job.events.append({
-        "step": step,
-        "status": status,
-        "ts_utc": utc_now_iso(),
-        "message": message
-    })
-    job.updated_at = utc_now_iso()
-    redis_client.hset(DATA_KEY, job_id, json.dumps(asdict(job)))
-
-def list_jobs(limit: int = 20) -> list[Job]:
-    ids = redis_client.lrange(INDEX_KEY, 0, max(0, limit - 1))
-    jobs: list[Job] = []
+    higher = []
+    if job.priority in config.JOB_PRIORITIES:
+        higher = config.JOB_PRIORITIES[:config.JOB_PRIORITIES.index(job.priority)]
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.zrank(_tenant_queue_key(job.priority, job.tenant), job.job_id)
+    pipe.zcard(_tenants_key(job.priority))
+    pipe.llen(QUEUE_KEY)
+    for priority in higher:
+        pipe.zcard(_tenants_key(priority))
+    rank, tenants, requeued, *higher_tenants = await pipe.execute()
+    if rank is None:
+        return None  # уже выдана воркеру или стоит в jobs:queue после прерывания
+    return {
+        "tenant_jobs_ahead": rank,
+        "tenants_in_class": tenants,
+        "requeued_jobs_ahead": requeued,
+        "tenants_in_higher_classes": sum(higher_tenants),
+    }
+
+# Аренда принадлежит воркеру из поля worker job: если reaper уже отдал job
+# другому воркеру, прежний не должен ни продлевать, ни снимать чужую аренду.
+_ACK = async_redis_client.register_script("""
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+if redis.call('HGET', KEYS[3], 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], 'worker')
+return 1
+""")
+
+# Продлевает аренду своих jobs; jobs, которые уже держит другой воркер (или
+# никто), убирает из своего списка jobs:processing и возвращает. Список читает
+# renew_leases, чтобы передать hash каждой job в KEYS; job, снятая с воркера
+# (ack_job) между чтением и скриптом, пропускается.
+# KEYS: 1 jobs:processing:<worker>, 2 jobs:inflight, 3.. jobs:job:<job_id>
+# ARGV: 1 срок аренды, 2 worker, 3.. job_id в том же порядке
+_RENEW = async_redis_client.register_script("""
+local lost = {}
+for i = 3, #ARGV do
+    local job_id = ARGV[i]
+    if redis.call('HGET', KEYS[i], 'worker') == ARGV[2] then
+        redis.call('ZADD', KEYS[2], 'XX', ARGV[1], job_id)
+    elseif redis.call('LREM', KEYS[1], 0, job_id) > 0 then
+        table.insert(lost, job_id)
+    end
+end
+return lost
+""")
+
+
+async def ack_job(job_id: str) -> bool:
+    """
+    Job обработана (успешно или с ошибкой): снимается с воркера и из аренд.
+    False — аренда уже не наша (job вернули в очередь и её держит другой воркер).
+    """
+    return bool(await _ACK(
+        keys=[_processing_key(), INFLIGHT_KEY, _job_key(job_id)], args=[job_id, WORKER_ID],
+        client=async_redis_client,
+    ))
+
+async def renew_leases() -> list[str]:
+    """
+    Продлевает аренду всех jobs, которые держит этот воркер. Возвращает jobs,
+    аренду которых воркер потерял (reaper отдал их другому) — их нужно бросить.
+    """
+    job_ids = await async_redis_client.lrange(_processing_key(), 0, -1)
+    if not job_ids:
+        return []
+    return await _RENEW(
+        keys=[_processing_key(), INFLIGHT_KEY, *(_job_key(job_id) for job_id in job_ids)],
+        args=[time.time() + config.JOB_VISIBILITY_TIMEOUT_SEC, WORKER_ID, *job_ids],
+        client=async_redis_client,
+    )
+
+async def get_job(job_id: str, with_events: bool = True) -> Optional[Job]:
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.hgetall(_job_key(job_id))
+    if with_events:
+        pipe.lrange(_events_key(job_id), 0, -1)
+    data, *events = await pipe.execute()
+    if "job_id" not in data:
+        # нет hash или в нём только служебные поля — job старого формата или её уже нет
+        return await _migrate_legacy(job_id)
+    return _decode(data, events[0] if events else [])
+
+async def update_job(job_id: str, *events: tuple, **updates) -> None:
+    """
+    Меняет поля job и добавляет события (каждое — (step, status[, message]))
+    за один запрос к Redis, не перечитывая job:
+        await update_job(job_id, ("extract_audio", "START"), step="extract_audio", progress=30)
+    """
+    now = utc_now_iso()
+    updates["updated_at"] = now
+    pipe = async_redis_client.pipeline()
+    _write(pipe, job_id, updates, [_event(*event, ts_utc=now) for event in events])
+    await pipe.execute()
+
+async def append_event(job_id: str, step: str, status: str, message: str | None = None) -> None:
+    await update_job(job_id, (step, status, message))
+
+async def list_jobs(limit: int = 20) -> list[Job]:
+    ids = await async_redis_client.lrange(INDEX_KEY, 0, max(0, limit - 1))
+    pipe = async_redis_client.pipeline(transaction=False)
     for jid in ids:
-        j = get_job(jid)
+        pipe.hgetall(_job_key(jid))
+    jobs: list[Job] = []
+    for jid, data in zip(ids, await pipe.execute()):
+        j = _decode(data, []) if "job_id" in data else await _migrate_legacy(jid)
         if j:
             jobs.append(j)
     return jobs
+
+
+class JobCheckpoint:
+    """
+    Готовые куски длинной job в Redis (hash jobs:checkpoint:<job_id>): поле "fingerprint"
+    и по полю "chunk:<номер>" на каждый распознанный кусок. Если воркер упал, job
+    после перезапуска распознаёт только недостающие куски.
+
+    fingerprint — отпечаток аудио и конфигурации (провайдер, параметры декодирования
+    и пайплайна): при другом отпечатке нарезка на куски могла измениться, и старые
+    куски не используются.
+    """
+
+    def __init__(self, job_id: str, fingerprint: str):
+        self.key = f"{CHECKPOINT_PREFIX}:{job_id}"
+        self.fingerprint = fingerprint
+
+    async def load(self) -> dict[int, dict]:
+        """Готовые куски по номеру (пусто, если чекпоинта нет или он от другой конфигурации)."""
+        data = await async_redis_client.hgetall(self.key)
+        if not data:
+            return {}
+        if data.get("fingerprint") != self.fingerprint:
+            await async_redis_client.delete(self.key)
+            return {}
+        return {
+            int(name.split(":", 1)[1]): _loads(value)
+            for name, value in data.items()
+            if name.startswith("chunk:")
+        }
+
+    async def save(self, index: int, chunk: dict) -> None:
+        pipe = async_redis_client.pipeline(transaction=False)
+        pipe.hset(self.key, mapping={"fingerprint": self.fingerprint, f"chunk:{index}": _dumps(chunk)})
+        pipe.expire(self.key, config.JOB_CHECKPOINT_TTL_SEC)
+        await pipe.execute()
+
+
+async def delete_checkpoint(job_id: str) -> None:
+    await async_redis_client.delete(f"{CHECKPOINT_PREFIX}:{job_id}")
+
+
+# Блокировки reaper'а и requeue_stale_jobs: SET NX EX с уникальным токеном. Снимает
+# блокировку только её владелец — если проход шёл дольше срока и блокировку уже взял
+# другой инстанс, чужую не удаляем.
+_RELEASE_LOCK = async_redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+async def _acquire_lock(key: str, ttl_sec: int = 60) -> Optional[str]:
+    token = uuid.uuid4().hex
+    return token if await async_redis_client.set(key, token, nx=True, ex=ttl_sec) else None
+
+
+async def _release_lock(key: str, token: str) -> None:
+    await _RELEASE_LOCK(keys=[key], args=[token], client=async_redis_client)
+
+
+# Снятие истёкшей аренды одной job. Скрипт заново проверяет, что аренда всё ещё
+# истекла, а worker / attempts те же, по которым reaper собрал событие: если
+# воркер успел продлить аренду (renew_leases) или job уже выдали заново — 'skip'.
+# KEYS: 1 jobs:inflight, 2 jobs:job:<job_id>, 3 jobs:events:<job_id>, 4 jobs:checkpoint:<job_id>,
+#       5 jobs:queue, 6 jobs:wakeup, 7 jobs:processing:<worker>
+# ARGV: 1 job_id, 2 сейчас (unix), 3 worker, 4 attempts, 5 'requeue' | 'fail',
+#       6 updated_at, 7 событие (JSON), 8 текст ошибки, 9 JOB_EVENTS_MAX
+_REAP = async_redis_client.register_script("""
+local job_id = ARGV[1]
+local deadline = redis.call('ZSCORE', KEYS[1], job_id)
+if not deadline or tonumber(deadline) > tonumber(ARGV[2]) then return 'skip' end
+local worker = redis.call('HGET', KEYS[2], 'worker') or ''
+if worker ~= ARGV[3] or (redis.call('HGET', KEYS[2], 'attempts') or '') ~= ARGV[4] then
+    return 'skip'
+end
+
+redis.call('ZREM', KEYS[1], job_id)
+if worker ~= '' then redis.call('LREM', KEYS[7], 1, job_id) end
+redis.call('HDEL', KEYS[2], 'worker')
+local status = redis.call('HGET', KEYS[2], 'status')
+if not status or status == 'done' or status == 'error' then
+    -- воркер успел завершить job, но не снял её; или job уже нет
+    return 'released'
+end
+
+redis.call('RPUSH', KEYS[3], ARGV[7])
+redis.call('LTRIM', KEYS[3], -tonumber(ARGV[9]), -1)
+if ARGV[5] == 'fail' then
+    redis.call('HSET', KEYS[2], 'status', 'error', 'step', 'error', 'progress', '100',
+        'error', ARGV[8], 'updated_at', ARGV[6])
+    redis.call('DEL', KEYS[4])
+    return 'failed'
+end
+redis.call('HSET', KEYS[2], 'status', 'queued', 'updated_at', ARGV[6])
+-- jobs:queue выдаётся раньше расписания — прерванная job пойдёт первой
+redis.call('RPUSH', KEYS[5], job_id)
+redis.call('LPUSH', KEYS[6], '1')
+redis.call('LTRIM', KEYS[6], 0, 99)
+return 'requeued'
+""")
+
+
+async def reap_expired_jobs(max_attempts: int) -> tuple[list[str], list[str]]:
+    """
+    Jobs с истёкшей арендой (воркер упал, завис, OOM, деплой) возвращаются в начало
+    очереди и продолжат с чекпоинта; job, выданная уже max_attempts раз, считается
+    ядовитой и помечается ошибкой. Возвращает (вернули в очередь, пометили ошибкой).
+    Одновременно с нескольких инстансов не выполняется.
+    """
+    token = await _acquire_lock(REAPER_LOCK_KEY)
+    if token is None:
+        return [], []
+
+    try:
+        requeued, failed = [], []
+        for job_id in await async_redis_client.zrangebyscore(INFLIGHT_KEY, "-inf", time.time()):
+            worker, attempts = await async_redis_client.hmget(_job_key(job_id), "worker", "attempts")
+            count = int(attempts or 0)
+            now = utc_now_iso()
+            if count >= max_attempts:
+                action, error = "fail", f"lease expired after {count} attempts"
+                event = _event("job", "ERROR", error, ts_utc=now)
+            else:
+                action, error = "requeue", ""
+                message = f"lease of {worker or 'unknown worker'} expired (attempt {count}/{max_attempts})"
+                event = _event("job", "REQUEUED", message, ts_utc=now)
+
+            outcome = await _REAP(
+                keys=[
+                    INFLIGHT_KEY, _job_key(job_id), _events_key(job_id), f"{CHECKPOINT_PREFIX}:{job_id}",
+                    QUEUE_KEY, WAKEUP_KEY, _processing_key(worker or ""),
+                ],
+                args=[
+                    job_id, time.time(), worker or "", attempts or "", action,
+                    now, _dumps(event), error, config.JOB_EVENTS_MAX,
+                ],
+                client=async_redis_client,
+            )
+            if outcome == "requeued":
+                requeued.append(job_id)
+            elif outcome == "failed":
+                failed.append(job_id)
+        return requeued, failed
+    finally:
+        await _release_lock(REAPER_LOCK_KEY, token)
+
+
+async def requeue_stale_jobs(stale_sec: float) -> list[str]:
+    """
+    Возвращает в очередь job, застрявшие в processing без аренды (взятые до
+    появления jobs:processing / jobs:inflight), если их не обновляли дольше
+    stale_sec. Встают в начало очереди и продолжат с чекпоинта.
+    Смотрит только последние jobs из jobs:index, а не все ключи jobs:job:*: у hash
+    jobs нет TTL, и полный SCAN на каждом старте воркера рос бы без предела.
+    Одновременно с нескольких инстансов не выполняется.
+    """
+    token = await _acquire_lock(REQUEUE_LOCK_KEY)
+    if token is None:
+        return []
+
+    try:
+        async for job_id, _ in async_redis_client.hscan_iter(LEGACY_DATA_KEY):
+            await _migrate_legacy(job_id)
+
+        job_ids = await async_redis_client.lrange(INDEX_KEY, 0, -1)
+        pipe = async_redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hmget(_job_key(job_id), "status", "updated_at")
+            pipe.zscore(INFLIGHT_KEY, job_id)
+        replies = await pipe.execute()
+
+        now = datetime.now(timezone.utc)
+        requeued = []
+        for job_id, (status, updated_at), lease in zip(job_ids, replies[::2], replies[1::2]):
+            if status != "processing" or not updated_at or lease is not None:
+                continue  # за jobs с арендой следит reap_expired_jobs
+            if (now - datetime.fromisoformat(updated_at)).total_seconds() < stale_sec:
+                continue
+            await update_job(job_id, ("job", "REQUEUED", f"stale for more than {stale_sec:.0f}s"), status="queued")
+            # jobs:queue выдаётся раньше расписания — прерванная job пойдёт первой
+            pipe = async_redis_client.pipeline()
+            pipe.rpush(QUEUE_KEY, job_id)
+            _wakeup(pipe)
+            await pipe.execute()
+            requeued.append(job_id)
+        return requeued
+    finally:
+        await _release_lock(REQUEUE_LOCK_KEY, token)
+
+
+# ===== Синхронное чтение — только для скриптов и отладки вне event loop =====
+
+def get_job_sync(job_id: str, with_events: bool = True) -> Optional[Job]:
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(_job_key(job_id))
+    if with_events:
+        pipe.lrange(_events_key(job_id), 0, -1)
+    data, *events = pipe.execute()
+    return _decode(data, events[0] if events else []) if "job_id" in data else None
+
+
+def list_jobs_sync(limit: int = 20) -> list[Job]:
+    ids = redis_client.lrange(INDEX_KEY, 0, max(0, limit - 1))
+    pipe = redis_client.pipeline(transaction=False)
+    for jid in ids:
+        pipe.hgetall(_job_key(jid))
+    return [_decode(data, []) for data in pipe.execute() if "job_id" in data]
@@ -1,111 +1,406 @@
 import asyncio
+import functools
+import hashlib
+import json
 import os
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Union
+
+import numpy as np
 import requests
 
-from app.services.job_store import dequeue_job, update_job, append_event
-from app.services.job_notifier import notify_orchestrator
-from app.services.audio_service import extract_audio_from_path
+from app.core import config
+from app.services import transcript_cache
+from app.services.job_pipeline import Stage, StagePipeline
+from app.services.job_store import (
+    Job,
+    JobCheckpoint,
+    ack_job,
+    delete_checkpoint,
+    dequeue_job,
+    reap_expired_jobs,
+    renew_leases,
+    requeue_stale_jobs,
+    update_job,
+)
+from app.services.job_notifier import notify_orchestrator_async
+from app.services.audio_service import extract_audio_from_path, extract_pcm_from_path
+from app.services.audio_preprocessing import normalize_pcm_loudness
 from app.services.stt_factory import get_stt_provider
-from app.services.audio_preprocessing import normalize_audio_loudness
+from app.services.longform import longform_params, transcribe_audio
+from app.services.stt_provider import TranscriptionOptions, TranscriptionResult
+from app.services.vad import SpeechMap, speech_stage, vad_params
 from app.services.keyword_extractor import extract_keywords_simple
+from app.services.model_manager import model_manager
+from app.services.stt_router import stt_router
 
 
-async def process_job(job):
-    update_job(job.job_id, status="processing", step="queued", progress=25)
-    append_event(job.job_id, "job", "PROCESSING")
-    notify_orchestrator(job.job_id, "PROCESSING", "IN_PROGRESS")
+def loudnorm_backend() -> str | None:
+    """
+    Чем нормализуется громкость в jobs:
+    - "native" — NumPy по PCM в памяти (нужен AUDIO_IN_MEMORY), пропускается, если громкость уже в допуске;
+    - "ffmpeg" — loudnorm в том же проходе ffmpeg, что и извлечение;
+    - None — нормализация выключена.
+    """
+    if not config.AUDIO_NORMALIZE_LOUDNESS:
+        return None
+    if config.AUDIO_LOUDNORM_BACKEND == "native" and config.AUDIO_IN_MEMORY:
+        return "native"
+    return "ffmpeg"
 
-    audio_path = None
-    normalized_path = None
-    try:
-        # 1) Extract audio
-        update_job(job.job_id, step="extract_audio", progress=30)
-        append_event(job.job_id, "extract_audio", "START")
-        audio_path, duration, _ = await extract_audio_from_path(job.file_path, delete_original=False)
-        append_event(job.job_id, "extract_audio", "DONE")
-
-        # 2) Normalize audio loudness (препроцессинг)
-        update_job(job.job_id, step="normalize_audio", progress=40)
-        append_event(job.job_id, "normalize_audio", "START")
-        loop = asyncio.get_running_loop()
-        normalized_path = await loop.run_in_executor(
-            None, normalize_audio_loudness, audio_path
+
+def pipeline_params() -> dict:
+    """
+    Параметры пайплайна jobs вне провайдера, от которых зависит текст.
+    Входят в ключ кэша транскриптов (см. transcript_cache.make_key).
+    """
+    backend = loudnorm_backend()
+    return {
+        "loudnorm": config.AUDIO_TARGET_LUFS if backend else None,
+        "loudnorm_backend": backend,
+        "loudnorm_tolerance": config.AUDIO_LOUDNESS_TOLERANCE_LU if backend == "native" else None,
+        **vad_params(),
+        **longform_params(),
+    }
+
+
+def checkpoint_fingerprint(provider, options, audio, duration) -> str:
+    """
+    Отпечаток того, от чего зависит нарезка на куски и их текст: длина аудио после
+    VAD-этапа, модель, параметры декодирования и пайплайна.
+    """
+    params = {
+        "model": provider.manager_key,
+        "decoding": provider.get_decoding_params(options),
+        "pipeline": pipeline_params(),
+        "duration": duration,
+        "samples": int(audio.size) if isinstance(audio, np.ndarray) else None,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class JobContext:
+    """Состояние job между стадиями конвейера."""
+    job: Job
+    audio_path: Optional[str] = None
+    samples: Optional[np.ndarray] = None
+    duration: float = 0.0
+    audio_events: list = field(default_factory=list)
+    audio: Union[str, np.ndarray, None] = None
+    speech_map: Optional[SpeechMap] = None
+    silence_removed: Optional[float] = None
+    vad_events: list = field(default_factory=list)
+    result: Optional[TranscriptionResult] = None
+    keywords: list = field(default_factory=list)
+
+    @property
+    def no_speech(self) -> bool:
+        return self.speech_map is not None and self.speech_map.is_empty
+
+
+async def start_job(job: Job) -> JobContext:
+    await update_job(job.job_id, ("job", "PROCESSING"), status="processing", step="queued", progress=25)
+    await notify_orchestrator_async(job.job_id, "PROCESSING", "IN_PROGRESS")
+    return JobContext(job=job)
+
+
+async def extract_stage(ctx: JobContext) -> None:
+    # С бэкендом "ffmpeg" loudnorm встроен в граф извлечения (один проход ffmpeg),
+    # с "native" нормализуем уже готовый PCM на стадии normalize.
+    job = ctx.job
+    backend = loudnorm_backend()
+    ffmpeg_lufs = config.AUDIO_TARGET_LUFS if backend == "ffmpeg" else None
+
+    await update_job(job.job_id, ("extract_audio", "START"), step="extract_audio", progress=30)
+    if config.AUDIO_IN_MEMORY:
+        ctx.samples, ctx.duration, _ = await extract_pcm_from_path(
+            job.file_path, delete_original=False, target_lufs=ffmpeg_lufs, duration_sec=job.duration_sec
         )
-        append_event(job.job_id, "normalize_audio", "DONE")
-
-        # 3) Transcribe
-        update_job(job.job_id, step="transcribe", progress=65)
-        append_event(job.job_id, "transcribe", "START")
-        provider = get_stt_provider(job.stt_provider)
-        result = await provider.transcribe(normalized_path)
-        append_event(job.job_id, "transcribe", "DONE")
-
-        # 4) Extract keywords (NLP)
-        update_job(job.job_id, step="extract_keywords", progress=85)
-        append_event(job.job_id, "extract_keywords", "START")
-        keywords = await loop.run_in_executor(
-            None, extract_keywords_simple, result.transcript, 10
+    else:
+        ctx.audio_path, ctx.duration, _ = await extract_audio_from_path(
+            job.file_path, delete_original=False, target_lufs=ffmpeg_lufs
         )
-        append_event(job.job_id, "extract_keywords", "DONE")
 
-        # 5) Finalize
-        update_job(job.job_id, step="finalize", progress=95)
-        append_event(job.job_id, "finalize", "START")
 
-        job_result = {
-            "transcript": result.transcript,
-            "language": result.language,
-            "duration_sec": duration,
-            "keywords": keywords  # Добавляем ключевые слова в результат
-        }
+async def normalize_stage(ctx: JobContext) -> None:
+    backend = loudnorm_backend()
+    if backend == "native":
+        await update_job(
+            ctx.job.job_id, ("extract_audio", "DONE"), ("normalize_audio", "START"),
+            step="normalize_audio", progress=40,
+        )
+        ctx.samples, loudness = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                normalize_pcm_loudness,
+                ctx.samples,
+                config.AUDIO_SAMPLE_RATE,
+                target_lufs=config.AUDIO_TARGET_LUFS,
+                tolerance_lu=config.AUDIO_LOUDNESS_TOLERANCE_LU,
+            ),
+        )
+        ctx.audio_events = [(
+            "normalize_audio", "SKIPPED" if loudness["skipped"] else "DONE",
+            f"input_i={loudness['input_i']:.1f} LUFS, gain={loudness['gain_db']:+.1f} dB",
+        )]
+    elif backend == "ffmpeg":
+        ctx.audio_events = [("extract_audio", "DONE"), ("normalize_audio", "DONE", "fused with extract_audio")]
+    else:
+        ctx.audio_events = [("extract_audio", "DONE")]
 
-        update_job(job.job_id, status="done", step="done", progress=100, result=job_result)
-        append_event(job.job_id, "finalize", "DONE")
-        append_event(job.job_id, "job", "DONE")
-        notify_orchestrator(job.job_id, "DONE", "DONE", data=job_result)
 
-        if job.callback_url:
-            try:
-                requests.post(job.callback_url, json={
-                    "job_id": job.job_id,
-                    "status": "done",
-                    "result": job_result
-                }, timeout=10)
-            except Exception:
-                pass
+async def vad_stage(ctx: JobContext) -> None:
+    # в провайдер идёт только речь
+    await update_job(ctx.job.job_id, *ctx.audio_events, step="vad", progress=55)
+    ctx.audio, ctx.speech_map = await speech_stage(ctx.samples if ctx.samples is not None else ctx.audio_path)
+    ctx.samples = None  # дальше нужен только результат VAD-этапа
+    if ctx.speech_map is not None:
+        ctx.silence_removed = ctx.speech_map.removed_ratio
+        ctx.vad_events.append((
+            "vad", "DONE",
+            f"speech={ctx.speech_map.speech_samples / config.AUDIO_SAMPLE_RATE:.1f}s, "
+            f"removed={ctx.silence_removed:.0%}",
+        ))
 
-    except Exception as e:
-        update_job(job.job_id, status="error", step="error", progress=100, error=str(e))
-        append_event(job.job_id, "job", "ERROR", message=str(e))
-        notify_orchestrator(job.job_id, "ERROR", "FAIL", error=str(e))
 
-        if job.callback_url:
-            try:
-                requests.post(job.callback_url, json={
-                    "job_id": job.job_id,
-                    "status": "error",
-                    "error": str(e)
-                }, timeout=10)
-            except Exception:
-                pass
+async def transcribe_stage(ctx: JobContext) -> None:
+    job = ctx.job
+    provider = get_stt_provider(job.stt_provider)
+    options = TranscriptionOptions.from_fields(job.options or {})
+    if ctx.no_speech:
+        # речи нет — модель не нужна
+        await update_job(
+            job.job_id, *ctx.vad_events, ("transcribe", "SKIPPED", "no speech"), step="transcribe", progress=65
+        )
+        result = TranscriptionResult(language="ru", transcript="", provider=provider.get_name())
+    else:
+        # длинная запись распознаётся кусками параллельно; готовые куски
+        # сохраняются, и перезапущенная job распознаёт только оставшиеся
+        checkpoint = JobCheckpoint(job.job_id, checkpoint_fingerprint(provider, options, ctx.audio, ctx.duration))
+        done = {i: TranscriptionResult(**chunk) for i, chunk in (await checkpoint.load()).items()}
+        if done:
+            start_event = ("transcribe", "RESUMED", f"{len(done)} chunks from checkpoint")
+        else:
+            start_event = ("transcribe", "START")
+        await update_job(job.job_id, *ctx.vad_events, start_event, step="transcribe", progress=65)
+
+        finished = set(done)
+
+        async def on_chunk(index: int, total: int, chunk: TranscriptionResult) -> None:
+            await checkpoint.save(index, asdict(chunk))
+            finished.add(index)
+            await update_job(job.job_id, progress=65 + 20 * len(finished) // total)
+
+        loaded = provider.is_loaded()  # холодный запрос не идёт в RTF
+        with model_manager.use(provider.manager_key), stt_router.track(provider.manager_key, ctx.duration, loaded):
+            result = await transcribe_audio(
+                provider, ctx.audio, ctx.speech_map, options, done=done, on_chunk=on_chunk
+            )
+    ctx.audio = None
+
+    if job.content_sha256:
+        await transcript_cache.put_cached(
+            transcript_cache.make_key(job.content_sha256, provider, pipeline_params(), options),
+            {
+                "language": result.language,
+                "transcript": result.transcript,
+                "provider": result.provider,
+                "tier": result.tier,
+                "duration_sec": ctx.duration,
+                "silence_removed_ratio": ctx.silence_removed,
+            },
+        )
+    ctx.result = result
+
+
+async def keywords_stage(ctx: JobContext) -> None:
+    transcribe_events = [] if ctx.no_speech else [("transcribe", "DONE")]
+    await update_job(
+        ctx.job.job_id, *transcribe_events, ("extract_keywords", "START"), step="extract_keywords", progress=85
+    )
+    ctx.keywords = await asyncio.get_running_loop().run_in_executor(
+        None, extract_keywords_simple, ctx.result.transcript, 10
+    )
+
+
+def _post_callback(url: str, payload: dict) -> None:
+    try:
+        requests.post(url, json=payload, timeout=10)
+    except Exception:
+        pass
+
+
+async def finalize_stage(ctx: JobContext) -> None:
+    job = ctx.job
+    job_result = {
+        "transcript": ctx.result.transcript,
+        "language": ctx.result.language,
+        "duration_sec": ctx.duration,
+        "tier": ctx.result.tier,
+        "silence_removed_ratio": ctx.silence_removed,
+        "keywords": ctx.keywords  # Добавляем ключевые слова в результат
+    }
+
+    await update_job(
+        job.job_id, ("extract_keywords", "DONE"), ("finalize", "START"), ("finalize", "DONE"), ("job", "DONE"),
+        status="done", step="done", progress=100, result=job_result,
+    )
+    await delete_checkpoint(job.job_id)
+    await notify_orchestrator_async(job.job_id, "DONE", "DONE", data=job_result)
+
+    if job.callback_url:
+        await asyncio.to_thread(_post_callback, job.callback_url, {
+            "job_id": job.job_id,
+            "status": "done",
+            "result": job_result
+        })
+
+
+class LeaseLostError(Exception):
+    """Reaper вернул job в очередь, её держит другой воркер — эта копия бросает работу."""
+
 
+# jobs, аренду которых этот воркер потерял (см. renew_leases)
+_lost_leases: set[str] = set()
+
+
+def _leased(fn):
+    """Стадия запускается, только пока аренда job у этого воркера."""
+    @functools.wraps(fn)
+    async def run(ctx: JobContext) -> None:
+        if ctx.job.job_id in _lost_leases:
+            raise LeaseLostError(f"lease of job {ctx.job.job_id} lost")
+        await fn(ctx)
+    return run
+
+
+async def fail_job(ctx: JobContext, stage: str, e: Exception) -> None:
+    job = ctx.job
+    if isinstance(e, LeaseLostError):
+        # статус job теперь ведёт другой воркер
+        print(f"Job {job.job_id} dropped before stage {stage}: lease lost")
+        return
+    print(f"Job {job.job_id} failed at stage {stage}: {e}")
+    await update_job(job.job_id, ("job", "ERROR", str(e)), status="error", step="error", progress=100, error=str(e))
+    await notify_orchestrator_async(job.job_id, "ERROR", "FAIL", error=str(e))
+
+    if job.callback_url:
+        await asyncio.to_thread(_post_callback, job.callback_url, {
+            "job_id": job.job_id,
+            "status": "error",
+            "error": str(e)
+        })
+
+
+async def finish_job(ctx: JobContext) -> None:
+    """Job вышла из конвейера (успех или ошибка): подтверждение и уборка."""
+    await ack_job(ctx.job.job_id)
+    _lost_leases.discard(ctx.job.job_id)
+    # cleanup temp wav file
+    if ctx.audio_path and os.path.exists(ctx.audio_path):
+        try:
+            os.remove(ctx.audio_path)
+        except Exception:
+            pass
+
+
+JOB_STAGES = [
+    ("extract", _leased(extract_stage)),
+    ("normalize", _leased(normalize_stage)),
+    ("vad", _leased(vad_stage)),
+    ("transcribe", _leased(transcribe_stage)),
+    ("keywords", _leased(keywords_stage)),
+    ("finalize", _leased(finalize_stage)),
+]
+
+
+def build_pipeline() -> StagePipeline:
+    return StagePipeline(
+        [Stage(name, fn, config.JOB_STAGE_CONCURRENCY.get(name, 1)) for name, fn in JOB_STAGES],
+        queue_size=config.JOB_PIPELINE_QUEUE_SIZE,
+        on_done=finish_job,
+        on_error=fail_job,
+    )
+
+
+async def process_job(job: Job) -> None:
+    """Все стадии одной job подряд (без конвейера)."""
+    ctx = await start_job(job)
+    try:
+        for name, fn in JOB_STAGES:
+            try:
+                await fn(ctx)
+            except Exception as e:
+                await fail_job(ctx, name, e)
+                break
     finally:
-        # cleanup temp wav files
-        for path in [audio_path, normalized_path]:
-            if path and os.path.exists(path):
-                try:
-                    os.remove(path)
-                except Exception:
-                    pass
+        await finish_job(ctx)
 
 
-async def worker_loop():
-    print("Worker loop started")
+async def lease_heartbeat():
+    """Продлевает аренду jobs этого воркера, пока он жив (event loop не завис)."""
+    interval = max(1.0, config.JOB_VISIBILITY_TIMEOUT_SEC / 3)
     while True:
+        await asyncio.sleep(interval)
         try:
-            job = await asyncio.to_thread(dequeue_job, 5)
-            if job:
-                await process_job(job)
+            lost = await renew_leases()
         except Exception as e:
-            print(f"Worker loop error: {e}")
-            await asyncio.sleep(2)
+            print(f"Lease heartbeat error: {e}")
+            continue
+        if lost:
+            print(f"Lost leases (requeued to another worker): {lost}")
+            _lost_leases.update(lost)
+
+
+async def job_reaper():
+    """Фоновая задача: возвращает в очередь jobs с истёкшей арендой."""
+    while True:
+        await asyncio.sleep(config.JOB_REAPER_INTERVAL_SEC)
+        try:
+            requeued, failed = await reap_expired_jobs(config.JOB_MAX_ATTEMPTS)
+        except Exception as e:
+            print(f"Job reaper error: {e}")
+            continue
+        if requeued:
+            print(f"Requeued jobs with expired lease: {requeued}")
+        for job_id in failed:
+            print(f"Job {job_id} exceeded {config.JOB_MAX_ATTEMPTS} attempts")
+            await notify_orchestrator_async(job_id, "ERROR", "FAIL", error="max attempts exceeded")
+
+
+# конвейер запущенного worker_loop (для мониторинга)
+_pipeline: Optional[StagePipeline] = None
+
+
+async def worker_loop():
+    global _pipeline
+    print("Worker loop started")
+    try:
+        requeued = await requeue_stale_jobs(config.JOB_STALE_SEC)
+        if requeued:
+            print(f"Requeued interrupted jobs: {requeued}")
+    except Exception as e:
+        print(f"Requeue of stale jobs failed: {e}")
+    heartbeat = asyncio.create_task(lease_heartbeat(), name="job-lease-heartbeat")
+    pipeline = _pipeline = build_pipeline()
+    pipeline.start()
+    try:
+        while True:
+            try:
+                job = await dequeue_job(5)
+                if job:
+                    # ждёт, пока в первой стадии освободится место
+                    await pipeline.submit(await start_job(job))
+            except Exception as e:
+                print(f"Worker loop error: {e}")
+                await asyncio.sleep(2)
+    finally:
+        heartbeat.cancel()
+        await pipeline.close()
+        _pipeline = None
+
+
+def get_pipeline_stats() -> dict:
+    """Загрузка стадий конвейера воркера (пусто, пока воркер не запущен)."""
+    return _pipeline.stats() if _pipeline is not None else {}
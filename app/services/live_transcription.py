@@ -0,0 +1,354 @@
+"""
+Распознавание живого аудиопотока (WebSocket /api/v1/transcribe/live).
+
+Аудио приходит кусками по мере записи. UtteranceSegmenter на лету режет поток
+на фразы по энергии (VAD с адаптивным порогом шума): как только после речи
+набирается LIVE_MIN_SILENCE_MS тишины, фраза закрывается и сразу уходит в
+провайдер — клиент получает "final". Пока фраза не закрыта, раз в
+LIVE_PARTIAL_INTERVAL_MS распознаётся уже накопленная часть — "partial".
+
+Число одновременных сессий на модель ограничено (SessionLimiter), иначе живые
+сессии вытеснят обычные запросы с той же модели.
+"""
+import asyncio
+import collections
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from app.core import config
+from app.services.stt_provider import STTProvider, TranscriptionOptions
+
+
+@dataclass
+class Utterance:
+    """Закрытая фраза: таймкоды в секундах от начала сессии и её аудио."""
+    start: float
+    end: float
+    samples: np.ndarray
+
+
+class UtteranceSegmenter:
+    """
+    Инкрементальный VAD по энергии кадров.
+
+    Кадр считается речью, если его громкость выше оценки шума на speech_margin_db
+    (и не ниже абсолютного min_speech_db). Оценка шума быстро опускается на тихих
+    кадрах и медленно подтягивается вверх, так что постоянный фон (вентилятор,
+    гул линии) перестаёт считаться речью.
+
+    Фраза начинается после min_speech_ms речи подряд (с запасом pad_ms до неё),
+    заканчивается после min_silence_ms тишины или принудительно на max_utterance_sec.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = config.AUDIO_SAMPLE_RATE,
+        frame_ms: int = 30,
+        min_speech_ms: int = 150,
+        min_silence_ms: int = 500,
+        max_utterance_sec: float = 15.0,
+        pad_ms: int = 150,
+        speech_margin_db: float = 12.0,
+        min_speech_db: float = -50.0,
+    ):
+        self._sr = sample_rate
+        self._frame = sample_rate * frame_ms // 1000
+        self._min_speech = max(1, min_speech_ms // frame_ms)
+        self._min_silence = max(1, min_silence_ms // frame_ms)
+        self._max_frames = int(max_utterance_sec * 1000 // frame_ms)
+        self._pad = pad_ms // frame_ms
+        self._margin = speech_margin_db
+        self._min_db = min_speech_db
+
+        self._noise_db = min_speech_db
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._frame_index = 0
+
+        self._preroll: collections.deque = collections.deque(maxlen=self._pad + self._min_speech)
+        self._speech_run = 0
+        self._frames: list[np.ndarray] = []
+        self._start_frame: Optional[int] = None
+        self._silence_run = 0
+
+    @property
+    def in_utterance(self) -> bool:
+        return self._start_frame is not None
+
+    @property
+    def utterance_start(self) -> Optional[float]:
+        """Начало открытой фразы в секундах (None, если фразы нет)."""
+        if self._start_frame is None:
+            return None
+        return self._start_frame * self._frame / self._sr
+
+    def current(self) -> Optional[np.ndarray]:
+        """Аудио открытой фразы (для partial), None — если речи сейчас нет."""
+        if not self._frames:
+            return None
+        return np.concatenate(self._frames)
+
+    def push(self, samples: np.ndarray) -> list[Utterance]:
+        """Добавляет аудио (float32, sample_rate) и возвращает закрывшиеся фразы."""
+        data = np.concatenate([self._tail, samples.astype(np.float32, copy=False)])
+        n_frames = data.size // self._frame
+        self._tail = data[n_frames * self._frame:]
+
+        closed = []
+        for frame in data[:n_frames * self._frame].reshape(n_frames, self._frame):
+            utterance = self._step(frame)
+            if utterance is not None:
+                closed.append(utterance)
+        return closed
+
+    def flush(self) -> Optional[Utterance]:
+        """Конец потока: закрывает открытую фразу, если она есть."""
+        if self._tail.size and self.in_utterance:
+            self._frames.append(self._tail)
+        self._tail = np.zeros(0, dtype=np.float32)
+        if not self.in_utterance:
+            return None
+        return self._close(trim=0)
+
+    def _is_speech(self, frame: np.ndarray) -> bool:
+        db = 10 * np.log10(float(np.mean(np.square(frame))) + 1e-10)
+        speech = db > max(self._noise_db + self._margin, self._min_db)
+        if db < self._noise_db:
+            self._noise_db = db
+        else:
+            self._noise_db += (0.002 if speech else 0.05) * (db - self._noise_db)
+        return speech
+
+    def _step(self, frame: np.ndarray) -> Optional[Utterance]:
+        speech = self._is_speech(frame)
+        self._frame_index += 1
+
+        if not self.in_utterance:
+            self._preroll.append(frame)
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= self._min_speech:
+                self._frames = list(self._preroll)
+                self._start_frame = self._frame_index - len(self._frames)
+                self._preroll.clear()
+                self._speech_run = 0
+                self._silence_run = 0
+            return None
+
+        self._frames.append(frame)
+        self._silence_run = 0 if speech else self._silence_run + 1
+
+        if self._silence_run >= self._min_silence:
+            # хвост тишины оставляем только в пределах pad
+            return self._close(trim=max(0, self._silence_run - self._pad))
+        if len(self._frames) >= self._max_frames:
+            return self._close(trim=0)
+        return None
+
+    def _close(self, trim: int) -> Utterance:
+        frames = self._frames[:len(self._frames) - trim] if trim else self._frames
+        samples = np.concatenate(frames) if frames else np.zeros(0, dtype=np.float32)
+        start = self._start_frame * self._frame / self._sr
+        utterance = Utterance(start=start, end=start + samples.size / self._sr, samples=samples)
+
+        self._frames = []
+        self._start_frame = None
+        self._silence_run = 0
+        return utterance
+
+
+class SessionLimiter:
+    """Счётчик живых сессий на каждую модель (провайдера)."""
+
+    def __init__(self, max_per_model: int):
+        self._max = max_per_model
+        self._active: dict[str, int] = collections.defaultdict(int)
+
+    def try_acquire(self, model: str) -> bool:
+        if self._active[model] >= self._max:
+            return False
+        self._active[model] += 1
+        return True
+
+    def release(self, model: str) -> None:
+        self._active[model] = max(0, self._active[model] - 1)
+
+    def stats(self) -> dict:
+        return {"max_per_model": self._max, "active": dict(self._active)}
+
+
+live_sessions = SessionLimiter(config.LIVE_MAX_SESSIONS_PER_MODEL)
+
+
+class LiveSession:
+    """
+    Одна живая сессия: сегментация входящего аудио, partial/final гипотезы.
+
+    Финальные фразы распознаются строго по очереди в отдельной задаче, чтобы приём
+    аудио не ждал модель. Partial — не чаще раза в partial_interval_ms и не больше
+    одного одновременно; устаревший partial (фраза уже закрылась) не отправляется.
+    """
+
+    def __init__(
+        self,
+        provider: STTProvider,
+        send: Callable[[dict], Awaitable[None]],
+        options: Optional[TranscriptionOptions] = None,
+        partial_interval_ms: int = config.LIVE_PARTIAL_INTERVAL_MS,
+    ):
+        self.session_id = str(uuid.uuid4())
+        self._provider = provider
+        self._send = send
+        self._options = options
+        self._sr = config.AUDIO_SAMPLE_RATE
+        self._segmenter = UtteranceSegmenter(
+            sample_rate=self._sr,
+            min_silence_ms=config.LIVE_MIN_SILENCE_MS,
+            max_utterance_sec=config.LIVE_MAX_UTTERANCE_SEC,
+        )
+        self._partial_step = self._sr * partial_interval_ms // 1000
+        self._partial_task: Optional[asyncio.Task] = None
+        self._partial_mark = 0
+
+        self._finals: asyncio.Queue = asyncio.Queue()
+        self._final_task = asyncio.create_task(self._run_finals())
+
+    async def feed(self, samples: np.ndarray) -> None:
+        """Новый кусок аудио (float32 16kHz mono)."""
+        for utterance in self._segmenter.push(samples):
+            self._close_partial()
+            await self._finals.put(utterance)
+        self._maybe_partial()
+
+    async def finish(self) -> None:
+        """Конец потока: дораспознаёт последнюю фразу и дожидается всех final."""
+        utterance = self._segmenter.flush()
+        partial = self._close_partial()
+        if utterance is not None:
+            await self._finals.put(utterance)
+        await self._finals.put(None)
+        try:
+            await self._final_task
+        finally:
+            await asyncio.gather(*partial, return_exceptions=True)
+
+    async def cancel(self) -> None:
+        """Обрыв сессии: отменяет partial и final и дожидается, пока они остановятся."""
+        partial = self._close_partial()
+        self._final_task.cancel()
+        await asyncio.gather(*partial, self._final_task, return_exceptions=True)
+
+    def _close_partial(self) -> list[asyncio.Task]:
+        """Отменяет текущий partial; возвращает его задачу (если была), чтобы её можно было дождаться."""
+        task, self._partial_task = self._partial_task, None
+        self._partial_mark = 0
+        if task is None:
+            return []
+        task.cancel()
+        return [task]
+
+    def _on_partial_done(self, task: asyncio.Task) -> None:
+        # partial никто не ждёт: ошибку провайдера забираем здесь, иначе asyncio
+        # напишет только "Task exception was never retrieved". Фраза всё равно придёт как final.
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[LiveSession] {self.session_id}: partial failed: {task.exception()!r}")
+
+    def _maybe_partial(self) -> None:
+        if self._partial_step <= 0 or not self._segmenter.in_utterance:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        audio = self._segmenter.current()
+        if audio is None or audio.size - self._partial_mark < self._partial_step:
+            return
+        self._partial_mark = audio.size
+        self._partial_task = asyncio.create_task(
+            self._run_partial(self._segmenter.utterance_start, audio)
+        )
+        self._partial_task.add_done_callback(self._on_partial_done)
+
+    async def _run_partial(self, start: float, audio: np.ndarray) -> None:
+        result = await self._provider.transcribe_array(audio, self._sr, self._options)
+        # фраза могла закрыться, пока шло распознавание — тогда придёт final
+        if result.transcript and self._segmenter.utterance_start == start:
+            await self._send({
+                "type": "partial",
+                "start": round(start, 3),
+                "end": round(start + audio.size / self._sr, 3),
+                "text": result.transcript,
+            })
+
+    async def _run_finals(self) -> None:
+        while True:
+            utterance = await self._finals.get()
+            if utterance is None:
+                return
+            if utterance.samples.size == 0:
+                continue
+            result = await self._provider.transcribe_array(utterance.samples, self._sr, self._options)
+            if result.transcript:
+                await self._send({
+                    "type": "final",
+                    "start": round(utterance.start, 3),
+                    "end": round(utterance.end, 3),
+                    "text": result.transcript,
+                })
+
+
+class FFmpegStreamDecoder:
+    """
+    Декодер сжатого потока (Opus в ogg/webm) через ffmpeg: байты из WebSocket
+    идут в stdin, PCM float32 16kHz mono из stdout отдаётся в on_pcm.
+    """
+
+    def __init__(self, on_pcm: Callable[[np.ndarray], Awaitable[None]]):
+        self._on_pcm = on_pcm
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ac", "1", "-ar", str(config.AUDIO_SAMPLE_RATE),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        tail = b""
+        while True:
+            chunk = await self._proc.stdout.read(32768)
+            if not chunk:
+                return
+            data = tail + chunk
+            usable = len(data) - len(data) % 4
+            tail = data[usable:]
+            if usable:
+                await self._on_pcm(np.frombuffer(data[:usable], dtype=np.float32))
+
+    async def write(self, chunk: bytes) -> None:
+        self._proc.stdin.write(chunk)
+        await self._proc.stdin.drain()
+
+    async def close(self) -> None:
+        """Закрывает stdin и дожидается, пока ffmpeg отдаст остаток PCM."""
+        if not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+        await self._reader
+        await self._proc.wait()
+
+    async def abort(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+            await self._proc.wait()
+        if self._reader is not None and not self._reader.done():
+            self._reader.cancel()
@@ -1,17 +1,20 @@
+import threading
+
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from typing import Optional
 
+from app.services.model_manager import model_manager
+
 MODEL_NAME = "Qwen/Qwen2.5-3B-Instruct"
+MANAGER_KEY = f"llm:{MODEL_NAME}"
 
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    torch_dtype=torch.float16,
-    device_map=None
-).to("cuda")
+# Грузится лениво при первом запросе и может быть выгружена менеджером моделей
+model: Optional[AutoModelForCausalLM] = None
+tokenizer: Optional[AutoTokenizer] = None
+device = "cuda" if torch.cuda.is_available() else "cpu"
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-device = "cuda"
+_lock = threading.Lock()
 
 
 def load_model():
@@ -20,26 +23,46 @@ def load_model():
     if model is not None:
         return
 
-    if torch.cuda.is_available():
-        device = "cuda"
-        dtype = torch.float16
-    else:
-        device = "cpu"
-        dtype = torch.float32
-
-    print(f"[LLM] loading {MODEL_NAME} on {device}")
-
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL_NAME,
-        trust_remote_code=True,
-    )
-
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_NAME,
-        torch_dtype=dtype,
-        device_map="auto",
-        trust_remote_code=True,
-    )
-
-    model.eval()
-    print("[LLM] model loaded")
+    with _lock:
+        if model is not None:
+            return
+
+        if torch.cuda.is_available():
+            device = "cuda"
+            dtype = torch.float16
+        else:
+            device = "cpu"
+            dtype = torch.float32
+
+        print(f"[LLM] loading {MODEL_NAME} on {device}")
+
+        with model_manager.loading(MANAGER_KEY):
+            tokenizer = AutoTokenizer.from_pretrained(
+                MODEL_NAME,
+                trust_remote_code=True,
+            )
+
+            model = AutoModelForCausalLM.from_pretrained(
+                MODEL_NAME,
+                torch_dtype=dtype,
+                device_map="auto",
+                trust_remote_code=True,
+            )
+
+            model.eval()
+        print("[LLM] model loaded")
+
+
+def unload_model():
+    global tokenizer, model
+
+    with _lock:
+        model = None
+        tokenizer = None
+
+
+def is_loaded() -> bool:
+    return model is not None
+
+
+model_manager.register(MANAGER_KEY, unload_model, is_loaded, lambda: device)
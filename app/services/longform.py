@@ -0,0 +1,242 @@
+"""
+Параллельное распознавание длинных записей.
+
+Запись длиннее LONGFORM_MIN_SEC режется по паузам из карты речи (VAD-этап) на
+куски не длиннее LONGFORM_CHUNK_SEC; непрерывная речь длиннее куска режется в
+самом тихом месте у границы. Куски распознаются одновременно (до
+LONGFORM_MAX_PARALLEL): у Whisper они расходятся по репликам / общему батчу,
+у GigaAM — в батчер encoder'а. Результат склеивается по порядку, таймкоды
+сегментов переводятся обратно в таймкоды исходной записи.
+
+Здесь же — общий вход для эндпоинтов и воркера: transcribe_audio / stream_audio
+сами выбирают между пустым ответом (речи нет), обычным и параллельным путём.
+"""
+import asyncio
+import inspect
+from typing import AsyncIterator, Callable, Optional, Union
+
+import numpy as np
+
+from app.core import config
+from app.services.stt_provider import (
+    STTProvider,
+    TranscriptionOptions,
+    TranscriptionResult,
+    TranscriptionSegment,
+    read_wav,
+    to_model_rate,
+)
+from app.services.vad import SpeechMap
+
+
+def _quietest_cut(audio: np.ndarray, lo: int, hi: int, frame: int) -> int:
+    """Граница самого тихого кадра в [lo, hi)."""
+    n_frames = (hi - lo) // frame
+    if n_frames <= 1:
+        return hi
+    frames = audio[lo:lo + n_frames * frame].reshape(n_frames, frame)
+    return lo + int(np.argmin(np.mean(np.square(frames), axis=1))) * frame
+
+
+def split_spans(audio: np.ndarray, spans: list[tuple[int, int]], max_len: int, sample_rate: int) -> list[tuple[int, int]]:
+    """Участки речи длиннее max_len режутся в самом тихом месте последней пятой части."""
+    frame = sample_rate // 20  # 50 мс
+    result = []
+    for start, end in spans:
+        while end - start > max_len:
+            cut = _quietest_cut(audio, start + max_len * 4 // 5, start + max_len, frame)
+            result.append((start, cut))
+            start = cut
+        result.append((start, end))
+    return result
+
+
+def plan_chunks(
+    audio: np.ndarray,
+    speech_map: SpeechMap,
+    chunk_sec: Optional[float] = None,
+) -> list[SpeechMap]:
+    """
+    Куски для параллельного распознавания: соседние участки речи набираются в кусок,
+    пока склеенное аудио не длиннее chunk_sec. Каждый кусок — своя SpeechMap
+    (compact() даёт его аудио, to_original() — таймкоды в исходной записи).
+    """
+    rate = speech_map.sample_rate
+    max_len = int((chunk_sec or config.LONGFORM_CHUNK_SEC) * rate)
+    gap = speech_map.gap_samples
+
+    chunks: list[list[tuple[int, int]]] = []
+    length = 0
+    for start, end in split_spans(audio, speech_map.spans, max_len, rate):
+        if chunks and length + gap + (end - start) <= max_len:
+            chunks[-1].append((start, end))
+            length += gap + (end - start)
+        else:
+            chunks.append([(start, end)])
+            length = end - start
+    return [
+        SpeechMap(spans=spans, total_samples=speech_map.total_samples, sample_rate=rate, gap_samples=gap)
+        for spans in chunks
+    ]
+
+
+def longform_params() -> dict:
+    """Параметры нарезки для ключа кэша транскриптов (от них зависит текст длинных записей)."""
+    if not config.LONGFORM_PARALLEL:
+        return {"longform": None}
+    return {"longform": {"min_sec": config.LONGFORM_MIN_SEC, "chunk_sec": config.LONGFORM_CHUNK_SEC}}
+
+
+def _is_long(audio: np.ndarray) -> bool:
+    return config.LONGFORM_PARALLEL and audio.size / config.AUDIO_SAMPLE_RATE >= config.LONGFORM_MIN_SEC
+
+
+async def _as_pcm(audio: Union[str, np.ndarray]) -> np.ndarray:
+    if isinstance(audio, str):
+        samples, sample_rate = await asyncio.to_thread(read_wav, audio)
+        return to_model_rate(samples, sample_rate)
+    return audio
+
+
+def _chunk_source_map(speech_map: Optional[SpeechMap], audio: np.ndarray) -> SpeechMap:
+    """
+    Карта участков в координатах audio: после VAD-этапа audio — склеенная речь,
+    и резать её нужно по стыкам участков; без VAD — "всё речь", куски режутся
+    по тихим местам.
+    """
+    if speech_map is None:
+        return SpeechMap(spans=[(0, audio.size)], total_samples=audio.size)
+    return speech_map.compacted()
+
+
+async def transcribe_longform(
+    provider: STTProvider,
+    audio: np.ndarray,
+    speech_map: SpeechMap,
+    options: Optional[TranscriptionOptions] = None,
+    done: Optional[dict[int, TranscriptionResult]] = None,
+    on_chunk: Optional[Callable[[int, int, TranscriptionResult], None]] = None,
+) -> TranscriptionResult:
+    """
+    Куски распознаются одновременно, тексты склеиваются по порядку.
+
+    done — уже готовые куски по номеру (возобновление job с чекпоинта), они не
+    распознаются заново; on_chunk(номер, всего кусков, результат) вызывается
+    по готовности каждого нового куска (может быть корутиной).
+    """
+    semaphore = asyncio.Semaphore(max(1, config.LONGFORM_MAX_PARALLEL))
+    done = done or {}
+
+    async def run(index: int, chunk: SpeechMap) -> TranscriptionResult:
+        if index in done:
+            return done[index]
+        async with semaphore:
+            result = await provider.transcribe_array(chunk.compact(audio), config.AUDIO_SAMPLE_RATE, options)
+        if on_chunk is not None:
+            saved = on_chunk(index, len(chunks), result)
+            if inspect.isawaitable(saved):
+                await saved
+        return result
+
+    chunks = plan_chunks(audio, speech_map)
+    tasks = [asyncio.create_task(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # кусок упал (или job отменили) — остальные не должны занимать модель
+        # и писать чекпоинты уже проваленной job
+        for task in tasks:
+            task.cancel()
+    print(
+        f"[Longform] {audio.size / config.AUDIO_SAMPLE_RATE:.0f}s -> {len(chunks)} chunks"
+        + (f" ({len(done)} from checkpoint)" if done else "")
+    )
+
+    tiers = {r.tier for r in results if r.tier}
+    return TranscriptionResult(
+        language=results[0].language if results else "ru",
+        transcript=" ".join(r.transcript for r in results if r.transcript),
+        provider=provider.get_name(),
+        # у каскада — самый "дорогой" ярус среди кусков
+        tier=max(tiers, key=len) if tiers else None,
+    )
+
+
+async def stream_longform(
+    provider: STTProvider,
+    audio: np.ndarray,
+    speech_map: SpeechMap,
+    options: Optional[TranscriptionOptions] = None,
+) -> AsyncIterator[TranscriptionSegment]:
+    """
+    Куски распознаются одновременно, сегменты отдаются по порядку: кусок
+    отдаётся целиком, как только готов он и все куски до него.
+    """
+    semaphore = asyncio.Semaphore(max(1, config.LONGFORM_MAX_PARALLEL))
+
+    async def run(chunk: SpeechMap) -> list[TranscriptionSegment]:
+        async with semaphore:
+            return [
+                TranscriptionSegment(
+                    start=chunk.to_original(seg.start), end=chunk.to_original(seg.end), text=seg.text
+                )
+                async for seg in provider.transcribe_stream(chunk.compact(audio), config.AUDIO_SAMPLE_RATE, options)
+            ]
+
+    tasks = [asyncio.create_task(run(chunk)) for chunk in plan_chunks(audio, speech_map)]
+    try:
+        for task in tasks:
+            for segment in await task:
+                yield segment
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def transcribe_audio(
+    provider: STTProvider,
+    audio: Union[str, np.ndarray],
+    speech_map: Optional[SpeechMap],
+    options: Optional[TranscriptionOptions] = None,
+    done: Optional[dict[int, TranscriptionResult]] = None,
+    on_chunk: Optional[Callable[[int, int, TranscriptionResult], None]] = None,
+) -> TranscriptionResult:
+    """
+    Распознавание после VAD-этапа: audio — то, что вернул speech_stage
+    (склеенная речь или, без VAD, исходное аудио), speech_map — его карта речи.
+    done / on_chunk — чекпоинты кусков длинной записи (см. transcribe_longform).
+    """
+    if speech_map is not None and speech_map.is_empty:
+        # речи нет — модель не нужна
+        return TranscriptionResult(language="ru", transcript="", provider=provider.get_name())
+
+    if config.LONGFORM_PARALLEL:
+        audio = await _as_pcm(audio)
+        if _is_long(audio):
+            return await transcribe_longform(
+                provider, audio, _chunk_source_map(speech_map, audio), options, done=done, on_chunk=on_chunk
+            )
+
+    if isinstance(audio, str):
+        return await provider.transcribe(audio, options)
+    return await provider.transcribe_array(audio, config.AUDIO_SAMPLE_RATE, options)
+
+
+async def stream_audio(
+    provider: STTProvider,
+    audio: np.ndarray,
+    speech_map: Optional[SpeechMap],
+    options: Optional[TranscriptionOptions] = None,
+) -> AsyncIterator[TranscriptionSegment]:
+    """Потоковый вариант transcribe_audio; таймкоды — по исходной записи."""
+    if speech_map is not None and speech_map.is_empty:
+        return
+
+    to_original = speech_map.to_original if speech_map is not None else (lambda t: t)
+    if _is_long(audio):
+        segments = stream_longform(provider, audio, _chunk_source_map(speech_map, audio), options)
+    else:
+        segments = provider.transcribe_stream(audio, config.AUDIO_SAMPLE_RATE, options)
+
+    async for seg in segments:
+        yield TranscriptionSegment(start=to_original(seg.start), end=to_original(seg.end), text=seg.text)
@@ -0,0 +1,264 @@
+"""
+Менеджер загруженных моделей.
+
+Все модели (разные размеры Whisper, варианты GigaAM, LLM) регистрируются здесь
+под ключом вида "whisper:small" / "gigaam:e2e_rnnt" / "llm:<name>". Менеджер:
+- держит суммарную память моделей в пределах MODEL_RAM_BUDGET_MB / MODEL_VRAM_BUDGET_MB:
+  перед загрузкой новой модели выгружает давно не использованные (LRU);
+- выгружает модели, простаивающие дольше MODEL_IDLE_TTL_SEC;
+- не трогает модели, которые сейчас в работе (use()) или закреплены (pin()).
+
+Сама загрузка остаётся ленивой внутри провайдеров: они оборачивают её в
+loading(key), а менеджер освобождает место и замеряет, сколько памяти модель заняла.
+"""
+import asyncio
+import contextlib
+import gc
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+from app.core import config
+
+# Грубые оценки памяти (МБ) до первой загрузки; после загрузки используется замер
+_SIZE_ESTIMATES_MB = {
+    "whisper:tiny": 150,
+    "whisper:base": 300,
+    "whisper:small": 900,
+    "whisper:medium": 2500,
+    "whisper:large": 5000,
+    "gigaam": 1200,
+    "llm": 7000,
+}
+
+
+@dataclass
+class _Entry:
+    key: str
+    unload: Callable[[], None]
+    is_loaded: Callable[[], bool]
+    device: Callable[[], str]
+    last_used: float = field(default_factory=time.time)
+    in_use: int = 0
+    pinned: bool = False
+    ram_mb: Optional[float] = None
+    vram_mb: Optional[float] = None
+    load_sec: Optional[float] = None
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса (Linux /proc), 0 — если не узнать."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _vram_mb() -> float:
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return 0.0
+    return torch.cuda.memory_allocated() / 2**20
+
+
+def _release_memory() -> None:
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelManager:
+    def __init__(self, ram_budget_mb: float = 0, vram_budget_mb: float = 0, idle_ttl_sec: float = 0):
+        self._ram_budget = ram_budget_mb
+        self._vram_budget = vram_budget_mb
+        self._idle_ttl = idle_ttl_sec
+        self._entries: dict[str, _Entry] = {}
+        self._instances: dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    # ---------- регистрация ----------
+
+    def get(self, key: str, factory: Callable[[], object]) -> object:
+        """
+        Провайдер под ключом key (создаётся factory при первом обращении).
+        Объект должен уметь unload(), is_loaded() и get_device().
+        """
+        with self._lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = factory()
+                self._instances[key] = instance
+                self.register(key, instance.unload, instance.is_loaded, instance.get_device)
+            self._entries[key].last_used = time.time()
+            return instance
+
+    def register(
+        self,
+        key: str,
+        unload: Callable[[], None],
+        is_loaded: Callable[[], bool],
+        device: Callable[[], str],
+    ) -> None:
+        """Регистрация модели, которая живёт не в провайдере (например, LLM)."""
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = _Entry(key, unload, is_loaded, device)
+
+    def pin(self, key: str) -> None:
+        """Закрепить модель: не выгружается ни по TTL, ни по бюджету."""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key].pinned = True
+
+    # ---------- учёт использования ----------
+
+    @contextlib.contextmanager
+    def use(self, key: str) -> Iterator[None]:
+        """Модель в работе: пока блок не закончился, её не выгружаем."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.in_use += 1
+                entry.last_used = time.time()
+        try:
+            yield
+        finally:
+            if entry is not None:
+                with self._lock:
+                    entry.in_use -= 1
+                    entry.last_used = time.time()
+
+    @contextlib.contextmanager
+    def loading(self, key: str) -> Iterator[None]:
+        """
+        Оборачивает загрузку модели: до неё освобождает место под бюджет,
+        после — запоминает, сколько памяти модель заняла на самом деле.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._make_room(entry)
+
+        ram0, vram0, t0 = _rss_mb(), _vram_mb(), time.time()
+        yield
+        if entry is not None:
+            ram, vram = max(0.0, _rss_mb() - ram0), max(0.0, _vram_mb() - vram0)
+            with self._lock:
+                # замер ~0 (нет /proc, веса подгружаются лениво) — остаёмся на оценке
+                if ram + vram >= 1:
+                    entry.ram_mb, entry.vram_mb = ram, vram
+                entry.load_sec = round(time.time() - t0, 2)
+                entry.last_used = time.time()
+            print(f"[ModelManager] {key} loaded in {entry.load_sec}s: ram={ram:.0f}MB vram={vram:.0f}MB")
+
+    # ---------- выгрузка ----------
+
+    def _estimate(self, entry: _Entry) -> tuple[float, float]:
+        """(RAM, VRAM) в МБ: замер прошлой загрузки или оценка по таблице."""
+        if entry.ram_mb is not None:
+            return entry.ram_mb, entry.vram_mb or 0.0
+        estimate = _SIZE_ESTIMATES_MB.get(entry.key) or next(
+            (mb for prefix, mb in _SIZE_ESTIMATES_MB.items() if entry.key.startswith(prefix)),
+            1000,
+        )
+        return (0.0, estimate) if entry.device() == "cuda" else (estimate, 0.0)
+
+    def _usage(self) -> tuple[float, float]:
+        ram = vram = 0.0
+        for entry in self._entries.values():
+            if entry.is_loaded():
+                r, v = self._estimate(entry)
+                ram, vram = ram + r, vram + v
+        return ram, vram
+
+    def _over_budget(self, need_ram: float, need_vram: float) -> bool:
+        ram, vram = self._usage()
+        return (
+            (self._ram_budget > 0 and ram + need_ram > self._ram_budget)
+            or (self._vram_budget > 0 and vram + need_vram > self._vram_budget)
+        )
+
+    def _make_room(self, incoming: _Entry) -> None:
+        need_ram, need_vram = self._estimate(incoming)
+        with self._lock:
+            while self._over_budget(need_ram, need_vram):
+                candidates = [
+                    e for e in self._entries.values()
+                    if e is not incoming and e.is_loaded() and not e.pinned and e.in_use == 0
+                ]
+                if not candidates:
+                    print(f"[ModelManager] WARNING: нет свободных моделей для выгрузки, {incoming.key} грузится сверх бюджета")
+                    return
+                victim = min(candidates, key=lambda e: e.last_used)
+                self._unload(victim, reason="memory budget")
+
+    def _unload(self, entry: _Entry, reason: str) -> None:
+        print(f"[ModelManager] unloading {entry.key} ({reason})")
+        try:
+            entry.unload()
+        except Exception as e:
+            print(f"[ModelManager] unload {entry.key} failed: {e}")
+        _release_memory()
+
+    def unload_idle(self) -> list[str]:
+        """Выгружает модели, которые не использовались дольше idle TTL."""
+        if self._idle_ttl <= 0:
+            return []
+        now = time.time()
+        unloaded = []
+        with self._lock:
+            for entry in self._entries.values():
+                if (
+                    entry.is_loaded() and not entry.pinned and entry.in_use == 0
+                    and now - entry.last_used > self._idle_ttl
+                ):
+                    self._unload(entry, reason=f"idle {now - entry.last_used:.0f}s")
+                    unloaded.append(entry.key)
+        return unloaded
+
+    async def idle_reaper(self) -> None:
+        """Фоновая задача: периодически выгружает простаивающие модели."""
+        if self._idle_ttl <= 0:
+            return
+        interval = min(60.0, self._idle_ttl / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.unload_idle)
+            except Exception as e:
+                print(f"[ModelManager] idle reaper error: {e}")
+
+    def stats(self) -> dict:
+        """Состояние моделей для мониторинга."""
+        ram, vram = self._usage()
+        now = time.time()
+        return {
+            "ram_budget_mb": self._ram_budget,
+            "vram_budget_mb": self._vram_budget,
+            "idle_ttl_sec": self._idle_ttl,
+            "ram_used_mb": round(ram),
+            "vram_used_mb": round(vram),
+            "models": {
+                e.key: {
+                    "loaded": e.is_loaded(),
+                    "in_use": e.in_use,
+                    "pinned": e.pinned,
+                    "idle_sec": round(now - e.last_used),
+                    "ram_mb": round(e.ram_mb) if e.ram_mb is not None else None,
+                    "vram_mb": round(e.vram_mb) if e.vram_mb is not None else None,
+                    "load_sec": e.load_sec,
+                }
+                for e in self._entries.values()
+            },
+        }
+
+
+model_manager = ModelManager(
+    ram_budget_mb=config.MODEL_RAM_BUDGET_MB,
+    vram_budget_mb=config.MODEL_VRAM_BUDGET_MB,
+    idle_ttl_sec=config.MODEL_IDLE_TTL_SEC,
+)
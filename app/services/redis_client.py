@@ -1,4 +1,14 @@
 import redis
-from app.core.config import REDIS_URL
+import redis.asyncio
 
+from app.core.config import REDIS_MAX_CONNECTIONS, REDIS_URL
+
+# Синхронный клиент — только для скриптов и кода вне event loop
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# Асинхронный клиент для корутин (jobs, воркер, кэш транскриптов): общий пул соединений на процесс,
+# при исчерпании пула запрос ждёт свободное соединение, а не падает
+async_redis_pool = redis.asyncio.BlockingConnectionPool.from_url(
+    REDIS_URL, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS
+)
+async_redis_client = redis.asyncio.Redis(connection_pool=async_redis_pool)
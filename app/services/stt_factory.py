@@ -1,8 +1,13 @@
+import asyncio
 import random
-from typing import Literal
+import time
+from typing import Literal, Optional
 
 from app.core import config
+from app.services.model_manager import model_manager
 from app.services.stt_provider import STTProvider
+from app.services.stt_router import Reservation, stt_router
+from app.services.whisper_cascade import get_whisper_cascade_provider
 from app.services.whisper_provider import get_whisper_provider
 from app.services.gigaam_provider import get_gigaam_provider
 
@@ -13,30 +18,41 @@ ProviderName = Literal["whisper", "gigaam"]
 def get_stt_provider(provider_name: str | None = None) -> STTProvider:
     """
     Возвращает STT провайдер по имени или из конфигурации. Args:
-        provider_name: Имя провайдера ('whisper' или 'gigaam').
+        provider_name: Имя провайдера ('whisper' или 'gigaam'), можно с моделью
+                       через двоеточие: 'whisper:medium', 'gigaam:e2e_ctc'
+                       (допустимые — WHISPER_MODELS / GIGAAM_VARIANTS);
+                       'whisper:cascade' — каскад черновая/основная модель.
                        Если None, используется значение из config.STT_PROVIDER.
     
     Returns:
         Экземпляр STTProvider
         
     Raises:
-        ValueError: Если указан неизвестный провайдер
+        ValueError: Если указан неизвестный провайдер или недопустимая модель
     """
     if provider_name is None:
         provider_name = getattr(config, 'STT_PROVIDER', 'whisper')
     
-    provider_name = provider_name.lower()
+    provider_name, _, variant = provider_name.lower().partition(":")
     
     if provider_name == "whisper":
-        return get_whisper_provider()
+        if variant == "cascade" or (not variant and config.WHISPER_CASCADE):
+            return get_whisper_cascade_provider()
+        if variant and variant not in config.WHISPER_MODELS:
+            raise ValueError(f"Модель Whisper '{variant}' недоступна. "
+                             f"Поддерживаются: {', '.join(config.WHISPER_MODELS)}")
+        return get_whisper_provider(variant or None)
     elif provider_name == "gigaam":
-        return get_gigaam_provider()
+        if variant and variant not in config.GIGAAM_VARIANTS:
+            raise ValueError(f"Вариант GigaAM '{variant}' недоступен. "
+                             f"Поддерживаются: {', '.join(config.GIGAAM_VARIANTS)}")
+        return get_gigaam_provider(variant or None)
     else:
         raise ValueError(f"Неизвестный STT провайдер: {provider_name}. "
                         f"Поддерживаются: 'whisper', 'gigaam'")
 
 
-def get_stt_provider_ab() -> STTProvider:
+def get_stt_provider_ab() -> tuple[STTProvider, Optional[Reservation]]:
     """
     эта часть для аб теста. Возвращает STT провайдер с учетом A/B тестирования.
     
@@ -46,25 +62,54 @@ def get_stt_provider_ab() -> STTProvider:
     Если STT_AB_GIGAAM_PERCENT = 0: всегда Whisper
     Если STT_AB_GIGAAM_PERCENT = 100: всегда GigaAM
     Если STT_AB_GIGAAM_PERCENT = 50: 50% Whisper, 50% GigaAM
+
+    Если задан STT_ROUTING_PROVIDERS, вместо случайного выбора работает
+    маршрутизация по ожидаемой задержке (см. get_routed_provider).
     
     Returns:
-        Экземпляр STTProvider (Whisper или GigaAM)
+        (экземпляр STTProvider (Whisper или GigaAM), слот router'а или None) —
+        слот передаётся в stt_router.track или освобождается, если до модели не дошло
     """
+    if config.STT_ROUTING_PROVIDERS:
+        return get_routed_provider(config.STT_ROUTING_PROVIDERS)
+
     gigaam_percent = getattr(config, 'STT_AB_GIGAAM_PERCENT', 0)
     
     # Если A/B не настроен (0%), используем основной провайдер
     if gigaam_percent <= 0:
-        return get_stt_provider()
+        return get_stt_provider(), None
     
     # Если 100% на GigaAM
     if gigaam_percent >= 100:
-        return get_gigaam_provider()
+        return get_gigaam_provider(), None
     
     # Случайный выбор с учетом процента
     if random.randint(1, 100) <= gigaam_percent:
-        return get_gigaam_provider()
+        return get_gigaam_provider(), None
     else:
-        return get_whisper_provider()
+        return get_stt_provider("whisper"), None
+
+
+def get_routed_provider(provider_names: list[str]) -> tuple[STTProvider, Reservation]:
+    """
+    Провайдер с наименьшим ожидаемым временем ответа: учитываются запросы в работе,
+    измеренный RTF и то, загружена ли модель (у выгруженной — штраф на загрузку).
+    Минимальную долю на провайдер задаёт STT_ROUTING_MIN_SHARE_PERCENT.
+    Возвращает провайдер и занятый на нём слот router'а.
+    """
+    providers = {}
+    candidates = {}
+    models = model_manager.stats()["models"]
+    for name in provider_names:
+        provider = get_stt_provider(name)
+        key = provider.manager_key
+        providers[key] = provider
+        candidates[key] = {
+            "loaded": provider.is_loaded(),
+            "load_sec": models.get(key, {}).get("load_sec"),
+        }
+    reservation = stt_router.choose(candidates)
+    return providers[reservation.key], reservation
 
 
 def preload_provider(provider_name: str | None = None) -> None:
@@ -73,3 +118,59 @@ def preload_provider(provider_name: str | None = None) -> None:
     
     if hasattr(provider, '_load_model'):
         provider._load_model()
+
+
+# Состояние предзагрузки по провайдерам для /readyz:
+# status: pending -> loading -> warming_up -> ready | error
+_readiness: dict[str, dict] = {}
+
+
+async def preload_providers(provider_names: list[str], warmup: bool = True) -> None:
+    """
+    Загружает провайдеры на старте сервиса: загрузка — в отдельном потоке (event loop
+    не блокируется), затем прогрев на синтетическом аудио, чтобы первый настоящий
+    запрос не платил за инициализацию ядер и аллокаторов.
+    Провайдеры грузятся по очереди, чтобы не делить диск/память при загрузке весов.
+    """
+    for name in provider_names:
+        _readiness[name] = {"status": "pending"}
+
+    for name in provider_names:
+        state = _readiness[name]
+        try:
+            provider = get_stt_provider(name)
+
+            state["status"] = "loading"
+            t0 = time.time()
+            await asyncio.to_thread(preload_provider, name)
+            state["load_sec"] = round(time.time() - t0, 2)
+
+            if warmup:
+                state["status"] = "warming_up"
+                t0 = time.time()
+                await provider.warmup()
+                state["warmup_sec"] = round(time.time() - t0, 2)
+
+            state.update(
+                status="ready",
+                model=provider.get_model_name(),
+                device=provider.get_device(),
+            )
+            # прогретые на старте модели менеджер не выгружает
+            for key in provider.manager_keys:
+                model_manager.pin(key)
+            print(f"[Preload] {name} ready: {state}")
+        except Exception as e:
+            state.update(status="error", error=str(e))
+            print(f"[Preload] {name} failed: {e}")
+
+
+def get_readiness() -> tuple[bool, dict[str, dict]]:
+    """
+    (готов ли сервис, состояние по провайдерам).
+    Готов — когда все провайдеры из предзагрузки в статусе ready.
+    """
+    states = {name: dict(_readiness.get(name, {"status": "pending"})) for name in config.STT_PRELOAD}
+    states.update({name: dict(state) for name, state in _readiness.items()})
+    ready = all(state["status"] == "ready" for state in states.values())
+    return ready, states
@@ -1,6 +1,50 @@
+import os
+import tempfile
+import wave
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+from app.core import config
+
+
+@dataclass
+class TranscriptionOptions:
+    """
+    Параметры распознавания, которые можно переопределить на уровне запроса.
+    None означает "как настроено для деплоя" (env провайдера).
+    
+    Attributes:
+        batched: Батчевый режим (Whisper: BatchedInferencePipeline по VAD-чанкам)
+        batch_size: Размер батча для батчевого режима
+    """
+    batched: Optional[bool] = None
+    batch_size: Optional[int] = None
+
+    @classmethod
+    def from_fields(cls, fields: dict) -> "TranscriptionOptions":
+        """
+        Собирает опции из строковых полей формы (потоковый multipart, сохранённая job).
+        Неизвестные и пустые поля игнорируются.
+        """
+        def as_bool(value) -> Optional[bool]:
+            if value is None or value == "":
+                return None
+            if isinstance(value, bool):
+                return value
+            return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+        def as_int(value) -> Optional[int]:
+            if value is None or value == "":
+                return None
+            return int(value)
+
+        return cls(
+            batched=as_bool(fields.get("batched")),
+            batch_size=as_int(fields.get("batch_size")),
+        )
 
 
 @dataclass
@@ -12,10 +56,80 @@ class TranscriptionResult:
         language: Определенный язык аудио (например, 'ru', 'en')
         transcript: Распознанный текст
         provider: Имя провайдера, выполнившего транскрибацию
+        tier: Какие модели каскада понадобились (например, 'base' или 'base+small');
+              None — каскад не использовался
     """
     language: str
     transcript: str
     provider: str
+    tier: Optional[str] = None
+
+
+@dataclass
+class TranscriptionSegment:
+    """
+    Фрагмент распознанного текста с таймкодами (секунды от начала аудио).
+    Отдаётся из STTProvider.transcribe_stream по мере декодирования.
+    """
+    start: float
+    end: float
+    text: str
+
+
+def to_model_rate(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Приводит PCM к виду, который ждут модели: float32, mono, config.AUDIO_SAMPLE_RATE.
+    Если частота другая — линейная передискретизация (для речи этого достаточно).
+    """
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32) / 32768.0
+    else:
+        samples = samples.astype(np.float32, copy=False)
+
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1, dtype=np.float32)
+
+    target_rate = config.AUDIO_SAMPLE_RATE
+    if sample_rate != target_rate and samples.size:
+        n_out = int(round(samples.size * target_rate / sample_rate))
+        x_old = np.arange(samples.size, dtype=np.float64) / sample_rate
+        x_new = np.arange(n_out, dtype=np.float64) / target_rate
+        samples = np.interp(x_new, x_old, samples).astype(np.float32)
+
+    return samples
+
+
+def warmup_signal(seconds: float = 3.0) -> np.ndarray:
+    """Синтетическое "речеподобное" аудио для прогрева моделей."""
+    sr = config.AUDIO_SAMPLE_RATE
+    t = np.arange(int(seconds * sr)) / sr
+    voiced = sum(np.sin(2 * np.pi * k * 150 * t) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    noise = np.random.default_rng(0).normal(0, 0.01, t.size)
+    return (0.1 * voiced * envelope + noise).astype(np.float32)
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    """Читает 16-битный WAV в float32 PCM (каналы сводятся в моно в to_model_rate)."""
+    with wave.open(path, "rb") as wf:
+        sample_rate = wf.getframerate()
+        channels = wf.getnchannels()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+    if channels > 1:
+        pcm = pcm.reshape(-1, channels)
+    return pcm.astype(np.float32) / 32768.0, sample_rate
+
+
+def write_wav(samples: np.ndarray, sample_rate: int, path: str) -> None:
+    """Пишет float32 PCM в 16-битный mono WAV."""
+    pcm = np.clip(samples, -1.0, 1.0)
+    pcm = (pcm * 32767.0).astype("<i2")
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
 
 
 class STTProvider(ABC):
@@ -27,12 +141,17 @@ class STTProvider(ABC):
     """
     
     @abstractmethod
-    async def transcribe(self, audio_path: str) -> TranscriptionResult:
+    async def transcribe(
+        self,
+        audio_path: str,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
         """
         Распознает речь из аудиофайла.
         
         Args:
             audio_path: Путь к аудиофайлу (WAV, 16kHz mono)
+            options: Переопределения параметров для этого запроса
             
         Returns:
             TranscriptionResult с языком и распознанным текстом
@@ -41,7 +160,73 @@ class STTProvider(ABC):
             RuntimeError: При ошибке распознавания
         """
         pass
+
+    async def transcribe_array(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
+        """
+        Распознает речь из PCM-буфера в памяти.
+
+        Реализация по умолчанию — запасной путь для провайдеров, которые умеют
+        работать только с файлами: пишет временный WAV и вызывает transcribe().
+        Whisper и GigaAM переопределяют метод и принимают массив напрямую.
+
+        Args:
+            samples: Аудио (float32 в [-1, 1] или int16), mono
+            sample_rate: Частота дискретизации samples
+            options: Переопределения параметров для этого запроса
+
+        Returns:
+            TranscriptionResult с языком и распознанным текстом
+        """
+        samples = to_model_rate(samples, sample_rate)
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+            wav_path = tmp.name
+        try:
+            write_wav(samples, config.AUDIO_SAMPLE_RATE, wav_path)
+            return await self.transcribe(wav_path, options)
+        finally:
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+    async def transcribe_stream(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> AsyncIterator[TranscriptionSegment]:
+        """
+        Распознает PCM-буфер и отдаёт сегменты по мере готовности, не дожидаясь
+        конца всего аудио.
+
+        Реализация по умолчанию — один сегмент на всё аудио после transcribe_array;
+        Whisper и GigaAM переопределяют метод и отдают сегменты по одному.
+
+        Args:
+            samples: Аудио (float32 в [-1, 1] или int16), mono
+            sample_rate: Частота дискретизации samples
+            options: Переопределения параметров для этого запроса
+
+        Yields:
+            TranscriptionSegment в порядке следования в аудио
+        """
+        result = await self.transcribe_array(samples, sample_rate, options)
+        if result.transcript:
+            yield TranscriptionSegment(start=0.0, end=len(samples) / sample_rate, text=result.transcript)
     
+    async def warmup(self) -> None:
+        """
+        Прогрев после загрузки: один прогон синтетического аудио, чтобы первый
+        настоящий запрос не платил за инициализацию ядер/аллокаторов.
+        Провайдеры с VAD переопределяют метод и гоняют модель в обход VAD
+        (иначе синтетика может быть целиком отброшена как тишина).
+        """
+        await self.transcribe_array(warmup_signal(), config.AUDIO_SAMPLE_RATE)
+
     @abstractmethod
     def get_name(self) -> str:
         """
@@ -72,6 +257,36 @@ class STTProvider(ABC):
         """
         pass
     
+    @property
+    def manager_key(self) -> str:
+        """Ключ модели в менеджере моделей: '<провайдер>:<модель>'."""
+        return f"{self.get_name()}:{self.get_model_name()}"
+
+    @property
+    def manager_keys(self) -> list[str]:
+        """Все модели, на которых работает провайдер (у каскада их несколько)."""
+        return [self.manager_key]
+
+    def unload(self) -> None:
+        """
+        Выгружает модель из памяти (вызывается менеджером моделей по бюджету/TTL).
+        Следующий запрос загрузит её заново.
+        """
+        pass
+
+    def get_decoding_params(self, options: Optional[TranscriptionOptions] = None) -> dict:
+        """
+        Параметры декодирования, влияющие на текст результата.
+        Входят в ключ кэша транскриптов вместе с именем провайдера и модели.
+        
+        Args:
+            options: Переопределения запроса (учитываются так же, как при распознавании)
+        
+        Returns:
+            Словарь параметров (пустой, если влияющих параметров нет)
+        """
+        return {}
+    
     def is_loaded(self) -> bool:
         """
         Проверяет, загружена ли модель.
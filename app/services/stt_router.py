@@ -0,0 +1,170 @@
+"""
+Маршрутизация запросов между STT провайдерами по ожидаемому времени ответа.
+
+Для каждой модели (ключ менеджера моделей, например "whisper:small") router
+держит скользящий real-time factor (время распознавания / длительность аудио)
+и число запросов в работе. Запрос уходит туда, где он закончится раньше всего:
+
+    (в работе + 1) * RTF * средняя длительность аудио [+ время загрузки, если модель выгружена]
+
+Политика поверх этого: каждый провайдер получает не меньше min_share
+последних решений (например, чтобы эксперимент набирал статистику даже на
+более медленной модели).
+
+choose() сразу занимает на выбранной модели слот "в работе" (Reservation):
+всплеск одновременных запросов видит друг друга ещё до загрузки файла и VAD
+и расходится по провайдерам. Слот забирает track(), а если запрос до модели
+не дошёл (кэш, ошибка, клиент ушёл) — освобождает Reservation.release().
+"""
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+from app.core import config
+
+
+class Reservation:
+    """Слот "в работе" на модели key, занятый решением router'а."""
+
+    def __init__(self, router: "LatencyRouter", key: str):
+        self.key = key
+        self._router = router
+        self._held = True
+
+    def _take(self) -> bool:
+        held, self._held = self._held, False
+        return held
+
+    def release(self) -> None:
+        """Запрос не дошёл до модели: слот освобождается (повторный вызов ничего не делает)."""
+        if self._take():
+            self._router._release(self.key)
+
+
+class LatencyRouter:
+    def __init__(
+        self,
+        min_share: float = 0.0,
+        default_rtf: float = 0.3,
+        cold_start_sec: float = 20.0,
+        alpha: float = 0.2,
+        window: int = 200,
+    ):
+        self._min_share = min_share
+        self._default_rtf = default_rtf
+        self._cold_start = cold_start_sec
+        self._alpha = alpha
+        self._rtf: dict[str, float] = {}
+        self._inflight: dict[str, int] = {}
+        self._served: dict[str, int] = {}
+        # средняя длительность аудио: на момент выбора провайдера она ещё неизвестна
+        self._audio_sec = 60.0
+        self._decisions: deque[str] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def expected_sec(self, key: str, loaded: bool = True, load_sec: Optional[float] = None) -> float:
+        """Ожидаемое время до готовности ответа, если отправить запрос на key."""
+        rtf = self._rtf.get(key, self._default_rtf)
+        expected = (self._inflight.get(key, 0) + 1) * rtf * self._audio_sec
+        if not loaded:
+            expected += load_sec if load_sec is not None else self._cold_start
+        return expected
+
+    def choose(self, candidates: dict[str, dict]) -> Reservation:
+        """
+        Выбор модели. candidates: ключ -> {"loaded": bool, "load_sec": float | None}.
+        Сначала — провайдер, недобравший min_share в окне последних решений,
+        иначе — с минимальным ожидаемым временем. Запрос сразу считается в работе
+        на выбранной модели; в окно решений он попадает, когда track() заберёт слот.
+        """
+        with self._lock:
+            keys = list(candidates)
+            choice = None
+            if self._min_share > 0 and self._decisions:
+                shares = {k: self._decisions.count(k) / len(self._decisions) for k in keys}
+                starving = [k for k in keys if shares[k] < self._min_share]
+                if starving:
+                    choice = min(starving, key=lambda k: shares[k])
+            if choice is None:
+                choice = min(keys, key=lambda k: self.expected_sec(
+                    k, candidates[k].get("loaded", True), candidates[k].get("load_sec")
+                ))
+            self._inflight[choice] = self._inflight.get(choice, 0) + 1
+            return Reservation(self, choice)
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._inflight[key] -= 1
+
+    @contextlib.contextmanager
+    def track(
+        self,
+        key: str,
+        audio_sec: Optional[float],
+        loaded: bool = True,
+        reservation: Optional[Reservation] = None,
+        measure: bool = True,
+    ) -> Iterator[None]:
+        """
+        Оборачивает распознавание на модели key: пока блок идёт, запрос считается
+        в работе; по завершении обновляются RTF модели и средняя длительность аудио.
+
+        reservation — слот из choose() для этой модели: блок забирает его вместо
+        нового и засчитывает решение router'а.
+        loaded=False — модель ещё не загружена и грузится внутри блока: время
+        такого запроса в RTF не идёт (загрузку и так учитывает expected_sec).
+        measure=False — время блока не отражает скорость модели (например, SSE
+        ждёт медленного клиента): RTF не обновляется.
+        """
+        routed = reservation is not None and reservation.key == key and reservation._take()
+        with self._lock:
+            if routed:
+                self._decisions.append(key)
+            else:
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+        t0 = time.time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            elapsed = time.time() - t0
+            with self._lock:
+                self._inflight[key] -= 1
+                if ok and audio_sec:
+                    if loaded and measure:
+                        # от default_rtf, а не с первого замера: один выброс не выключает провайдер
+                        rtf = elapsed / audio_sec
+                        prev = self._rtf.get(key, self._default_rtf)
+                        self._rtf[key] = prev + self._alpha * (rtf - prev)
+                    self._audio_sec += self._alpha * (audio_sec - self._audio_sec)
+                    self._served[key] = self._served.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        """Состояние router'а для мониторинга."""
+        with self._lock:
+            keys = set(self._rtf) | set(self._inflight) | set(self._decisions)
+            total = len(self._decisions)
+            return {
+                "min_share": self._min_share,
+                "mean_audio_sec": round(self._audio_sec, 1),
+                "providers": {
+                    k: {
+                        "rtf": round(self._rtf[k], 3) if k in self._rtf else None,
+                        "inflight": self._inflight.get(k, 0),
+                        "served": self._served.get(k, 0),
+                        "share": round(self._decisions.count(k) / total, 3) if total else 0.0,
+                        "expected_sec": round(self.expected_sec(k), 2),
+                    }
+                    for k in sorted(keys)
+                },
+            }
+
+
+stt_router = LatencyRouter(
+    min_share=config.STT_ROUTING_MIN_SHARE_PERCENT / 100,
+    default_rtf=config.STT_ROUTING_DEFAULT_RTF,
+    cold_start_sec=config.STT_ROUTING_COLD_START_SEC,
+)
@@ -0,0 +1,112 @@
+"""
+Кэш транскриптов по содержимому загрузки.
+
+Ключ — sha256 байтов исходного файла + провайдер + модель + параметры декодирования,
+поэтому повторно присланное видео (ретраи, репосты в разные каналы) не гоняется
+через ffmpeg и модель ещё раз.
+
+Хранение в Redis:
+- transcripts:cache:<sha256>:<provider>:<model>:<params> — JSON результата с TTL;
+- transcripts:cache:lru — ZSET ключ -> время последнего обращения, по нему
+  вытесняются самые старые записи сверх TRANSCRIPT_CACHE_MAX_ENTRIES;
+- transcripts:cache:stats — счётчики hits/misses.
+
+Любые ошибки Redis глушим: кэш не должен ломать распознавание. Обращения —
+через redis.asyncio, event loop API не блокируется.
+"""
+import hashlib
+import json
+import time
+from typing import Any, Optional
+
+from app.core import config
+from app.services.redis_client import async_redis_client
+from app.services.stt_provider import STTProvider, TranscriptionOptions
+
+CACHE_PREFIX = "transcripts:cache"
+LRU_KEY = f"{CACHE_PREFIX}:lru"
+STATS_KEY = f"{CACHE_PREFIX}:stats"
+
+
+def make_key(
+    content_sha256: str,
+    provider: STTProvider,
+    extra: Optional[dict] = None,
+    options: Optional[TranscriptionOptions] = None,
+) -> str:
+    """
+    Ключ кэша для файла с данным sha256 и конкретной конфигурации распознавания.
+    extra — параметры пайплайна вне провайдера (например, нормализация громкости),
+    options — переопределения запроса.
+    """
+    params = {**provider.get_decoding_params(options), **(extra or {})}
+    params_digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{CACHE_PREFIX}:{content_sha256}:{provider.get_name()}:{provider.get_model_name()}:{params_digest}"
+
+
+async def get_cached(key: str) -> Optional[dict[str, Any]]:
+    """Возвращает закэшированный результат или None. Считает hit/miss."""
+    if not config.TRANSCRIPT_CACHE_ENABLED:
+        return None
+    try:
+        data = await async_redis_client.get(key)
+        pipe = async_redis_client.pipeline(transaction=False)
+        if data:
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.hincrby(STATS_KEY, "hits", 1)
+        else:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+        await pipe.execute()
+        return json.loads(data) if data else None
+    except Exception as e:
+        print(f"[TranscriptCache] get failed: {e}")
+        return None
+
+
+async def put_cached(key: str, value: dict[str, Any]) -> None:
+    """Сохраняет результат с TTL и вытесняет самые давние записи сверх лимита."""
+    if not config.TRANSCRIPT_CACHE_ENABLED:
+        return
+    ttl = config.TRANSCRIPT_CACHE_TTL_SEC
+    max_entries = config.TRANSCRIPT_CACHE_MAX_ENTRIES
+    now = time.time()
+    try:
+        pipe = async_redis_client.pipeline(transaction=False)
+        pipe.set(key, json.dumps(value), ex=ttl)
+        pipe.zadd(LRU_KEY, {key: now})
+        # записи, которые уже истекли по TTL, из индекса тоже убираем
+        pipe.zremrangebyscore(LRU_KEY, "-inf", now - ttl)
+        pipe.zcard(LRU_KEY)
+        *_, size = await pipe.execute()
+
+        overflow = size - max_entries
+        if overflow > 0:
+            evicted = [k for k, _ in await async_redis_client.zpopmin(LRU_KEY, overflow)]
+            if evicted:
+                await async_redis_client.delete(*evicted)
+    except Exception as e:
+        print(f"[TranscriptCache] put failed: {e}")
+
+
+async def get_stats() -> dict[str, Any]:
+    """Счётчики кэша для мониторинга."""
+    try:
+        raw = await async_redis_client.hgetall(STATS_KEY)
+        entries = await async_redis_client.zcard(LRU_KEY)
+    except Exception as e:
+        return {"enabled": config.TRANSCRIPT_CACHE_ENABLED, "error": str(e)}
+
+    hits = int(raw.get("hits", 0))
+    misses = int(raw.get("misses", 0))
+    total = hits + misses
+    return {
+        "enabled": config.TRANSCRIPT_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "entries": entries,
+        "max_entries": config.TRANSCRIPT_CACHE_MAX_ENTRIES,
+        "ttl_sec": config.TRANSCRIPT_CACHE_TTL_SEC,
+    }
@@ -0,0 +1,352 @@
+"""
+Потоковый приём multipart-загрузок.
+
+FastAPI/Starlette сначала целиком разбирают multipart (в SpooledTemporaryFile)
+и только потом вызывают эндпоинт. Здесь тело запроса разбирается по мере
+поступления, а байты файла сразу уходят в sink:
+- PCMStreamSink — в stdin ffmpeg, декодирование идёт параллельно с загрузкой;
+- FileSink — прямо в итоговый файл на диске, без промежуточной копии.
+
+Запись на диск идёт через asyncio.to_thread: медленный диск не должен
+останавливать event loop, на котором принимаются остальные загрузки.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Optional, Protocol
+
+import numpy as np
+from starlette.requests import Request
+
+try:
+    import multipart
+    from multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart >= 0.0.13
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+
+from app.core import config
+from app.services.audio_preprocessing import loudnorm_filter
+from app.services.audio_service import extract_pcm_from_path
+
+
+class UploadError(ValueError):
+    """Некорректная загрузка (тип, размер, формат multipart) — клиенту отдаём 400."""
+
+
+@dataclass
+class StreamedUpload:
+    """Метаданные загруженного файла и обычные поля формы."""
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    size: int = 0
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+class UploadSink(Protocol):
+    async def open(self, upload: StreamedUpload) -> None: ...
+
+    async def write(self, chunk: bytes) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def abort(self) -> None: ...
+
+
+async def read_multipart_stream(
+    request: Request,
+    sink: UploadSink,
+    file_field: str = "file",
+    max_bytes: Optional[int] = None,
+    content_type_prefix: Optional[str] = None,
+) -> StreamedUpload:
+    """
+    Разбирает multipart/form-data из request.stream() по мере прихода чанков.
+
+    Байты поля file_field передаются в sink сразу, остальные поля формы
+    собираются в StreamedUpload.fields. Тип и размер файла проверяются
+    на лету — на неправильной загрузке не ждём конца тела запроса.
+
+    Raises:
+        UploadError: неверный тип/размер файла, нет файла, не multipart
+    """
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Ожидается multipart/form-data.")
+
+    upload = StreamedUpload()
+    messages: list[tuple[str, object]] = []
+    header_field = b""
+    header_value = b""
+
+    def on_part_begin() -> None:
+        messages.append(("begin", None))
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        messages.append(("data", data[start:end]))
+
+    def on_part_end() -> None:
+        messages.append(("end", None))
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        nonlocal header_field
+        header_field += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        nonlocal header_value
+        header_value += data[start:end]
+
+    def on_header_end() -> None:
+        nonlocal header_field, header_value
+        messages.append(("header", (header_field.lower(), header_value)))
+        header_field = b""
+        header_value = b""
+
+    def on_headers_finished() -> None:
+        messages.append(("headers", None))
+
+    parser = multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    part_headers: dict[bytes, bytes] = {}
+    current: Optional[str] = None  # "file" | "field" | "skip"
+    field_name = ""
+    field_value = bytearray()
+    file_seen = False
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            for kind, payload in messages:
+                if kind == "begin":
+                    part_headers = {}
+                elif kind == "header":
+                    name, value = payload
+                    part_headers[name] = value
+                elif kind == "headers":
+                    _, options = parse_options_header(part_headers.get(b"content-disposition", b""))
+                    field_name = options.get(b"name", b"").decode("utf-8", "replace")
+
+                    if field_name == file_field and b"filename" in options and not file_seen:
+                        file_seen = True
+                        current = "file"
+                        upload.filename = options[b"filename"].decode("utf-8", "replace")
+                        upload.content_type = part_headers.get(b"content-type", b"").decode("latin-1") or None
+                        if content_type_prefix and not (upload.content_type or "").startswith(content_type_prefix):
+                            raise UploadError(f"Неверный тип файла: {upload.content_type}. Загрузите видео.")
+                        await sink.open(upload)
+                    elif b"filename" in options:
+                        current = "skip"
+                    else:
+                        current = "field"
+                        field_value = bytearray()
+                elif kind == "data":
+                    if current == "file":
+                        upload.size += len(payload)
+                        if max_bytes is not None and upload.size > max_bytes:
+                            raise UploadError(
+                                f"Максимальный размер файла — {max_bytes // (1024 * 1024)} МБ."
+                            )
+                        await sink.write(payload)
+                    elif current == "field":
+                        field_value += payload
+                elif kind == "end":
+                    if current == "file":
+                        await sink.close()
+                    elif current == "field":
+                        upload.fields[field_name] = field_value.decode("utf-8", "replace")
+                    current = None
+
+            messages.clear()
+
+        parser.finalize()
+
+        if not file_seen:
+            raise UploadError(f"В запросе нет файла в поле '{file_field}'.")
+        if upload.size == 0:
+            raise UploadError("Файл пуст.")
+    except BaseException:
+        await sink.abort()
+        raise
+
+    return upload
+
+
+def _remove_file(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class FileSink:
+    """
+    Пишет файл сразу в итоговое место (без промежуточного SpooledTemporaryFile и копирования).
+    По пути считает sha256 содержимого.
+    """
+
+    def __init__(self, path_factory: Callable[[StreamedUpload], str]):
+        self._path_factory = path_factory
+        self._file = None
+        self._hasher = hashlib.sha256()
+        self.path: Optional[str] = None
+
+    @property
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    async def open(self, upload: StreamedUpload) -> None:
+        self.path = self._path_factory(upload)
+        self._file = await asyncio.to_thread(open, self.path, "wb")
+
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._write, chunk)
+
+    def _write(self, chunk: bytes) -> None:
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+
+    async def abort(self) -> None:
+        await self.close()
+        if self.path:
+            await asyncio.to_thread(_remove_file, self.path)
+
+
+class PCMStreamSink:
+    """
+    ffmpeg декодирует загрузку из stdin прямо во время приёма тела запроса,
+    на выходе — float32 PCM 16kHz mono в памяти.
+
+    Байты параллельно пишутся во временный файл: некоторые контейнеры
+    (mp4 с moov-атомом в конце) нельзя декодировать из пайпа — тогда после
+    загрузки повторяем извлечение уже по файлу. По пути считается sha256.
+    """
+
+    def __init__(self, target_lufs: Optional[float] = None):
+        self._target_lufs = target_lufs
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._stdout_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._pipe_ok = True
+        self._spool = None
+        self._spool_path: Optional[str] = None
+        self._hasher = hashlib.sha256()
+        self._t0 = 0.0
+
+    @property
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    async def open(self, upload: StreamedUpload) -> None:
+        suffix = os.path.splitext(upload.filename or "")[1] or ".mp4"
+        self._spool_path, self._spool = await asyncio.to_thread(self._open_spool, suffix)
+
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0"]
+        if self._target_lufs is not None:
+            cmd += ["-af", loudnorm_filter(self._target_lufs)]
+        cmd += [
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ac", "1", "-ar", str(config.AUDIO_SAMPLE_RATE),
+            "pipe:1",
+        ]
+
+        self._t0 = time.time()
+        self._proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        # stdout/stderr читаем параллельно, иначе ffmpeg упрётся в заполненный пайп
+        self._stdout_task = asyncio.create_task(self._proc.stdout.read())
+        self._stderr_task = asyncio.create_task(self._proc.stderr.read())
+
+    @staticmethod
+    def _open_spool(suffix: str) -> tuple[str, BinaryIO]:
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        return path, os.fdopen(fd, "wb")
+
+    def _write_spool(self, chunk: bytes) -> None:
+        self._hasher.update(chunk)
+        self._spool.write(chunk)
+
+    async def _close_spool(self) -> None:
+        if self._spool is not None and not self._spool.closed:
+            await asyncio.to_thread(self._spool.close)
+
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._write_spool, chunk)
+        if not self._pipe_ok:
+            return
+        try:
+            self._proc.stdin.write(chunk)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg сдался (например, нужен seek) — дальше только во временный файл
+            self._pipe_ok = False
+
+    async def close(self) -> None:
+        await self._close_spool()
+        if self._proc is not None and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+            try:
+                await self._proc.stdin.wait_closed()
+            except (BrokenPipeError, ConnectionResetError):
+                self._pipe_ok = False
+
+    async def abort(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+            await self._proc.wait()
+        for task in (self._stdout_task, self._stderr_task):
+            if task is not None and not task.done():
+                task.cancel()
+        await self._close_spool()
+        await self._remove_spool()
+
+    async def _remove_spool(self) -> None:
+        spool_path, self._spool_path = self._spool_path, None
+        if spool_path:
+            await asyncio.to_thread(_remove_file, spool_path)
+
+    async def digest(self) -> str:
+        """sha256 загруженного файла (полный после того, как тело запроса дочитано)."""
+        return self.sha256
+
+    async def result(self) -> tuple[np.ndarray, Optional[float], int]:
+        """
+        Дожидается ffmpeg и возвращает (samples, duration_sec, ffmpeg_ms),
+        как audio_service.extract_pcm.
+        """
+        out = await self._stdout_task
+        await self._stderr_task
+        returncode = await self._proc.wait()
+
+        if self._pipe_ok and returncode == 0 and out:
+            await self._remove_spool()
+            samples = np.frombuffer(out, dtype=np.float32)
+            ffmpeg_ms = int((time.time() - self._t0) * 1000)
+            return samples, samples.size / config.AUDIO_SAMPLE_RATE, ffmpeg_ms
+
+        # из пайпа не получилось (или ffmpeg ничего не вывел) — обычное извлечение по
+        # временному файлу (он же и удалится); пустой PCM там — RuntimeError
+        spool_path, self._spool_path = self._spool_path, None
+        return await extract_pcm_from_path(
+            spool_path, delete_original=True, target_lufs=self._target_lufs
+        )
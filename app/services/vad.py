@@ -0,0 +1,196 @@
+"""
+Общий VAD-этап пайплайна (до любого STT провайдера).
+
+Карта речи считается один раз на запрос: если речи нет, провайдер вообще не
+вызывается (и модель не загружается), иначе в провайдер уходят только участки
+речи, склеенные через короткие паузы. SpeechMap переводит таймкоды склеенного
+аудио обратно в таймкоды исходного.
+
+Бэкенды (AUDIO_VAD_BACKEND):
+- silero — Silero VAD из faster-whisper (onnxruntime, CPU), точнее на шуме;
+- energy — энергия кадров относительно оценки шума, без зависимостей.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+import numpy as np
+
+from app.core import config
+from app.services.stt_provider import read_wav, to_model_rate
+
+
+@dataclass
+class SpeechMap:
+    """
+    Участки речи (индексы отсчётов исходного аудио) и раскладка склеенного аудио.
+
+    Attributes:
+        spans: [(start, end)] участков речи по возрастанию, без пересечений
+        total_samples: длина исходного аудио
+        sample_rate: частота исходного аудио
+        gap_samples: пауза между участками в склеенном аудио
+    """
+    spans: list[tuple[int, int]]
+    total_samples: int
+    sample_rate: int = config.AUDIO_SAMPLE_RATE
+    gap_samples: int = 0
+    _offsets: list[int] = field(default_factory=list, repr=False)
+
+    def __post_init__(self):
+        offset = 0
+        self._offsets = []
+        for start, end in self.spans:
+            self._offsets.append(offset)
+            offset += end - start + self.gap_samples
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.spans
+
+    @property
+    def speech_samples(self) -> int:
+        return sum(end - start for start, end in self.spans)
+
+    @property
+    def removed_ratio(self) -> float:
+        """Доля исходного аудио, которая не ушла в провайдер."""
+        if self.total_samples <= 0:
+            return 0.0
+        return round(1.0 - self.speech_samples / self.total_samples, 4)
+
+    def compact(self, samples: np.ndarray) -> np.ndarray:
+        """Участки речи подряд, между ними — gap_samples тишины."""
+        if not self.spans:
+            return np.zeros(0, dtype=np.float32)
+        gap = np.zeros(self.gap_samples, dtype=np.float32)
+        parts = []
+        for start, end in self.spans:
+            if parts and self.gap_samples:
+                parts.append(gap)
+            parts.append(samples[start:end].astype(np.float32, copy=False))
+        return np.concatenate(parts)
+
+    def compacted(self) -> "SpeechMap":
+        """Та же карта в координатах склеенного аудио (результата compact())."""
+        spans = [(offset, offset + end - start) for (start, end), offset in zip(self.spans, self._offsets)]
+        total = self._offsets[-1] + spans[-1][1] - spans[-1][0] if spans else 0
+        return SpeechMap(spans=spans, total_samples=total, sample_rate=self.sample_rate, gap_samples=self.gap_samples)
+
+    def to_original(self, t: float) -> float:
+        """Время (сек) в склеенном аудио -> время в исходном."""
+        pos = int(round(t * self.sample_rate))
+        for (start, end), offset in zip(reversed(self.spans), reversed(self._offsets)):
+            if pos >= offset:
+                return min(start + (pos - offset), end) / self.sample_rate
+        return self.spans[0][0] / self.sample_rate if self.spans else t
+
+
+def _merge(spans: list[tuple[int, int]], pad: int, total: int, min_gap: int) -> list[tuple[int, int]]:
+    """Добавляет поля pad и склеивает участки, между которыми меньше min_gap."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(spans):
+        start, end = max(0, start - pad), min(total, end + pad)
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _energy_spans(
+    samples: np.ndarray,
+    sample_rate: int,
+    frame_ms: int = 30,
+    min_speech_ms: int = 150,
+    speech_margin_db: float = 12.0,
+    min_speech_db: float = -50.0,
+) -> list[tuple[int, int]]:
+    """
+    Кадр — речь, если он громче шума (10-й перцентиль громкости кадров) на
+    speech_margin_db и не тише min_speech_db. Короткие всплески отбрасываются.
+    """
+    frame = sample_rate * frame_ms // 1000
+    n_frames = samples.size // frame
+    if n_frames == 0:
+        return []
+    frames = samples[:n_frames * frame].astype(np.float32, copy=False).reshape(n_frames, frame)
+    db = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+    threshold = max(float(np.percentile(db, 10)) + speech_margin_db, min_speech_db)
+    speech = db > threshold
+
+    spans = []
+    min_frames = max(1, min_speech_ms // frame_ms)
+    # границы серий речевых кадров
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    for start, end in zip(edges[::2], edges[1::2]):
+        if end - start >= min_frames:
+            spans.append((int(start) * frame, int(end) * frame))
+    return spans
+
+
+def _silero_spans(samples: np.ndarray, min_silence_ms: int) -> list[tuple[int, int]]:
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    timestamps = get_speech_timestamps(
+        samples, VadOptions(min_silence_duration_ms=min_silence_ms, speech_pad_ms=0)
+    )
+    return [(ts["start"], ts["end"]) for ts in timestamps]
+
+
+def detect_speech(
+    samples: np.ndarray,
+    sample_rate: int = config.AUDIO_SAMPLE_RATE,
+    backend: Optional[str] = None,
+    pad_ms: Optional[int] = None,
+    min_silence_ms: Optional[int] = None,
+    gap_ms: Optional[int] = None,
+) -> SpeechMap:
+    """
+    Карта речи для float32 PCM mono с частотой sample_rate (для silero — 16 кГц).
+    Параметры по умолчанию — из AUDIO_VAD_*.
+    """
+    backend = backend or config.AUDIO_VAD_BACKEND
+    pad = sample_rate * (config.AUDIO_VAD_PAD_MS if pad_ms is None else pad_ms) // 1000
+    min_silence_ms = config.AUDIO_VAD_MIN_SILENCE_MS if min_silence_ms is None else min_silence_ms
+    gap = sample_rate * (config.AUDIO_VAD_GAP_MS if gap_ms is None else gap_ms) // 1000
+
+    if backend == "silero":
+        spans = _silero_spans(samples, min_silence_ms)
+    elif backend == "energy":
+        spans = _energy_spans(samples, sample_rate)
+    else:
+        raise ValueError(f"Неизвестный AUDIO_VAD_BACKEND: {backend} (поддерживаются: silero, energy)")
+
+    # паузы короче min_silence не режем: вместе с полями это бы порвало слова
+    spans = _merge(spans, pad, samples.size, min_gap=sample_rate * min_silence_ms // 1000)
+    return SpeechMap(spans=spans, total_samples=samples.size, sample_rate=sample_rate, gap_samples=gap)
+
+
+def vad_params() -> dict:
+    """Параметры VAD-этапа для ключа кэша транскриптов."""
+    if not config.AUDIO_VAD:
+        return {"vad_stage": None}
+    return {
+        "vad_stage": config.AUDIO_VAD_BACKEND,
+        "vad_pad_ms": config.AUDIO_VAD_PAD_MS,
+        "vad_min_silence_ms": config.AUDIO_VAD_MIN_SILENCE_MS,
+        "vad_gap_ms": config.AUDIO_VAD_GAP_MS,
+    }
+
+
+async def speech_stage(
+    audio: Union[str, np.ndarray],
+) -> tuple[Union[str, np.ndarray], Optional[SpeechMap]]:
+    """
+    VAD-этап пайплайна: аудио (путь к WAV или PCM 16 кГц) -> (только речь, карта речи).
+    При AUDIO_VAD=0 аудио возвращается как есть, карта — None.
+    """
+    if not config.AUDIO_VAD:
+        return audio, None
+    if isinstance(audio, str):
+        samples, sample_rate = await asyncio.to_thread(read_wav, audio)
+        audio = to_model_rate(samples, sample_rate)
+
+    speech_map = await asyncio.to_thread(detect_speech, audio)
+    return speech_map.compact(audio), speech_map
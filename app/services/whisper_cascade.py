@@ -0,0 +1,210 @@
+"""
+Каскад Whisper по уверенности.
+
+Всё аудио сначала распознаёт дешёвая черновая модель (WHISPER_CASCADE_DRAFT_MODEL,
+например base). Сегменты, в которых она не уверена, — низкий avg_logprob,
+высокая no_speech_prob при непустом тексте или подозрительный compression_ratio
+(зацикливание) — перераспознаются основной моделью (WHISPER_MODEL). Соседние
+такие сегменты склеиваются в один регион, чтобы основной модели хватало контекста.
+
+Черновая и основная модели — обычные WhisperProvider из менеджера моделей,
+каскад сам весов не держит.
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app.core import config
+from app.services.model_manager import model_manager
+from app.services.stt_provider import (
+    STTProvider,
+    TranscriptionOptions,
+    TranscriptionResult,
+    read_wav,
+    to_model_rate,
+)
+from app.services.whisper_provider import WhisperProvider, get_whisper_provider
+
+
+@dataclass
+class _Region:
+    """Участок аудио (сек), который перераспознаёт основная модель."""
+    start: float
+    end: float
+
+
+class WhisperCascadeProvider(STTProvider):
+    def __init__(self):
+        self._draft_name = os.getenv("WHISPER_CASCADE_DRAFT_MODEL", "base")
+        self._final_name = os.getenv("WHISPER_CASCADE_FINAL_MODEL", config.WHISPER_MODEL)
+
+        # сегмент эскалируется, если выходит за любой из порогов
+        self._min_logprob = float(os.getenv("WHISPER_CASCADE_MIN_LOGPROB", "-0.5"))
+        self._max_no_speech = float(os.getenv("WHISPER_CASCADE_MAX_NO_SPEECH", "0.5"))
+        self._max_compression = float(os.getenv("WHISPER_CASCADE_MAX_COMPRESSION", "2.2"))
+
+        # склейка соседних сегментов в регион и поля вокруг него
+        self._merge_gap = float(os.getenv("WHISPER_CASCADE_MERGE_GAP_SEC", "1.0"))
+        self._max_region = float(os.getenv("WHISPER_CASCADE_MAX_REGION_SEC", "30"))
+        self._pad = float(os.getenv("WHISPER_CASCADE_PAD_SEC", "0.2"))
+
+        # сколько аудио (сек) прошло через каскад и сколько из него ушло основной модели
+        self._audio_sec = 0.0
+        self._escalated_sec = 0.0
+
+        print(
+            f"[WhisperCascade] draft={self._draft_name} final={self._final_name} "
+            f"min_logprob={self._min_logprob} max_no_speech={self._max_no_speech} "
+            f"max_compression={self._max_compression}"
+        )
+
+    def _draft(self) -> WhisperProvider:
+        return get_whisper_provider(self._draft_name)
+
+    def _final(self) -> WhisperProvider:
+        return get_whisper_provider(self._final_name)
+
+    @property
+    def manager_keys(self) -> list[str]:
+        return [self._draft().manager_key, self._final().manager_key]
+
+    def _load_model(self) -> None:
+        self._draft()._load_model()
+        self._final()._load_model()
+
+    # ---------- выбор сегментов ----------
+
+    def _needs_escalation(self, seg) -> bool:
+        if seg.avg_logprob < self._min_logprob:
+            return True
+        if seg.compression_ratio > self._max_compression:
+            return True
+        # черновая модель сомневается, речь ли это, но что-то написала
+        return seg.no_speech_prob > self._max_no_speech and bool(seg.text.strip())
+
+    def _regions(self, segments: list) -> list[_Region]:
+        """Неуверенные сегменты, склеенные в регионы не длиннее WHISPER_CASCADE_MAX_REGION_SEC."""
+        regions: list[_Region] = []
+        for seg in segments:
+            if not self._needs_escalation(seg):
+                continue
+            last = regions[-1] if regions else None
+            if (
+                last is not None
+                and seg.start - last.end <= self._merge_gap
+                and seg.end - last.start <= self._max_region
+            ):
+                last.end = seg.end
+            else:
+                regions.append(_Region(seg.start, seg.end))
+        return regions
+
+    # ---------- распознавание ----------
+
+    async def _cascade(self, audio: np.ndarray, options: Optional[TranscriptionOptions]) -> TranscriptionResult:
+        draft, final = self._draft(), self._final()
+        rate = config.AUDIO_SAMPLE_RATE
+
+        with model_manager.use(draft.manager_key):
+            segments = await draft.transcribe_segments(audio, rate, options)
+        regions = self._regions(segments)
+
+        # (начало, текст) по порядку: уверенные сегменты черновика + регионы основной модели
+        parts = [
+            (seg.start, seg.text.strip())
+            for seg in segments
+            if not any(r.start <= seg.start and seg.end <= r.end for r in regions)
+        ]
+
+        if regions:
+            def cut(region: _Region) -> np.ndarray:
+                start = max(0, int((region.start - self._pad) * rate))
+                return audio[start:int((region.end + self._pad) * rate)]
+
+            with model_manager.use(final.manager_key):
+                results = await asyncio.gather(*(
+                    final.transcribe_array(cut(region), rate, options) for region in regions
+                ))
+            parts.extend((region.start, result.transcript) for region, result in zip(regions, results))
+
+        self._audio_sec += audio.size / rate
+        self._escalated_sec += sum(r.end - r.start for r in regions)
+
+        return TranscriptionResult(
+            language="ru",
+            transcript=" ".join(text for _, text in sorted(parts, key=lambda p: p[0]) if text),
+            provider=self.get_name(),
+            tier=f"{self._draft_name}+{self._final_name}" if regions else self._draft_name,
+        )
+
+    async def transcribe(
+        self,
+        audio_path: str,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
+        # регионы режутся из массива, поэтому WAV читаем сами
+        samples, sample_rate = await asyncio.to_thread(read_wav, audio_path)
+        return await self.transcribe_array(samples, sample_rate, options)
+
+    async def transcribe_array(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
+        audio = to_model_rate(samples, sample_rate)
+        if audio.size == 0:
+            return TranscriptionResult(language="ru", transcript="", provider=self.get_name(), tier=self._draft_name)
+        return await self._cascade(audio, options)
+
+    async def warmup(self) -> None:
+        await self._draft().warmup()
+        await self._final().warmup()
+
+    def get_name(self) -> str:
+        return "whisper"
+
+    def get_device(self) -> str:
+        return self._final().get_device()
+
+    def get_model_name(self) -> str:
+        return f"cascade:{self._draft_name}>{self._final_name}"
+
+    def get_decoding_params(self, options: Optional[TranscriptionOptions] = None) -> dict:
+        return {
+            **self._final().get_decoding_params(options),
+            "cascade": {
+                "draft": self._draft_name,
+                "final": self._final_name,
+                "min_logprob": self._min_logprob,
+                "max_no_speech": self._max_no_speech,
+                "max_compression": self._max_compression,
+                "merge_gap_sec": self._merge_gap,
+                "max_region_sec": self._max_region,
+            },
+        }
+
+    def is_loaded(self) -> bool:
+        return self._draft().is_loaded() and self._final().is_loaded()
+
+    def get_cascade_stats(self) -> dict:
+        """Какая доля аудио ушла основной модели."""
+        return {
+            "audio_sec": round(self._audio_sec, 1),
+            "escalated_sec": round(self._escalated_sec, 1),
+            "escalated_ratio": round(self._escalated_sec / self._audio_sec, 3) if self._audio_sec else 0.0,
+        }
+
+
+_cascade_provider: Optional[WhisperCascadeProvider] = None
+
+
+def get_whisper_cascade_provider() -> WhisperCascadeProvider:
+    """Singleton каскада (модели внутри — общие с обычными Whisper-провайдерами)."""
+    global _cascade_provider
+    if _cascade_provider is None:
+        _cascade_provider = WhisperCascadeProvider()
+    return _cascade_provider
@@ -1,12 +1,27 @@
 import os
 import asyncio
 import concurrent.futures
-from typing import Optional
+import functools
+import threading
+from typing import AsyncIterator, NamedTuple, Optional, Union
 
-from faster_whisper import WhisperModel
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio, get_suppressed_tokens
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 
 from app.core import config
-from app.services.stt_provider import STTProvider, TranscriptionResult
+from app.services.batch_scheduler import MicroBatcher
+from app.services.model_manager import model_manager
+from app.services.stt_provider import (
+    STTProvider,
+    TranscriptionOptions,
+    TranscriptionResult,
+    TranscriptionSegment,
+    to_model_rate,
+    warmup_signal,
+)
 
 
 class STTInitError(RuntimeError):
@@ -14,6 +29,58 @@ class STTInitError(RuntimeError):
     pass
 
 
+class _Decoded(NamedTuple):
+    """Гипотеза для одного чанка батча и метрики, по которым её проверяют пороги."""
+    text: str
+    avg_logprob: float
+    compression_ratio: float
+    no_speech_prob: float
+
+
+class _Replica:
+    """
+    Одна копия модели со своим executor'ом.
+
+    workers потоков executor'а = num_workers CTranslate2: столько вызовов модель
+    обслуживает одновременно. cores — ядра, к которым прибиты потоки реплики
+    (None — без пиннинга).
+    """
+
+    def __init__(self, index: int, workers: int, cores: Optional[list[int]] = None):
+        self.index = index
+        self.workers = workers
+        self.cores = cores
+        self.model: Optional[WhisperModel] = None
+        self.batched: Optional[BatchedInferencePipeline] = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.inflight = 0
+        self.served = 0
+        # потоки executor'а (и все потоки, которые CTranslate2 создаст из них) наследуют affinity
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"whisper-{index}",
+            initializer=self._pin,
+        )
+
+    def _pin(self) -> None:
+        if self.cores:
+            os.sched_setaffinity(0, self.cores)
+
+    @property
+    def load(self) -> float:
+        return self.inflight / self.workers
+
+    def stats(self) -> dict:
+        return {
+            "index": self.index,
+            "inflight": self.inflight,
+            "served": self.served,
+            "workers": self.workers,
+            "cores": self.cores,
+            "batcher": self.batcher.stats() if self.batcher is not None else None,
+        }
+
+
 class WhisperProvider(STTProvider):
     """
     faster-whisper (CTranslate2) + Silero VAD (через onnxruntime CPU).
@@ -24,14 +91,28 @@ class WhisperProvider(STTProvider):
       и НЕ ставим onnxruntime-gpu. :contentReference[oaicite:3]{index=3}
     """
 
-    def __init__(self):
+    def __init__(self, model_name: Optional[str] = None):
         self._model: Optional[WhisperModel] = None
-        self._model_name: Optional[str] = None
-        self._device: str = "cpu"
-        self._compute_type: str = "int8"
-
-        # Один executor на провайдера (не создаём ThreadPoolExecutor на каждый запрос)
-        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # размер модели (tiny/base/small/medium/large-v3...), по умолчанию WHISPER_MODEL
+        self._model_name: str = model_name or config.WHISPER_MODEL
+        # устройство известно до загрузки: по нему model_manager решает, в какой
+        # бюджет (RAM или VRAM) записать модель, и освобождает место под неё
+        self._device, self._compute_type = self._resolve_device()
+
+        # Пул реплик на CPU. Каждая реплика — отдельная WhisperModel со своим executor'ом
+        # (не создаём ThreadPoolExecutor на каждый запрос); запрос уходит в наименее
+        # загруженную. На GPU всегда одна реплика.
+        # - WHISPER_REPLICAS: сколько копий модели держать в памяти;
+        # - WHISPER_NUM_WORKERS: num_workers CTranslate2 — параллельных вызовов на одну копию
+        #   (веса общие, памяти меньше, чем у реплик);
+        # - WHISPER_CPU_THREADS: intra-op потоков на один вызов, 0 — поровну поделить ядра;
+        # - WHISPER_PIN_CORES: прибить каждую реплику к своим ядрам (только Linux).
+        self._replicas: list[_Replica] = []
+        self._replicas_lock = threading.Lock()
+        self._num_replicas = max(1, int(os.getenv("WHISPER_REPLICAS", "1")))
+        self._num_workers = max(1, int(os.getenv("WHISPER_NUM_WORKERS", "1")))
+        self._cpu_threads = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+        self._pin_cores = os.getenv("WHISPER_PIN_CORES", "0") == "1"
 
         # Можно тюнить через env, но дефолты рабочие
         self._vad_enabled = os.getenv("WHISPER_VAD", "1") == "1"
@@ -56,36 +137,127 @@ class WhisperProvider(STTProvider):
         # (часто рекомендуют отключать, если есть галлюцинации на разрывах). :contentReference[oaicite:7]{index=7}
         self._condition_on_previous_text = os.getenv("WHISPER_CONDITION_ON_PREV_TEXT", "0") == "1"
 
+        # Батчевый режим (BatchedInferencePipeline): VAD-чанки речи кодируются/декодируются
+        # пачками по batch_size, а не по одному 30-секундному окну. Дефолт для деплоя,
+        # запрос может переопределить через TranscriptionOptions.
+        self._batched_default = os.getenv("WHISPER_BATCHED", "0") == "1"
+        self._batch_size = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+
+        # Динамический батчинг между запросами: чанки речи всех одновременных запросов
+        # собираются в общий батч (см. MicroBatcher) и идут через модель одним вызовом.
+        # У каждой реплики свой батчер.
+        self._dynamic_batching = os.getenv("WHISPER_DYNAMIC_BATCHING", "0") == "1"
+        self._dynamic_batch_max = int(os.getenv("WHISPER_DYNAMIC_BATCH_MAX", "16"))
+        self._dynamic_batch_wait_ms = float(os.getenv("WHISPER_DYNAMIC_BATCH_WAIT_MS", "30"))
+
+    def _plan_replicas(self) -> list[_Replica]:
+        """
+        Раскладывает доступные ядра по репликам: replicas * num_workers вызовов
+        по cpu_threads потоков каждый.
+        """
+        if self._device != "cpu":
+            return [_Replica(0, self._num_workers)]
+
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        slots = self._num_replicas * self._num_workers
+        if self._cpu_threads <= 0:
+            # ctranslate2 по умолчанию берёт 4 потока на вызов — на многоядерной
+            # машине с одной репликой большая часть ядер простаивает
+            self._cpu_threads = max(1, len(cores) // slots)
+
+        if slots * self._cpu_threads > len(cores):
+            print(
+                f"[WhisperProvider] WARNING: {self._num_replicas} replicas x {self._num_workers} workers x "
+                f"{self._cpu_threads} threads > {len(cores)} cores, pinning disabled"
+            )
+            self._pin_cores = False
+
+        per_replica = self._num_workers * self._cpu_threads
+        return [
+            _Replica(
+                i,
+                self._num_workers,
+                cores[i * per_replica:(i + 1) * per_replica] if self._pin_cores else None,
+            )
+            for i in range(self._num_replicas)
+        ]
+
+    def _create_model(self) -> WhisperModel:
+        # cpu_threads на GPU не используется, 0 — дефолт ctranslate2
+        return WhisperModel(
+            self._model_name,
+            device=self._device,
+            compute_type=self._compute_type,
+            cpu_threads=self._cpu_threads if self._device == "cpu" else 0,
+            num_workers=self._num_workers,
+        )
+
     def _load_model(self) -> None:
         if self._model is not None:
             return
+        with self._replicas_lock:
+            if self._model is None:
+                with model_manager.loading(self.manager_key):
+                    self._load_replicas()
+
+    async def _ensure_loaded(self) -> None:
+        """Загрузка реплик в потоке, а не в event loop (выгрузка по TTL / бюджету делает её частой)."""
+        if self._model is None:
+            await asyncio.get_running_loop().run_in_executor(None, self._load_model)
 
+    def unload(self) -> None:
+        """
+        Выгружает все реплики (вызывается менеджером моделей, в том числе из потока
+        idle reaper'а: батчеры останавливаются в своём event loop, см. MicroBatcher.close).
+        """
+        with self._replicas_lock:
+            replicas, self._replicas = self._replicas, []
+            self._model = None
+            for replica in replicas:
+                if replica.batcher is not None:
+                    replica.batcher.close()
+                # уже запущенные вызовы доработают, модель освободится после них
+                replica.pool.shutdown(wait=False)
+
+    @staticmethod
+    def _resolve_device() -> tuple[str, str]:
+        """(device, compute_type): CUDA во float16, если доступна, иначе CPU в int8."""
         import torch
-        import ctranslate2
 
-        self._model_name = config.WHISPER_MODEL
+        if torch.cuda.is_available():
+            return "cuda", "float16"
+        return "cpu", "int8"
+
+    def _load_replicas(self) -> None:
+
+        import torch
+        import ctranslate2
 
         cuda_version = torch.version.cuda or "unknown"
         ct2_version = getattr(ctranslate2, "__version__", "unknown")
 
-        if torch.cuda.is_available():
-            self._device = "cuda"
-            self._compute_type = "float16"
-        else:
-            self._device = "cpu"
-            self._compute_type = "int8"
-
         print(
             f"[WhisperProvider] Init. model={self._model_name}, device={self._device}, "
             f"compute_type={self._compute_type}, torch.cuda={cuda_version}, ctranslate2={ct2_version}"
         )
 
+        replicas = self._plan_replicas()
         try:
-            self._model = WhisperModel(
-                self._model_name,
-                device=self._device,
-                compute_type=self._compute_type,
-            )
+            for replica in replicas:
+                # грузим в потоке реплики: потоки CTranslate2 унаследуют её affinity
+                replica.model = replica.pool.submit(self._create_model).result()
+                replica.batched = BatchedInferencePipeline(model=replica.model)
+                replica.batcher = MicroBatcher(
+                    functools.partial(self._blocking_transcribe_chunks, replica.model),
+                    replica.pool,
+                    max_batch_size=self._dynamic_batch_max,
+                    max_wait_ms=self._dynamic_batch_wait_ms,
+                    name=f"whisper-batcher-{replica.index}",
+                )
+                print(
+                    f"[WhisperProvider] Replica {replica.index} loaded: workers={replica.workers}, "
+                    f"cpu_threads={self._cpu_threads}, cores={replica.cores}"
+                )
         except Exception as e:
             msg = str(e)
             if "libcudnn_ops" in msg or "cudnnCreateTensorDescriptor" in msg:
@@ -95,35 +267,116 @@ class WhisperProvider(STTProvider):
                 ) from e
             raise
 
+        self._replicas = replicas
+        self._model = replicas[0].model
+
         print("[WhisperProvider] Model loaded OK.")
 
-    def _blocking_transcribe(self, audio_path: str) -> dict:
+    def _pick_replica(self) -> Optional[_Replica]:
+        """
+        Наименее загруженная реплика (по числу запросов в работе на один worker);
+        None — реплики только что выгружены.
         """
+        replicas = self._replicas
+        if not replicas:
+            return None
+        return min(replicas, key=lambda r: (r.load, r.served))
+
+    async def _acquire_replica(self) -> _Replica:
+        """Реплика для запроса; если модель выгрузили между загрузкой и выбором — грузим снова."""
+        while True:
+            await self._ensure_loaded()
+            replica = self._pick_replica()
+            if replica is not None:
+                return replica
+
+    async def _run_on_replica(self, fn, *args):
+        """
+        Выполняет fn(replica, *args) на выбранной реплике. Счётчик inflight
+        меняется только в event loop, поэтому без блокировок.
+        """
+        replica = await self._acquire_replica()
+        replica.inflight += 1
+        try:
+            return await fn(replica, *args)
+        finally:
+            replica.inflight -= 1
+            replica.served += 1
+
+    async def _run_blocking(self, replica: _Replica, audio: Union[str, np.ndarray], batch_size: int) -> dict:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            replica.pool, self._blocking_transcribe, replica, audio, batch_size
+        )
+
+    def _batch_size_for(self, options: Optional[TranscriptionOptions]) -> int:
+        """Размер батча для запроса; 0 — обычный последовательный transcribe."""
+        batched = self._batched_default
+        if options is not None and options.batched is not None:
+            batched = options.batched
+        if not batched:
+            return 0
+        if options is not None and options.batch_size:
+            return max(1, options.batch_size)
+        return max(1, self._batch_size)
+
+    def _iter_segments(self, replica: _Replica, audio: Union[str, np.ndarray], batch_size: int = 0):
+        """
+        Запускает faster-whisper и возвращает (ленивый генератор сегментов, info).
+        Сегменты декодируются по мере итерации — итерировать нужно в потоке реплики.
+
+        audio — путь к файлу или float32 PCM 16kHz mono (faster-whisper принимает оба варианта,
+        для массива пропускается собственное декодирование через PyAV).
+        batch_size > 0 — батчевый режим через BatchedInferencePipeline.
+
         ВАЖНО:
         - VAD (vad_filter=True) режет тишину до транскрибации.
         - no_speech_threshold / log_prob_threshold / compression_ratio_threshold помогают
           снижать мусор на "тишине". :contentReference[oaicite:8]{index=8}
         """
-        if self._model is None:
+        if replica.model is None:
             raise RuntimeError("Model not loaded")
 
-        segments, info = self._model.transcribe(
-            audio_path,
-            language="ru",
-            task="transcribe",
+        if batch_size > 0:
+            # В батчевом режиме VAD обязателен: именно он режет аудио на чанки для батча.
+            # condition_on_previous_text здесь не поддерживается (чанки независимы).
+            segments, info = replica.batched.transcribe(
+                audio,
+                language="ru",
+                task="transcribe",
+                batch_size=batch_size,
+                vad_filter=True,
+                vad_parameters=self._vad_parameters,
+                no_speech_threshold=self._no_speech_threshold,
+                log_prob_threshold=self._log_prob_threshold,
+                compression_ratio_threshold=self._compression_ratio_threshold,
+            )
+        else:
+            segments, info = replica.model.transcribe(
+                audio,
+                language="ru",
+                task="transcribe",
+
+                # === КЛЮЧЕВОЕ: возвращаем VAD ===
+                vad_filter=self._vad_enabled,
+                vad_parameters=self._vad_parameters if self._vad_enabled else None,
+
+                # === Антигаллюцинации/стабильность ===
+                no_speech_threshold=self._no_speech_threshold,
+                log_prob_threshold=self._log_prob_threshold,
+                compression_ratio_threshold=self._compression_ratio_threshold,
+
+                # часто помогает, чтобы “не продолжал мысль” после длинной паузы
+                condition_on_previous_text=self._condition_on_previous_text,
+            )
 
-            # === КЛЮЧЕВОЕ: возвращаем VAD ===
-            vad_filter=self._vad_enabled,
-            vad_parameters=self._vad_parameters if self._vad_enabled else None,
+        return segments, info
 
-            # === Антигаллюцинации/стабильность ===
-            no_speech_threshold=self._no_speech_threshold,
-            log_prob_threshold=self._log_prob_threshold,
-            compression_ratio_threshold=self._compression_ratio_threshold,
+    def _blocking_transcribe(self, replica: _Replica, audio: Union[str, np.ndarray], batch_size: int = 0) -> dict:
+        if isinstance(audio, np.ndarray) and audio.size == 0:
+            return {"language": "ru", "transcript": ""}
 
-            # часто помогает, чтобы “не продолжал мысль” после длинной паузы
-            condition_on_previous_text=self._condition_on_previous_text,
-        )
+        segments, info = self._iter_segments(replica, audio, batch_size)
 
         text_parts = [seg.text for seg in segments]
         full_text = "".join(text_parts).strip()
@@ -133,11 +386,163 @@ class WhisperProvider(STTProvider):
             "transcript": full_text,
         }
 
-    async def transcribe(self, audio_path: str) -> TranscriptionResult:
-        self._load_model()
+    # Длина окна Whisper: один чанк батча — не длиннее 30 секунд
+    CHUNK_SEC = 30
 
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(self._pool, self._blocking_transcribe, audio_path)
+    def _speech_chunks(self, audio: np.ndarray) -> list[np.ndarray]:
+        """
+        Режет аудио на чанки до CHUNK_SEC: по VAD (соседние участки речи склеиваются,
+        пока влезают в окно), без VAD — равными окнами.
+        """
+        sr = config.AUDIO_SAMPLE_RATE
+        max_len = self.CHUNK_SEC * sr
+
+        if not self._vad_enabled:
+            return [audio[i:i + max_len] for i in range(0, audio.size, max_len)]
+
+        timestamps = get_speech_timestamps(audio, VadOptions(**self._vad_parameters))
+
+        spans: list[tuple[int, int]] = []
+        for ts in timestamps:
+            start, end = ts["start"], ts["end"]
+            # сплошная речь длиннее окна — режем принудительно
+            while end - start > max_len:
+                spans.append((start, start + max_len))
+                start += max_len
+            if spans and end - spans[-1][0] <= max_len:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+
+        return [audio[start:end] for start, end in spans]
+
+    # Как у WhisperModel.transcribe: beam search при t=0, при провале — сэмплирование
+    # best_of гипотез с растущей температурой
+    BEAM_SIZE = 5
+    BEST_OF = 5
+    FALLBACK_TEMPERATURES = (0.2, 0.4, 0.6, 0.8, 1.0)
+
+    def _judge(self, tokenizer: Tokenizer, result) -> _Decoded:
+        tokens = result.sequences_ids[0]
+        text = tokenizer.decode(tokens).strip()
+        return _Decoded(
+            text=text,
+            avg_logprob=result.scores[0] * len(tokens) / (len(tokens) + 1),
+            compression_ratio=get_compression_ratio(text),
+            no_speech_prob=result.no_speech_prob,
+        )
+
+    def _is_silence(self, decoded: _Decoded) -> bool:
+        # та же логика "это тишина", что и в обычном transcribe
+        return decoded.no_speech_prob > self._no_speech_threshold and decoded.avg_logprob < self._log_prob_threshold
+
+    def _needs_fallback(self, decoded: _Decoded) -> bool:
+        if self._is_silence(decoded):
+            return False
+        return (
+            decoded.compression_ratio > self._compression_ratio_threshold
+            or decoded.avg_logprob < self._log_prob_threshold
+        )
+
+    def _redecode(self, model: WhisperModel, features: np.ndarray, prompt: list[int],
+                  tokenizer: Tokenizer, first: _Decoded, **generate_kwargs) -> _Decoded:
+        """
+        Temperature fallback для одного провалившегося чанка, как в WhisperModel.transcribe:
+        первая гипотеза, прошедшая пороги, или лучшая по avg_logprob среди не слишком
+        повторяющихся.
+        """
+        encoder_output = model.encode(features)
+        candidates = [first]
+        for temperature in self.FALLBACK_TEMPERATURES:
+            result = model.model.generate(
+                encoder_output,
+                [prompt],
+                beam_size=1,
+                num_hypotheses=self.BEST_OF,
+                sampling_topk=0,
+                sampling_temperature=temperature,
+                **generate_kwargs,
+            )[0]
+            decoded = self._judge(tokenizer, result)
+            if not self._needs_fallback(decoded):
+                return decoded
+            candidates.append(decoded)
+
+        below = [c for c in candidates if c.compression_ratio <= self._compression_ratio_threshold]
+        return max(below or candidates, key=lambda c: c.avg_logprob)
+
+    def _blocking_transcribe_chunks(self, model: WhisperModel, chunks: list[np.ndarray]) -> list[str]:
+        """
+        Один проход encoder+decoder по пачке чанков (возможно, от разных запросов).
+        Вызывается MicroBatcher'ом реплики в её executor'е. Пороги no_speech /
+        log_prob / compression_ratio — те же, что в обычном transcribe; чанки, не
+        прошедшие их, декодируются заново по одному с temperature fallback.
+        """
+        extractor = model.feature_extractor
+        n_frames = extractor.nb_max_frames
+
+        features = np.zeros((len(chunks), extractor.mel_filters.shape[0], n_frames), dtype=np.float32)
+        for i, chunk in enumerate(chunks):
+            mel = extractor(chunk)[:, :n_frames]
+            features[i, :, :mel.shape[-1]] = mel
+
+        tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language="ru",
+        )
+        prompt = list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+        generate_kwargs = {
+            "return_scores": True,
+            "return_no_speech_prob": True,
+            "suppress_blank": True,
+            "suppress_tokens": get_suppressed_tokens(tokenizer, [-1]),
+        }
+
+        encoder_output = model.encode(features)
+        results = model.model.generate(
+            encoder_output,
+            [prompt] * len(chunks),
+            beam_size=self.BEAM_SIZE,
+            **generate_kwargs,
+        )
+
+        texts = []
+        for i, result in enumerate(results):
+            decoded = self._judge(tokenizer, result)
+            if self._needs_fallback(decoded):
+                decoded = self._redecode(model, features[i:i + 1], prompt, tokenizer, decoded, **generate_kwargs)
+            texts.append("" if self._is_silence(decoded) else decoded.text)
+        return texts
+
+    async def _transcribe_dynamic(self, replica: _Replica, audio: np.ndarray) -> dict:
+        """Режет запрос на чанки и отдаёт их в общий батч с другими запросами этой реплики."""
+        if audio.size == 0:
+            return {"language": "ru", "transcript": ""}
+
+        # VAD — на CPU и вне потока модели, чтобы не задерживать батчи
+        chunks = await asyncio.to_thread(self._speech_chunks, audio)
+        texts = await replica.batcher.submit_many(chunks)
+
+        return {
+            "language": "ru",
+            "transcript": " ".join(t for t in texts if t),
+        }
+
+    def _use_dynamic_batching(self, options: Optional[TranscriptionOptions]) -> bool:
+        # явные batched / batch_size в запросе важнее переключателя деплоя:
+        # запрос идёт обычным путём (последовательным или BatchedInferencePipeline)
+        if options is not None and (options.batched is not None or options.batch_size):
+            return False
+        return self._dynamic_batching
+
+    async def transcribe(
+        self,
+        audio_path: str,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
+        result = await self._run_on_replica(self._run_blocking, audio_path, self._batch_size_for(options))
 
         # IMPORTANT:
         # Здесь файл НЕ удаляем, потому что в твоём job worker он удаляется в finally.
@@ -149,6 +554,111 @@ class WhisperProvider(STTProvider):
             provider=self.get_name()
         )
 
+    async def transcribe_array(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> TranscriptionResult:
+        audio = to_model_rate(samples, sample_rate)
+
+        if self._use_dynamic_batching(options):
+            result = await self._run_on_replica(self._transcribe_dynamic, audio)
+        else:
+            result = await self._run_on_replica(self._run_blocking, audio, self._batch_size_for(options))
+
+        return TranscriptionResult(
+            language=result["language"],
+            transcript=result["transcript"],
+            provider=self.get_name()
+        )
+
+    async def transcribe_segments(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> list:
+        """
+        Сегменты faster-whisper целиком (с avg_logprob / no_speech_prob /
+        compression_ratio) — для каскада, которому нужна уверенность по сегментам.
+        """
+        audio = to_model_rate(samples, sample_rate)
+        if audio.size == 0:
+            return []
+
+        def run(replica: _Replica) -> list:
+            segments, _ = self._iter_segments(replica, audio, self._batch_size_for(options))
+            return list(segments)
+
+        async def on_replica(replica: _Replica) -> list:
+            return await asyncio.get_event_loop().run_in_executor(replica.pool, run, replica)
+
+        return await self._run_on_replica(on_replica)
+
+    async def transcribe_stream(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        options: Optional[TranscriptionOptions] = None,
+    ) -> AsyncIterator[TranscriptionSegment]:
+        """
+        Генератор faster-whisper итерируется в потоке реплики, каждый готовый
+        сегмент сразу передаётся в event loop. Если потребитель ушёл (клиент
+        отключился), декодирование останавливается на следующем сегменте.
+        Динамический батчинг здесь не используется: сегменты нужны по порядку и сразу.
+        """
+        audio = to_model_rate(samples, sample_rate)
+        if audio.size == 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        finished = object()
+        batch_size = self._batch_size_for(options)
+
+        replica = await self._acquire_replica()
+
+        def produce() -> None:
+            try:
+                segments, _ = self._iter_segments(replica, audio, batch_size)
+                for seg in segments:
+                    if stop.is_set():
+                        break
+                    item = TranscriptionSegment(start=seg.start, end=seg.end, text=seg.text.strip())
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        replica.inflight += 1
+        try:
+            loop.run_in_executor(replica.pool, produce)
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item.text:
+                    yield item
+        finally:
+            stop.set()
+            replica.inflight -= 1
+            replica.served += 1
+
+    async def warmup(self) -> None:
+        """Прогон синтетики через каждую реплику напрямую (в обход VAD)."""
+        await self._ensure_loaded()
+        signal = warmup_signal()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(replica.pool, self._blocking_transcribe_chunks, replica.model, [signal])
+            for replica in list(self._replicas)
+        ))
+
     def get_name(self) -> str:
         return "whisper"
 
@@ -156,18 +666,30 @@ class WhisperProvider(STTProvider):
         return self._device
 
     def get_model_name(self) -> str:
-        return self._model_name or config.WHISPER_MODEL
+        return self._model_name
+
+    def get_decoding_params(self, options: Optional[TranscriptionOptions] = None) -> dict:
+        return {
+            "language": "ru",
+            "dynamic_batching": self._use_dynamic_batching(options),
+            "batch_size": self._batch_size_for(options),
+            "vad": self._vad_enabled,
+            "vad_parameters": self._vad_parameters if self._vad_enabled else None,
+            "no_speech_threshold": self._no_speech_threshold,
+            "log_prob_threshold": self._log_prob_threshold,
+            "compression_ratio_threshold": self._compression_ratio_threshold,
+            "condition_on_previous_text": self._condition_on_previous_text,
+        }
 
     def is_loaded(self) -> bool:
         return self._model is not None
 
-
-# Singleton
-_whisper_provider: Optional[WhisperProvider] = None
+    def get_pool_stats(self) -> list[dict]:
+        """Загрузка реплик для мониторинга."""
+        return [r.stats() for r in self._replicas]
 
 
-def get_whisper_provider() -> WhisperProvider:
-    global _whisper_provider
-    if _whisper_provider is None:
-        _whisper_provider = WhisperProvider()
-    return _whisper_provider
+def get_whisper_provider(model_name: Optional[str] = None) -> WhisperProvider:
+    """Провайдер для размера модели model_name (по умолчанию WHISPER_MODEL), один на размер."""
+    model_name = model_name or config.WHISPER_MODEL
+    return model_manager.get(f"whisper:{model_name}", lambda: WhisperProvider(model_name))
@@ -0,0 +1,67 @@
+import numpy as np
+
+from app.services.audio_preprocessing import measure_integrated_loudness, normalize_pcm_loudness
+
+SAMPLE_RATE = 16000
+
+
+def _sine(amplitude: float, seconds: float = 5.0, freq: float = 997.0) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def test_full_scale_sine_loudness():
+    """
+    A full-scale 997 Hz sine is the BS.1770 reference signal: about -3 LUFS.
+    """
+    loudness = measure_integrated_loudness(_sine(1.0), SAMPLE_RATE)
+    assert abs(loudness - (-3.01)) < 0.2
+
+
+def test_normalization_reaches_target():
+    """
+    A quiet signal is amplified to the target integrated loudness.
+    """
+    quiet = _sine(0.01)
+    normalized, info = normalize_pcm_loudness(quiet, SAMPLE_RATE, target_lufs=-16.0)
+
+    assert info["skipped"] is False
+    assert abs(measure_integrated_loudness(normalized, SAMPLE_RATE) - (-16.0)) < 0.1
+
+
+def test_normalization_skipped_within_tolerance_and_for_silence():
+    """
+    Audio already near the target, and pure silence, are returned untouched.
+    """
+    near_target = _sine(1.0) * np.float32(10 ** (-13.0 / 20))  # ~ -16 LUFS
+    out, info = normalize_pcm_loudness(near_target, SAMPLE_RATE, target_lufs=-16.0, tolerance_lu=1.0)
+    assert info["skipped"] is True
+    assert out is near_target
+
+    silence = np.zeros(SAMPLE_RATE * 3, dtype=np.float32)
+    out, info = normalize_pcm_loudness(silence, SAMPLE_RATE)
+    assert info["skipped"] is True
+    assert not np.any(out)
+
+
+def test_transient_peak_is_limited_not_clipped():
+    """
+    Quiet speech with a loud click: after the gain the click would exceed the
+    ceiling. It is brought under the ceiling smoothly (no flat-topped run of
+    at the ceiling), and audio away from the click keeps the full gain.
+    """
+    audio = _sine(0.01)
+    click = slice(2 * SAMPLE_RATE, 2 * SAMPLE_RATE + 32)  # 2 ms
+    audio[click] = _sine(0.3, seconds=0.002, freq=2000.0)
+    ceiling = 10 ** (-1.5 / 20)
+
+    normalized, info = normalize_pcm_loudness(audio, SAMPLE_RATE, target_lufs=-16.0, peak_db=-1.5)
+    gain = 10 ** (info["gain_db"] / 20)
+
+    assert np.abs(audio).max() * gain > ceiling
+    assert np.abs(normalized).max() <= ceiling + 1e-6
+    # the click keeps its waveform (a clipper would square it off)
+    assert np.corrcoef(normalized[click], audio[click])[0, 1] > 0.999
+    assert info["limiter_db"] < 0
+    far = slice(SAMPLE_RATE, SAMPLE_RATE + 1000)
+    assert np.allclose(normalized[far], audio[far] * gain, rtol=1e-4, atol=1e-6)
@@ -0,0 +1,119 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core import config
+from app.services import audio_service
+
+SAMPLE_RATE = config.AUDIO_SAMPLE_RATE
+
+
+def test_sliced_extraction_keeps_slices_aligned(monkeypatch):
+    """
+    A slice that ffmpeg returns short is padded with silence, one that comes back long
+    is trimmed, so every later slice still starts at its own timestamp.
+    """
+    duration = 40.0
+    slices = 4
+    slice_len = int(duration / slices * SAMPLE_RATE)
+    # slice 1 loses 0.5s, slice 2 overshoots by 0.25s
+    actual = {0: slice_len, 1: slice_len - SAMPLE_RATE // 2, 2: slice_len + SAMPLE_RATE // 4}
+
+    def fake_range(video_path, start_sec, length_sec):
+        index = round(start_sec / (duration / slices))
+        return np.full(actual.get(index, slice_len), index + 1, dtype=np.float32)
+
+    monkeypatch.setattr(config, "AUDIO_PARALLEL_EXTRACT_SLICES", slices)
+    monkeypatch.setattr(audio_service, "_blocking_extract_pcm_range", fake_range)
+
+    samples, duration_sec, _ = asyncio.run(
+        audio_service._extract_pcm_sliced("unused.mp4", duration, delete_original=False)
+    )
+
+    assert duration_sec == duration
+    assert samples.size == int(duration * SAMPLE_RATE)
+    for index in range(slices):
+        assert samples[index * slice_len] == index + 1
+    short_tail = samples[2 * slice_len - SAMPLE_RATE // 2:2 * slice_len]
+    assert np.all(short_tail == 0)
+
+
+def test_stream_sink_falls_back_to_the_spooled_file_on_empty_pcm(monkeypatch, tmp_path):
+    """
+    ffmpeg that exits 0 without writing PCM is not a success: the upload is
+    decoded again from the spooled file, which raises on empty output.
+    """
+    from app.services import upload_stream
+
+    spool = tmp_path / "upload.mp4"
+    spool.write_bytes(b"not really a video")
+    calls = []
+
+    async def fake_extract(path, delete_original, target_lufs):
+        calls.append((path, delete_original))
+        raise RuntimeError("FFmpeg вернул пустой PCM-поток.")
+
+    async def done(value):
+        return value
+
+    class FinishedProcess:
+        async def wait(self):
+            return 0
+
+    monkeypatch.setattr(upload_stream, "extract_pcm_from_path", fake_extract)
+
+    async def run():
+        sink = upload_stream.PCMStreamSink()
+        sink._proc = FinishedProcess()
+        sink._stdout_task = asyncio.ensure_future(done(b""))
+        sink._stderr_task = asyncio.ensure_future(done(b""))
+        sink._spool_path = str(spool)
+        await sink.result()
+
+    with pytest.raises(RuntimeError, match="пустой PCM"):
+        asyncio.run(run())
+
+    assert calls == [(str(spool), True)]
+
+
+def test_file_sink_writes_off_the_event_loop(tmp_path):
+    """
+    A slow disk write does not stall the event loop: other coroutines keep running
+    while the chunk is being written, and the file and its hash come out intact.
+    """
+    import hashlib
+    import threading
+
+    from app.services import upload_stream
+
+    unblocked = threading.Event()
+
+    class SlowFile:
+        def __init__(self, f):
+            self._f = f
+
+        def write(self, chunk):
+            # released by a coroutine on the loop: if write() ran on the loop, it never would be
+            assert unblocked.wait(timeout=5)
+            self._f.write(chunk)
+
+        def close(self):
+            self._f.close()
+
+    async def run():
+        sink = upload_stream.FileSink(lambda upload: str(tmp_path / "upload.mp4"))
+        await sink.open(upload_stream.StreamedUpload(filename="upload.mp4"))
+        sink._file = SlowFile(sink._file)
+
+        async def release():
+            unblocked.set()
+
+        await asyncio.gather(sink.write(b"video"), release())
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+
+    assert (tmp_path / "upload.mp4").read_bytes() == b"video"
+    assert sink.sha256 == hashlib.sha256(b"video").hexdigest()
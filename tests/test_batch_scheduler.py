@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.batch_scheduler import MicroBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    """
+    Items submitted by concurrent callers are processed in one batch_fn call,
+    and every caller gets back its own results in order.
+    """
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, ThreadPoolExecutor(1), max_batch_size=8, max_wait_ms=50)
+        first, second = await asyncio.gather(batcher.submit_many([1, 2]), batcher.submit_many([3]))
+        return batcher, first, second
+
+    batcher, first, second = asyncio.run(run())
+
+    assert first == [10, 20]
+    assert second == [30]
+    assert len(calls) == 1
+    assert batcher.stats()["avg_batch_size"] == 3
+
+
+def test_batch_error_is_raised_to_callers():
+    """
+    An exception in batch_fn is propagated to every caller in that batch.
+    """
+    def batch_fn(items):
+        raise RuntimeError("boom")
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, ThreadPoolExecutor(1), max_wait_ms=1)
+        await batcher.submit(1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_close_from_another_thread_fails_waiting_callers():
+    """
+    close() called off the event loop (the idle reaper thread) stops the batcher
+    on its loop; callers in the running batch and in the queue get an error
+    instead of waiting forever.
+    """
+    release = threading.Event()
+
+    def batch_fn(items):
+        release.wait(1)
+        return items
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, ThreadPoolExecutor(1), max_batch_size=1, max_wait_ms=1)
+        calls = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(batcher.close)
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+        release.set()
+        return results
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
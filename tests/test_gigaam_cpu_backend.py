@@ -0,0 +1,115 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.gigaam_cpu_backend import (  # noqa: E402
+    OnnxEncoder,
+    encoder_divergence,
+    export_encoder_onnx,
+    probe_batch,
+    quantize_encoder_int8,
+)
+
+
+class TinyEncoder(torch.nn.Module):
+    """Stand-in with the GigaAM encoder interface: (features, lengths) -> (encoded, lengths)."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.proj = torch.nn.Linear(16, 64)
+        self.out = torch.nn.Linear(64, 16)
+
+    def forward(self, features, lengths):
+        x = self.out(torch.relu(self.proj(features.transpose(1, 2))))
+        return x.transpose(1, 2), lengths
+
+
+class MaskedEncoder(TinyEncoder):
+    """Like TinyEncoder, but zeroes frames past each item's length (as the real encoder masks padding)."""
+
+    def forward(self, features, lengths):
+        x, lengths = super().forward(features, lengths)
+        mask = torch.arange(x.shape[-1]) < lengths.unsqueeze(1)
+        return x * mask.unsqueeze(1), lengths
+
+
+def _inputs():
+    torch.manual_seed(1)
+    return torch.randn(2, 16, 50), torch.tensor([50, 40])
+
+
+def test_int8_encoder_is_close_to_fp32_and_leaves_original_intact():
+    """
+    Dynamic int8 quantization swaps the Linear layers of a copy only; its output
+    differs from fp32 by a small, nonzero relative error.
+    """
+    encoder = TinyEncoder().eval()
+    features, lengths = _inputs()
+
+    quantized = quantize_encoder_int8(encoder)
+    divergence = encoder_divergence(encoder, quantized, features, lengths)
+
+    assert type(encoder.proj) is torch.nn.Linear
+    assert type(quantized.proj) is not torch.nn.Linear
+    assert 0 < divergence < 0.1
+    assert encoder_divergence(encoder, encoder, features, lengths) == 0
+
+
+def test_divergence_rejects_mismatched_lengths_and_wrong_outputs():
+    """A backend that changes output lengths or values beyond tolerance is caught."""
+    encoder = TinyEncoder().eval()
+    features, lengths = _inputs()
+
+    def wrong_lengths(f, n):
+        out, _ = encoder(f, n)
+        return out, n - 1
+
+    def noisy(f, n):
+        out, n = encoder(f, n)
+        return out + out.abs().mean(), n
+
+    assert encoder_divergence(encoder, wrong_lengths, features, lengths) == float("inf")
+    assert encoder_divergence(encoder, noisy, features, lengths) > 0.1
+
+
+def test_divergence_ignores_padding_frames():
+    """Frames past encoded_lengths are not read by the decoder and do not count."""
+    encoder = MaskedEncoder().eval()
+    features, lengths = _inputs()
+
+    def garbage_in_padding(f, n):
+        out, n = encoder(f, n)
+        return out + (torch.arange(out.shape[-1]) >= n.unsqueeze(1)).unsqueeze(1), n
+
+    assert encoder_divergence(encoder, garbage_in_padding, features, lengths) == 0
+
+
+def test_probe_batch_is_padded_with_unequal_lengths():
+    """The held-out check batch has several items of different lengths, zero-padded to the longest."""
+    wav, lengths = probe_batch((2.0, 1.0, 1.5))
+
+    assert wav.shape == (3, int(lengths.max()))
+    assert len(set(lengths.tolist())) == 3
+    assert wav[1, int(lengths[1]):].abs().sum() == 0
+
+
+def test_onnx_export_generalizes_beyond_the_traced_input(tmp_path):
+    """
+    Traced at batch=1 on one length, the exported encoder matches PyTorch on a
+    padded batch of a different length with unequal feature lengths.
+    """
+    pytest.importorskip("onnxruntime")
+    encoder = MaskedEncoder().eval()
+    torch.manual_seed(2)
+    traced_features = torch.randn(1, 16, 30)
+
+    path = export_encoder_onnx(encoder, traced_features, torch.tensor([30]), str(tmp_path / "enc.onnx"))
+    onnx_encoder = OnnxEncoder(path)
+    features, lengths = torch.randn(3, 16, 70), torch.tensor([70, 41, 12])
+
+    assert export_encoder_onnx(encoder, traced_features, torch.tensor([30]), path) == path
+    assert encoder_divergence(encoder, onnx_encoder, features, lengths) < 1e-4
+    encoded, encoded_lengths = onnx_encoder(features, lengths)
+    assert encoded.shape == (3, 16, 70)
+    assert encoded_lengths.tolist() == [70, 41, 12]
@@ -0,0 +1,83 @@
+import asyncio
+
+from app.services.job_pipeline import Stage, StagePipeline
+
+
+def test_stages_overlap_across_jobs():
+    """
+    While one job is in the second stage, the next job runs the first one:
+    the second job's cpu stage starts before the first job's gpu stage ends.
+    """
+    events = []
+    running = {"now": 0, "max": 0}
+
+    def stage(name):
+        async def fn(item):
+            events.append(("start", name, item["id"]))
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+            events.append(("end", name, item["id"]))
+            item["stages"].append(name)
+        return fn
+
+    async def run():
+        done = []
+
+        async def on_done(item):
+            done.append(item)
+
+        pipeline = StagePipeline(
+            [Stage("cpu", stage("cpu")), Stage("gpu", stage("gpu"))], queue_size=1, on_done=on_done
+        )
+        pipeline.start()
+        for n in range(4):
+            await pipeline.submit({"id": n, "stages": []})
+        await pipeline.join()
+        await pipeline.close()
+        return done
+
+    done = asyncio.run(run())
+
+    assert [item["id"] for item in done] == [0, 1, 2, 3]
+    assert all(item["stages"] == ["cpu", "gpu"] for item in done)
+    assert events.index(("start", "cpu", 1)) < events.index(("end", "gpu", 0))
+    assert running["max"] == 2
+
+
+def test_failed_stage_skips_the_rest_and_finishes_the_item():
+    """An error is reported once; later stages are skipped and on_done still runs."""
+    async def first(item):
+        if item["fail"]:
+            raise RuntimeError("boom")
+
+    async def second(item):
+        item["second"] = True
+
+    async def run():
+        errors, done = [], []
+
+        async def on_error(item, stage, exc):
+            errors.append((stage, str(exc)))
+
+        async def on_done(item):
+            done.append(item)
+
+        pipeline = StagePipeline(
+            [Stage("first", first), Stage("second", second)], on_done=on_done, on_error=on_error
+        )
+        pipeline.start()
+        await pipeline.submit({"fail": True})
+        await pipeline.submit({"fail": False})
+        await pipeline.join()
+        stats = pipeline.stats()
+        await pipeline.close()
+        return errors, done, stats
+
+    errors, done, stats = asyncio.run(run())
+
+    assert errors == [("first", "boom")]
+    assert done == [{"fail": True}, {"fail": False, "second": True}]
+    assert stats["first"]["failed"] == 1
+    assert stats["second"]["processed"] == 1
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # the queue runs Lua scripts
+
+from app.services import job_store
+from app.services.job_store import (
+    INFLIGHT_KEY,
+    JOB_PREFIX,
+    LEGACY_DATA_KEY,
+    QUEUE_KEY,
+    REAPER_LOCK_KEY,
+    REQUEUE_LOCK_KEY,
+    WORKER_ID,
+    Job,
+    ack_job,
+    dequeue_job,
+    enqueue_job,
+    get_job,
+    queue_position,
+    reap_expired_jobs,
+    renew_leases,
+    requeue_stale_jobs,
+)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(job_store, "async_redis_client", client)
+    return client
+
+
+@pytest.fixture
+def scheduling(monkeypatch):
+    """Default classes, FIFO within a tenant and equal weights, whatever the environment says."""
+    monkeypatch.setattr(job_store.config, "JOB_PRIORITIES", ["high", "normal", "low"])
+    monkeypatch.setattr(job_store.config, "JOB_QUEUE_POLICY", "fifo")
+    monkeypatch.setattr(job_store.config, "JOB_FAIR_WEIGHTS", {})
+
+
+def make_job(job_id: str, **kwargs) -> Job:
+    return Job(job_id=job_id, file_path=f"/tmp/{job_id}.mp4", callback_url=None, stt_provider="whisper", **kwargs)
+
+
+def test_dispatch_leases_the_job_and_ack_releases_it(redis):
+    """The dequeued job is leased to this worker; ack removes the lease and the processing entry."""
+    async def run():
+        await enqueue_job(make_job("a"))
+        job = await dequeue_job(timeout=1)
+        leased = (
+            await redis.zscore(INFLIGHT_KEY, "a"),
+            await redis.lrange(job_store._processing_key(), 0, -1),
+        )
+        acked = await ack_job("a")
+        released = (
+            await redis.zscore(INFLIGHT_KEY, "a"),
+            await redis.lrange(job_store._processing_key(), 0, -1),
+            await redis.hget(f"{JOB_PREFIX}:a", "worker"),
+        )
+        return job, leased, acked, released
+
+    job, (deadline, processing), acked, released = asyncio.run(run())
+
+    assert job.job_id == "a"
+    assert job.worker == WORKER_ID
+    assert job.attempts == 1
+    assert deadline > time.time()
+    assert processing == ["a"]
+    assert acked is True
+    assert released == (None, [], None)
+
+
+def test_renew_drops_a_lease_taken_by_another_worker(redis):
+    """After the job moved to another worker, renew reports it lost and ack leaves the new lease alone."""
+    async def run():
+        await enqueue_job(make_job("a"))
+        await enqueue_job(make_job("b"))
+        await dequeue_job(timeout=1)
+        await dequeue_job(timeout=1)
+        await redis.zadd(INFLIGHT_KEY, {"a": 1, "b": 1})
+        await redis.hset(f"{JOB_PREFIX}:a", "worker", "other-host:1")
+        lost = await renew_leases()
+        return (
+            lost,
+            await redis.lrange(job_store._processing_key(), 0, -1),
+            await redis.zscore(INFLIGHT_KEY, "b"),
+            await ack_job("a"),
+            await redis.zscore(INFLIGHT_KEY, "a"),
+        )
+
+    lost, processing, renewed, acked, other_lease = asyncio.run(run())
+
+    assert lost == ["a"]
+    assert processing == ["b"]
+    assert renewed > time.time()
+    assert acked is False
+    assert other_lease == 1
+
+
+def test_reaper_requeues_expired_leases_until_max_attempts(redis):
+    """An expired lease goes back to the queue; once attempts reach the limit the job fails."""
+    async def expire_and_reap():
+        job = await dequeue_job(timeout=1)
+        await redis.zadd(INFLIGHT_KEY, {job.job_id: 1})
+        return await reap_expired_jobs(max_attempts=2)
+
+    async def run():
+        await enqueue_job(make_job("a"))
+        first = await expire_and_reap()
+        second = await expire_and_reap()
+        return first, second, await get_job("a"), await redis.zcard(INFLIGHT_KEY)
+
+    first, second, job, inflight = asyncio.run(run())
+
+    assert first == (["a"], [])
+    assert second == ([], ["a"])
+    assert job.status == "error"
+    assert job.attempts == 2
+    assert job.worker is None
+    assert inflight == 0
+
+
+def test_reaper_leaves_a_job_whose_lease_was_renewed_after_the_scan(redis, monkeypatch):
+    """
+    The owner renews its lease after the reaper listed it as expired: the reap is
+    re-checked in Redis, and the job stays with its worker instead of being requeued.
+    """
+    hmget = redis.hmget
+
+    async def renew_then_hmget(*args, **kwargs):
+        await renew_leases()  # the owning worker's heartbeat wins the race
+        return await hmget(*args, **kwargs)
+
+    async def run():
+        await enqueue_job(make_job("a"))
+        await dequeue_job(timeout=1)
+        await redis.zadd(INFLIGHT_KEY, {"a": 1})
+        monkeypatch.setattr(redis, "hmget", renew_then_hmget)
+        reaped = await reap_expired_jobs(max_attempts=3)
+        return (
+            reaped,
+            await redis.zscore(INFLIGHT_KEY, "a"),
+            await redis.hget(f"{JOB_PREFIX}:a", "worker"),
+            await redis.lrange(QUEUE_KEY, 0, -1),
+            await redis.lrange(job_store._processing_key(), 0, -1),
+        )
+
+    reaped, deadline, worker, queue, processing = asyncio.run(run())
+
+    assert reaped == ([], [])
+    assert deadline > time.time()
+    assert worker == WORKER_ID
+    assert queue == []
+    assert processing == ["a"]
+
+
+def test_lock_is_released_only_by_its_owner(redis):
+    """A pass that outlived its lock does not delete the lock another instance took since."""
+    async def run():
+        token = await job_store._acquire_lock(REAPER_LOCK_KEY)
+        second = await job_store._acquire_lock(REAPER_LOCK_KEY)
+        await redis.set(REAPER_LOCK_KEY, "other-instance")  # ours expired, someone else took it
+        await job_store._release_lock(REAPER_LOCK_KEY, token)
+        held = await redis.get(REAPER_LOCK_KEY)
+        await job_store._release_lock(REAPER_LOCK_KEY, "other-instance")
+        return token, second, held, await redis.exists(REAPER_LOCK_KEY)
+
+    token, second, held, exists = asyncio.run(run())
+
+    assert token is not None
+    assert second is None
+    assert held == "other-instance"
+    assert exists == 0
+
+
+def test_legacy_job_is_migrated_before_it_is_leased(redis):
+    """An old-format id in jobs:queue is migrated and leased; an id without any data is dropped."""
+    legacy = {"job_id": "old", "file_path": "/tmp/old.mp4", "callback_url": None, "stt_provider": "whisper"}
+
+    async def run():
+        await redis.hset(LEGACY_DATA_KEY, "old", json.dumps(legacy))
+        await redis.rpush(QUEUE_KEY, "old", "ghost")  # "ghost" has no data and is popped first
+        job = await dequeue_job(timeout=1)
+        ghost_hash = await redis.exists(f"{JOB_PREFIX}:ghost")
+        return job, ghost_hash, await redis.llen(QUEUE_KEY), await dequeue_job(timeout=1)
+
+    job, ghost_hash, queued, nothing = asyncio.run(run())
+
+    assert job.job_id == "old"
+    assert job.file_path == "/tmp/old.mp4"
+    assert job.attempts == 1
+    assert ghost_hash == 0
+    assert queued == 0
+    assert nothing is None
+
+
+def test_job_fields_round_trip_through_the_hash(redis):
+    """Encoded, int, float and missing fields come back with their types."""
+    job = make_job(
+        "a", duration_sec=12.5, options={"language": "ru"}, tenant="user:1", priority="high",
+    )
+
+    async def run():
+        await enqueue_job(job)
+        await job_store.update_job("a", ("done", "OK"), status="done", result={"transcript": "привет"}, progress=100)
+        return await get_job("a")
+
+    stored = asyncio.run(run())
+
+    assert stored.result == {"transcript": "привет"}
+    assert stored.options == {"language": "ru"}
+    assert stored.progress == 100
+    assert stored.duration_sec == 12.5
+    assert stored.fair_cost == 12.5
+    assert stored.callback_url is None
+    assert [e["status"] for e in stored.events] == ["CREATED", "OK"]
+
+
+def test_stale_processing_jobs_without_lease_are_requeued(redis):
+    """Jobs taken before leases existed are requeued once stale; the lock is released afterwards."""
+    async def run():
+        await enqueue_job(make_job("a"))
+        await enqueue_job(make_job("b"))
+        await job_store.update_job("a", status="processing")
+        await redis.hset(f"{JOB_PREFIX}:a", "updated_at", "2020-01-01T00:00:00+00:00")
+        requeued = await requeue_stale_jobs(stale_sec=60)
+        return requeued, await redis.lrange(QUEUE_KEY, 0, -1), await redis.exists(REQUEUE_LOCK_KEY)
+
+    requeued, queue, locked = asyncio.run(run())
+
+    assert requeued == ["a"]
+    assert queue == ["a"]
+    assert locked == 0
+
+
+async def dequeue_all(count: int) -> list[str]:
+    return [(await dequeue_job(timeout=1)).job_id for _ in range(count)]
+
+
+async def requeue_after_lost_worker(job_id: str) -> None:
+    """Enqueue, lease and let the lease expire: the reaper puts the job in jobs:queue."""
+    await enqueue_job(make_job(job_id))
+    await dequeue_job(timeout=1)
+    await job_store.async_redis_client.zadd(INFLIGHT_KEY, {job_id: 1})
+    await reap_expired_jobs(max_attempts=3)
+
+
+def test_priority_classes_are_served_strictly_in_order(redis, scheduling):
+    """A lower class gets nothing while a higher one has jobs, regardless of enqueue order."""
+    async def run():
+        await enqueue_job(make_job("low", priority="low", tenant="user:a"))
+        await enqueue_job(make_job("normal", priority="normal", tenant="user:a"))
+        await enqueue_job(make_job("high", priority="high", tenant="user:b"))
+        return await dequeue_all(3)
+
+    assert asyncio.run(run()) == ["high", "normal", "low"]
+
+
+def test_tenants_share_a_class_by_seconds_of_audio(redis, scheduling):
+    """
+    Virtual-time fair share: after a 100 s job of tenant A, tenant B's three 10 s
+    jobs all go before A's next one; the high-priority job goes before both.
+    """
+    async def run():
+        for i in range(5):
+            await enqueue_job(make_job(f"A{i}", tenant="user:a", duration_sec=100))
+        for i in range(3):
+            await enqueue_job(make_job(f"B{i}", tenant="user:b", duration_sec=10))
+        await enqueue_job(make_job("H", priority="high", tenant="user:c"))
+        return await dequeue_all(9)
+
+    assert asyncio.run(run()) == ["H", "A0", "B0", "B1", "B2", "A1", "A2", "A3", "A4"]
+
+
+def test_requeued_job_overtakes_the_class_queues(redis, scheduling):
+    """A job taken back from a lost worker is served before any class, even high."""
+    async def run():
+        await requeue_after_lost_worker("r")
+        await enqueue_job(make_job("h", priority="high", tenant="user:a"))
+        return await redis.lrange(QUEUE_KEY, 0, -1), await dequeue_all(2)
+
+    queue, order = asyncio.run(run())
+
+    assert queue == ["r"]
+    assert order == ["r", "h"]
+
+
+def test_queue_position_counts_what_is_ahead_of_the_job(redis, scheduling):
+    """
+    Position reports jobs of the same tenant ahead, tenants sharing the class,
+    requeued jobs and busy higher classes; a job that left the class queue has none.
+    """
+    async def run():
+        await requeue_after_lost_worker("r")
+        jobs = [make_job(f"a{i}", tenant="user:a") for i in range(3)]
+        for job in jobs:
+            await enqueue_job(job)
+        await enqueue_job(make_job("b0", tenant="user:b"))
+        await enqueue_job(make_job("h", priority="high", tenant="user:c"))
+        waiting = await queue_position(jobs[2])
+        requeued = await queue_position(await get_job("r"))
+        await dequeue_all(3)  # r, h, a0
+        dispatched = await queue_position(jobs[0])
+        moved_up = await queue_position(jobs[2])
+        return waiting, requeued, dispatched, moved_up
+
+    waiting, requeued, dispatched, moved_up = asyncio.run(run())
+
+    assert waiting == {
+        "tenant_jobs_ahead": 2,
+        "tenants_in_class": 2,
+        "requeued_jobs_ahead": 1,
+        "tenants_in_higher_classes": 1,
+    }
+    assert requeued is None
+    assert dispatched is None
+    assert moved_up == {
+        "tenant_jobs_ahead": 1,
+        "tenants_in_class": 2,
+        "requeued_jobs_ahead": 0,
+        "tenants_in_higher_classes": 0,
+    }
@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+
+from app.services.live_transcription import LiveSession, SessionLimiter, UtteranceSegmenter
+
+SAMPLE_RATE = 16000
+
+
+def _tone(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _noise(seconds: float, amplitude: float = 0.001) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.normal(0, amplitude, int(SAMPLE_RATE * seconds)).astype(np.float32)
+
+
+def test_utterances_are_closed_by_silence_across_chunks():
+    """
+    Speech separated by silence yields one utterance per phrase with timestamps,
+    regardless of how the stream is chunked.
+    """
+    stream = np.concatenate([_noise(0.5), _tone(1.0), _noise(1.0), _tone(0.6), _noise(1.0)])
+    segmenter = UtteranceSegmenter(sample_rate=SAMPLE_RATE, min_silence_ms=500)
+
+    closed = []
+    for i in range(0, stream.size, 1234):  # chunk size not aligned to frames
+        closed.extend(segmenter.push(stream[i:i + 1234]))
+
+    assert len(closed) == 2
+    assert abs(closed[0].start - 0.5) < 0.2
+    assert abs((closed[0].end - closed[0].start) - 1.0) < 0.35
+    assert abs(closed[1].start - 2.5) < 0.2
+    assert segmenter.flush() is None
+
+
+def test_open_utterance_is_flushed_and_long_speech_is_cut():
+    """
+    flush() returns a still-open phrase; continuous speech is cut at max_utterance_sec.
+    """
+    segmenter = UtteranceSegmenter(sample_rate=SAMPLE_RATE, max_utterance_sec=2.0)
+
+    closed = segmenter.push(_tone(3.0))
+    assert len(closed) == 1
+    assert abs(closed[0].end - closed[0].start - 2.0) < 0.05
+    assert segmenter.in_utterance
+
+    tail = segmenter.flush()
+    assert tail is not None and tail.samples.size > 0
+    assert not segmenter.in_utterance
+
+
+def test_session_limiter_caps_sessions_per_model():
+    """
+    Sessions are capped per model and freed on release.
+    """
+    limiter = SessionLimiter(max_per_model=1)
+    assert limiter.try_acquire("whisper")
+    assert not limiter.try_acquire("whisper")
+    assert limiter.try_acquire("gigaam")
+    limiter.release("whisper")
+    assert limiter.try_acquire("whisper")
+
+
+class FailingProvider:
+    async def transcribe_array(self, samples, sample_rate, options=None):
+        await asyncio.sleep(0)
+        raise RuntimeError("model crashed")
+
+
+def test_failed_partial_is_logged_and_cancel_waits_for_tasks(capsys):
+    """
+    A provider error in a partial is retrieved and logged instead of being lost
+    in an unawaited task; cancel() returns only after the session's tasks stop.
+    """
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        session = LiveSession(FailingProvider(), send, partial_interval_ms=100)
+        await session.feed(_tone(0.5))  # an open phrase long enough for a partial
+        partial = session._partial_task
+        await asyncio.sleep(0.01)
+        await session.cancel()
+        return partial, session._final_task
+
+    partial, final = asyncio.run(run())
+
+    assert partial is not None and partial.done()
+    assert final.done()
+    assert sent == []
+    assert "partial failed: RuntimeError('model crashed')" in capsys.readouterr().out
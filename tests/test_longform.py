@@ -0,0 +1,137 @@
+import asyncio
+
+import numpy as np
+
+from app.services.longform import plan_chunks, stream_longform, transcribe_longform
+from app.services.stt_provider import STTProvider, TranscriptionResult, TranscriptionSegment
+from app.services.vad import SpeechMap
+
+SAMPLE_RATE = 16000
+
+
+class FakeProvider(STTProvider):
+    """Reports each chunk's length; tracks how many chunks run at once."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    async def transcribe(self, audio_path, options=None):
+        raise NotImplementedError
+
+    async def transcribe_array(self, samples, sample_rate, options=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return TranscriptionResult(language="ru", transcript=f"{samples.size / sample_rate:.0f}s", provider="fake")
+
+    async def transcribe_stream(self, samples, sample_rate, options=None):
+        yield TranscriptionSegment(start=0.5, end=1.0, text="x")
+
+    def get_name(self):
+        return "fake"
+
+    def get_device(self):
+        return "cpu"
+
+    def get_model_name(self):
+        return "fake"
+
+
+def test_chunks_are_cut_at_pauses_and_long_speech_at_quiet_points():
+    """
+    Speech regions are packed into chunks up to the size limit, and continuous
+    speech longer than a chunk is split inside it.
+    """
+    sec = SAMPLE_RATE
+    audio = np.full(300 * sec, 0.1, dtype=np.float32)
+    audio[110 * sec:int(110.05 * sec)] = 0.0  # a quiet frame near the end of the first 60 s
+    speech_map = SpeechMap(
+        spans=[(0, 20 * sec), (30 * sec, 50 * sec), (60 * sec, 180 * sec)],
+        total_samples=audio.size,
+    )
+
+    chunks = plan_chunks(audio, speech_map, chunk_sec=60)
+
+    assert chunks[0].spans == [(0, 20 * sec), (30 * sec, 50 * sec)]
+    assert chunks[1].spans == [(60 * sec, 110 * sec)]  # cut at the quiet frame
+    assert all(c.speech_samples <= 60 * sec for c in chunks)
+    assert sum(c.speech_samples for c in chunks) == speech_map.speech_samples
+
+
+def test_chunks_run_concurrently_and_are_stitched_in_order():
+    """Chunks are transcribed in parallel; text and segment times follow the recording order."""
+    sec = SAMPLE_RATE
+    audio = np.zeros(240 * sec, dtype=np.float32)
+    speech_map = SpeechMap(spans=[(i * 60 * sec, i * 60 * sec + 50 * sec) for i in range(4)], total_samples=audio.size)
+    provider = FakeProvider()
+
+    async def run():
+        result = await transcribe_longform(provider, audio, speech_map)
+        segments = [s async for s in stream_longform(provider, audio, speech_map)]
+        return result, segments
+
+    result, segments = asyncio.run(run())
+
+    assert result.transcript == "50s 50s 50s 50s"
+    assert provider.max_active > 1
+    assert [round(s.start, 1) for s in segments] == [0.5, 60.5, 120.5, 180.5]
+
+
+def test_finished_chunks_are_not_transcribed_again():
+    """
+    Chunks restored from a checkpoint are reused as-is; only the missing ones are
+    decoded and reported through on_chunk.
+    """
+    sec = SAMPLE_RATE
+    audio = np.zeros(240 * sec, dtype=np.float32)
+    speech_map = SpeechMap(spans=[(i * 60 * sec, i * 60 * sec + 50 * sec) for i in range(4)], total_samples=audio.size)
+    done = {
+        0: TranscriptionResult(language="ru", transcript="saved-0", provider="fake"),
+        2: TranscriptionResult(language="ru", transcript="saved-2", provider="fake"),
+    }
+    saved = []
+
+    result = asyncio.run(transcribe_longform(
+        FakeProvider(), audio, speech_map, done=done, on_chunk=lambda i, total, r: saved.append((i, total)),
+    ))
+
+    assert result.transcript == "saved-0 50s saved-2 50s"
+    assert sorted(saved) == [(1, 4), (3, 4)]
+
+
+def test_failed_chunk_cancels_the_others():
+    """
+    When one chunk fails, the chunks still running are cancelled: they neither
+    keep the model busy nor checkpoint a job that has already failed.
+    """
+    sec = SAMPLE_RATE
+    audio = np.zeros(240 * sec, dtype=np.float32)
+    speech_map = SpeechMap(spans=[(i * 60 * sec, i * 60 * sec + 50 * sec) for i in range(4)], total_samples=audio.size)
+    provider = FakeProvider()
+    calls = []
+    saved = []
+
+    async def transcribe_array(samples, sample_rate, options=None):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        await asyncio.sleep(0.05)
+        return TranscriptionResult(language="ru", transcript="late", provider="fake")
+
+    provider.transcribe_array = transcribe_array
+
+    async def run():
+        error = None
+        try:
+            await transcribe_longform(provider, audio, speech_map, on_chunk=lambda i, total, r: saved.append(i))
+        except RuntimeError as e:
+            error = e
+        await asyncio.sleep(0.1)  # time for leftover chunks to finish, if they were still running
+        return error
+
+    error = asyncio.run(run())
+
+    assert str(error) == "model crashed"
+    assert saved == []
@@ -0,0 +1,99 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.model_manager import ModelManager
+
+
+class FakeModel:
+    def __init__(self, device: str = "cpu"):
+        self.loaded = False
+        self.device = device
+
+    def load(self, manager: ModelManager, key: str) -> None:
+        with manager.loading(key):
+            self.loaded = True
+
+    def unload(self) -> None:
+        self.loaded = False
+
+    def is_loaded(self) -> bool:
+        return self.loaded
+
+    def get_device(self) -> str:
+        return self.device
+
+
+def test_least_recently_used_model_is_evicted_to_fit_budget():
+    """
+    Loading a model that does not fit the RAM budget unloads the least recently
+    used idle model, but never a model that is in use.
+    """
+    manager = ModelManager(ram_budget_mb=3000)
+    small = manager.get("whisper:small", FakeModel)      # ~900 MB estimate
+    base = manager.get("whisper:base", FakeModel)        # ~300 MB estimate
+    small.load(manager, "whisper:small")
+    base.load(manager, "whisper:base")
+
+    with manager.use("whisper:base"):
+        manager.get("whisper:small", FakeModel)  # small is now the most recently used
+        medium = manager.get("whisper:medium", FakeModel)  # ~2500 MB estimate
+        medium.load(manager, "whisper:medium")
+
+    assert medium.is_loaded()
+    assert base.is_loaded()  # in use — kept
+    assert not small.is_loaded()
+
+
+def test_idle_models_are_unloaded_unless_pinned():
+    """
+    unload_idle() drops models idle longer than the TTL, except pinned ones.
+    """
+    manager = ModelManager(idle_ttl_sec=0.01)
+    idle = manager.get("gigaam:e2e_ctc", FakeModel)
+    pinned = manager.get("gigaam:e2e_rnnt", FakeModel)
+    idle.load(manager, "gigaam:e2e_ctc")
+    pinned.load(manager, "gigaam:e2e_rnnt")
+    manager.pin("gigaam:e2e_rnnt")
+
+    time.sleep(0.05)
+
+    assert manager.unload_idle() == ["gigaam:e2e_ctc"]
+    assert not idle.is_loaded()
+    assert pinned.is_loaded()
+
+
+
+def test_gigaam_batch_queued_across_unload_reloads_the_model(monkeypatch):
+    """
+    A segment batch that runs after the manager unloaded GigaAM loads the model
+    again instead of failing on the missing model.
+    """
+    pytest.importorskip("torch")
+    pytest.importorskip("faster_whisper")
+    from app.services.gigaam_provider import GigaAMProvider
+
+    asr = SimpleNamespace(
+        forward=lambda wav, length: (wav, length),
+        head=None,
+        decoding=SimpleNamespace(decode=lambda head, encoded, lengths: [f"{int(n)} samples" for n in lengths]),
+    )
+    provider = GigaAMProvider("e2e_ctc")
+    provider._device = "cpu"
+    loads = []
+
+    def load_locked():
+        loads.append(1)
+        provider._model = asr
+
+    monkeypatch.setattr(provider, "_load_model_locked", load_locked)
+
+    provider._load_model()
+    provider.unload()
+    texts = provider._blocking_transcribe_segments([np.zeros(160, np.float32), np.zeros(80, np.float32)])
+
+    assert texts == ["160 samples", "80 samples"]
+    assert len(loads) == 2
+    assert provider.is_loaded()
@@ -0,0 +1,109 @@
+from app.services.stt_router import LatencyRouter
+
+
+def test_requests_go_to_provider_with_lowest_expected_latency():
+    """
+    Work in flight and cold models push new requests to the other provider,
+    and a fast measured real-time factor attracts traffic.
+    """
+    router = LatencyRouter(default_rtf=0.3, cold_start_sec=20)
+    warm = {"whisper:small": {"loaded": True}, "gigaam:e2e_rnnt": {"loaded": True}}
+
+    with router.track("whisper:small", audio_sec=None), router.track("whisper:small", audio_sec=None):
+        choice = router.choose(warm)
+        assert choice.key == "gigaam:e2e_rnnt"
+        choice.release()
+
+    cold = {"whisper:small": {"loaded": True}, "gigaam:e2e_rnnt": {"loaded": False, "load_sec": 60}}
+    choice = router.choose(cold)
+    assert choice.key == "whisper:small"
+    choice.release()
+
+    # near-instant transcription of 60 s of audio: measured RTF ~0 beats the default
+    with router.track("gigaam:e2e_rnnt", audio_sec=60):
+        pass
+    assert router.stats()["providers"]["gigaam:e2e_rnnt"]["rtf"] < 0.3
+    assert router.choose(warm).key == "gigaam:e2e_rnnt"
+
+def test_min_share_keeps_slower_provider_in_rotation():
+    """Every candidate gets at least min_share of recent decisions."""
+    router = LatencyRouter(min_share=0.2)
+    with router.track("fast", audio_sec=60):
+        pass
+    candidates = {"fast": {"loaded": True}, "slow": {"loaded": True}}
+
+    def pick():
+        reservation = router.choose(candidates)
+        with router.track(reservation.key, audio_sec=None, reservation=reservation):
+            pass
+        return reservation.key
+
+    picks = [pick() for _ in range(100)]
+
+    assert 0.2 <= picks.count("slow") / len(picks) < 0.5
+    assert router.stats()["providers"]["slow"]["share"] >= 0.2
+
+
+def test_cold_requests_do_not_poison_rtf():
+    """
+    A request that had to load the model is not an RTF sample, and the first
+    warm sample is blended into the default instead of replacing it.
+    """
+    router = LatencyRouter(default_rtf=0.3, alpha=0.2)
+
+    with router.track("whisper:small", audio_sec=1e-3, loaded=False):
+        pass  # elapsed / audio_sec would be huge
+    assert router.stats()["providers"]["whisper:small"]["rtf"] is None
+    assert router.stats()["providers"]["whisper:small"]["served"] == 1
+
+    with router.track("whisper:small", audio_sec=60):
+        pass
+    assert 0.2 < router.stats()["providers"]["whisper:small"]["rtf"] < 0.3
+
+
+def test_burst_is_spread_before_any_request_reaches_the_model():
+    """
+    choose() counts the request as in flight right away, so concurrent requests
+    still decoding their uploads see each other and alternate between providers.
+    """
+    router = LatencyRouter(default_rtf=0.3)
+    warm = {"whisper:small": {"loaded": True}, "gigaam:e2e_rnnt": {"loaded": True}}
+
+    burst = [router.choose(warm) for _ in range(4)]
+
+    assert sorted(r.key for r in burst) == ["gigaam:e2e_rnnt"] * 2 + ["whisper:small"] * 2
+    assert router.stats()["providers"]["whisper:small"]["inflight"] == 2
+
+
+def test_only_requests_that_reach_the_model_count_as_decisions():
+    """
+    A released reservation (cache hit, error) frees its slot and is not a routing
+    decision; track() takes over a reservation without counting the request twice.
+    """
+    router = LatencyRouter()
+    candidates = {"whisper:small": {"loaded": True}}
+
+    cache_hit = router.choose(candidates)
+    cache_hit.release()
+    cache_hit.release()  # idempotent
+
+    used = router.choose(candidates)
+    with router.track("whisper:small", audio_sec=None, reservation=used):
+        assert router.stats()["providers"]["whisper:small"]["inflight"] == 1
+    used.release()  # already taken over by track()
+
+    stats = router.stats()["providers"]["whisper:small"]
+    assert stats["inflight"] == 0
+    assert stats["share"] == 1.0
+    assert len(router._decisions) == 1
+
+
+def test_streaming_time_is_not_an_rtf_sample():
+    """measure=False (SSE waits for the client) updates the served count but not the RTF."""
+    router = LatencyRouter()
+
+    with router.track("whisper:small", audio_sec=1e-3, measure=False):
+        pass
+
+    assert router.stats()["providers"]["whisper:small"]["rtf"] is None
+    assert router.stats()["providers"]["whisper:small"]["served"] == 1
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.services.vad import detect_speech
+
+SAMPLE_RATE = 16000
+
+
+def _tone(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _noise(seconds: float, amplitude: float = 0.001) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.normal(0, amplitude, int(SAMPLE_RATE * seconds)).astype(np.float32)
+
+
+def test_silence_yields_empty_speech_map():
+    """Digital silence and faint noise contain no speech: nothing goes to a provider."""
+    for audio in (np.zeros(SAMPLE_RATE * 5, dtype=np.float32), _noise(5.0)):
+        speech_map = detect_speech(audio, SAMPLE_RATE, backend="energy")
+        assert speech_map.is_empty
+        assert speech_map.removed_ratio == 1.0
+        assert speech_map.compact(audio).size == 0
+
+
+def test_speech_regions_are_compacted_and_timestamps_map_back():
+    """
+    Long silences are cut out, the removed fraction is reported, and times in the
+    compacted audio translate back to the original timeline.
+    """
+    audio = np.concatenate([_noise(3.0), _tone(1.0), _noise(4.0), _tone(1.0), _noise(3.0)])
+    speech_map = detect_speech(audio, SAMPLE_RATE, backend="energy", pad_ms=100, min_silence_ms=500, gap_ms=200)
+
+    assert len(speech_map.spans) == 2
+    compacted = speech_map.compact(audio)
+    assert abs(compacted.size / SAMPLE_RATE - 2.6) < 0.2  # 2 x (1 s + 2 x 100 ms pad) + 200 ms gap
+    assert 0.75 < speech_map.removed_ratio < 0.85
+
+    second_start = speech_map.spans[1][0] / SAMPLE_RATE
+    assert abs(second_start - 7.9) < 0.1
+    # start of the second region in the compacted audio: first region + gap
+    offset = (speech_map.spans[0][1] - speech_map.spans[0][0] + int(0.2 * SAMPLE_RATE)) / SAMPLE_RATE
+    assert abs(speech_map.to_original(offset + 0.5) - (second_start + 0.5)) < 1e-3
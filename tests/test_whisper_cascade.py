@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from app.core import config
+from app.services.stt_provider import TranscriptionResult
+from app.services.whisper_cascade import WhisperCascadeProvider
+
+SAMPLE_RATE = config.AUDIO_SAMPLE_RATE
+
+
+def seg(start, end, text="слово", avg_logprob=-0.1, no_speech_prob=0.0, compression_ratio=1.5):
+    return SimpleNamespace(
+        start=start,
+        end=end,
+        text=text,
+        avg_logprob=avg_logprob,
+        no_speech_prob=no_speech_prob,
+        compression_ratio=compression_ratio,
+    )
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    for name, value in {
+        "WHISPER_CASCADE_MIN_LOGPROB": "-0.5",
+        "WHISPER_CASCADE_MAX_NO_SPEECH": "0.5",
+        "WHISPER_CASCADE_MAX_COMPRESSION": "2.2",
+        "WHISPER_CASCADE_MERGE_GAP_SEC": "1.0",
+        "WHISPER_CASCADE_MAX_REGION_SEC": "10",
+        "WHISPER_CASCADE_PAD_SEC": "0.2",
+    }.items():
+        monkeypatch.setenv(name, value)
+    return WhisperCascadeProvider()
+
+
+def test_each_threshold_escalates_a_segment(cascade):
+    assert not cascade._needs_escalation(seg(0, 1))
+    assert cascade._needs_escalation(seg(0, 1, avg_logprob=-0.8))
+    assert cascade._needs_escalation(seg(0, 1, compression_ratio=2.6))
+    assert cascade._needs_escalation(seg(0, 1, no_speech_prob=0.7))
+    # the draft thinks it is silence and wrote nothing: nothing to fix
+    assert not cascade._needs_escalation(seg(0, 1, text="  ", no_speech_prob=0.7))
+
+
+def test_uncertain_neighbours_merge_into_regions(cascade):
+    bad = {"avg_logprob": -0.9}
+    regions = cascade._regions([
+        seg(0.0, 2.0, **bad),
+        seg(2.5, 4.0, **bad),    # 0.5s gap -> merged
+        seg(4.0, 6.0),           # confident, skipped
+        seg(6.0, 7.0, **bad),    # 2s after the region ends -> new region
+        seg(7.5, 12.0, **bad),   # region 6..12s fits the 10s limit -> merged
+        seg(12.5, 17.0, **bad),  # 6..17 = 11s > 10s -> new region
+    ])
+
+    assert [(r.start, r.end) for r in regions] == [(0.0, 4.0), (6.0, 12.0), (12.5, 17.0)]
+
+
+class FakeWhisper:
+    def __init__(self, key, segments=None):
+        self.manager_key = key
+        self.segments = segments or []
+        self.cuts = []
+
+    async def transcribe_segments(self, samples, sample_rate, options=None):
+        return self.segments
+
+    async def transcribe_array(self, samples, sample_rate, options=None):
+        self.cuts.append(samples)
+        return TranscriptionResult(language="ru", transcript="точно", provider="fake")
+
+
+def test_regions_are_padded_and_stitched_in_order(cascade, monkeypatch):
+    audio = np.arange(10 * SAMPLE_RATE, dtype=np.float32)
+    draft = FakeWhisper("draft", [
+        seg(0.0, 3.0, text="раз"),
+        seg(3.0, 5.0, text="мусор", avg_logprob=-1.0),
+        seg(5.0, 8.0, text="три"),
+    ])
+    final = FakeWhisper("final")
+    monkeypatch.setattr(cascade, "_draft", lambda: draft)
+    monkeypatch.setattr(cascade, "_final", lambda: final)
+
+    result = asyncio.run(cascade._cascade(audio, None))
+
+    assert result.transcript == "раз точно три"
+    [cut] = final.cuts
+    # the region 3..5s plus 0.2s of context on each side
+    assert cut[0] == int(2.8 * SAMPLE_RATE)
+    assert cut.size == int(5.2 * SAMPLE_RATE) - int(2.8 * SAMPLE_RATE)
+    assert cascade.get_cascade_stats()["escalated_sec"] == pytest.approx(2.0)
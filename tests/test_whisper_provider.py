@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from app.services import whisper_provider
+from app.services.stt_provider import TranscriptionOptions
+from app.services.whisper_provider import WhisperProvider
+
+WORDS = {1: "привет", 2: "мир", 3: "ха"}
+
+
+class FakeTokenizer:
+    sot_sequence = (0,)
+    no_timestamps = 9
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def decode(self, tokens):
+        return "".join(WORDS[t] for t in tokens)
+
+
+def result(tokens, score=-0.1, no_speech_prob=0.0):
+    return SimpleNamespace(sequences_ids=[tokens], scores=[score], no_speech_prob=no_speech_prob)
+
+
+class FakeExtractor:
+    nb_max_frames = 4
+    mel_filters = np.zeros((2, 1))
+
+    def __call__(self, chunk):
+        return np.full((2, 4), chunk[0], dtype=np.float32)
+
+
+class FakeModel:
+    """
+    Chunk i is encoded as a feature matrix filled with i, so generate() knows
+    which chunk it decodes:
+    0 — clean speech; 1 — a repetition loop at t=0, clean at t=0.4; 2 — silence.
+    """
+
+    def __init__(self):
+        self.feature_extractor = FakeExtractor()
+        self.hf_tokenizer = None
+        self.model = SimpleNamespace(is_multilingual=True, generate=self.generate)
+        self.calls = []
+
+    def encode(self, features):
+        return features
+
+    def generate(self, encoder_output, prompts, **kwargs):
+        temperature = kwargs.get("sampling_temperature", 0.0)
+        chunks = [int(features[0, 0]) for features in encoder_output]
+        self.calls.append((chunks, temperature))
+        out = []
+        for chunk in chunks:
+            if chunk == 0:
+                out.append(result([1, 2]))
+            elif chunk == 1:
+                out.append(result([1, 2]) if temperature >= 0.4 else result([3] * 60))
+            else:
+                out.append(result([3], score=-3.0, no_speech_prob=0.9))
+        return out
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(whisper_provider, "Tokenizer", FakeTokenizer)
+    monkeypatch.setattr(whisper_provider, "get_suppressed_tokens", lambda tokenizer, tokens: [])
+    return WhisperProvider()
+
+
+def test_failed_batch_items_are_redecoded_one_by_one_with_temperature(provider):
+    """
+    The batch pass applies the same thresholds as transcribe: a repetitive chunk
+    falls back alone through rising temperatures, silence comes back empty.
+    """
+    model = FakeModel()
+    chunks = [np.full(10, i, dtype=np.float32) for i in range(3)]
+
+    texts = provider._blocking_transcribe_chunks(model, chunks)
+
+    assert texts == ["приветмир", "приветмир", ""]
+    assert model.calls == [([0, 1, 2], 0.0), ([1], 0.2), ([1], 0.4)]
+
+
+def test_explicit_request_options_override_dynamic_batching(provider):
+    provider._dynamic_batching = True
+
+    assert provider._use_dynamic_batching(None)
+    assert provider._use_dynamic_batching(TranscriptionOptions())
+    assert not provider._use_dynamic_batching(TranscriptionOptions(batched=True))
+    assert not provider._use_dynamic_batching(TranscriptionOptions(batched=False))
+    assert not provider._use_dynamic_batching(TranscriptionOptions(batch_size=4))
+
+
+def test_cuda_model_is_budgeted_as_vram_before_its_first_load(monkeypatch):
+    """
+    The device is resolved when the provider is created, so the model manager makes
+    room in the VRAM budget (not RAM) before loading a GPU model.
+    """
+    import torch
+
+    from app.services.model_manager import ModelManager
+
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    manager = ModelManager(ram_budget_mb=1, vram_budget_mb=100_000)
+
+    provider = manager.get("whisper:small", WhisperProvider)
+
+    assert (provider.get_device(), provider._compute_type) == ("cuda", "float16")
+    assert manager._estimate(manager._entries["whisper:small"])[0] == 0.0